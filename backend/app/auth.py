@@ -1,12 +1,17 @@
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional
+from threading import Lock
+from typing import Dict, Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from .database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, make_transient_to_detached
+from .database import get_db, get_async_db, AsyncSessionLocal
 from .models import User, TokenData
+from .passwords import password_hasher
 import os
 
 # Security configuration
@@ -21,18 +26,76 @@ if SECRET_KEY == DEFAULT_SECRET and os.getenv("ENVIRONMENT") == "production":
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/users/login")
-
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify a password against its hash."""
-    return pwd_context.verify(plain_password, hashed_password)
-
-
-def get_password_hash(password: str) -> str:
-    """Hash a password."""
-    return pwd_context.hash(password)
+# For endpoints that also accept the token as a query parameter
+oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="api/users/login", auto_error=False)
+
+# Authenticated-user cache (per process)
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "1024"))
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+
+
+class PrincipalCache:
+    """
+    Bounded TTL/LRU cache of users keyed by token subject (username).
+
+    Stores column snapshots rather than ORM instances so a cached user can
+    be attached to any request's session without a query. Entries are
+    invalidated when this process changes the user; other workers see the
+    change once the TTL expires.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, username: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[username]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(username)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, user: User):
+        if self.max_size <= 0:
+            return
+        values = {column.key: getattr(user, column.key) for column in User.__table__.columns}
+        with self._lock:
+            self._entries[user.username] = (time.monotonic() + self.ttl_seconds, values)
+            self._entries.move_to_end(user.username)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, username: str):
+        with self._lock:
+            self._entries.pop(username, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+principal_cache = PrincipalCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL_SECONDS)
+
+
+def _cached_user(values: Dict) -> User:
+    """Detached User built from a cache snapshot, ready to merge(load=False)."""
+    user = User(**values)
+    make_transient_to_detached(user)
+    return user
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -57,26 +120,17 @@ def get_user_by_email(db: Session, email: str) -> Optional[User]:
     return db.query(User).filter(User.email == email).first()
 
 
-def authenticate_user(db: Session, username: str, password: str) -> Optional[User]:
-    """Authenticate a user."""
-    user = get_user_by_username(db, username)
-    if not user:
-        return None
-    if not verify_password(password, user.hashed_password):
-        return None
-    return user
-
-
-async def get_current_user(
-    token: str = Depends(oauth2_scheme), 
-    db: Session = Depends(get_db)
-) -> User:
-    """Get the current authenticated user from JWT token."""
-    credentials_exception = HTTPException(
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+
+def _username_from_token(token: str) -> str:
+    """Validate a JWT and return its subject, or raise 401."""
+    credentials_exception = _credentials_exception()
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -85,8 +139,85 @@ async def get_current_user(
         token_data = TokenData(username=username)
     except JWTError:
         raise credentials_exception
+    return token_data.username
+
+
+def get_current_user(
+    token: str = Depends(oauth2_scheme), 
+    db: Session = Depends(get_db)
+) -> User:
+    """
+    Get the current authenticated user from JWT token.
     
-    user = get_user_by_username(db, username=token_data.username)
+    A plain def so FastAPI runs the blocking query in its threadpool;
+    async routes use get_current_user_async instead. Users are served
+    from principal_cache when possible and attached to the request's
+    session without a query, so routes can still modify and commit them.
+    """
+    username = _username_from_token(token)
+    
+    cached = principal_cache.get(username)
+    if cached is not None:
+        return db.merge(_cached_user(cached), load=False)
+    
+    user = get_user_by_username(db, username=username)
     if user is None:
-        raise credentials_exception
+        raise _credentials_exception()
+    principal_cache.put(user)
+    return user
+
+
+async def authenticate_user_async(db: AsyncSession, username: str, password: str) -> Optional[User]:
+    """
+    Authenticate a user with bcrypt running in the password hashing pool.
+    Hashes below the current cost are upgraded in place; the caller commits.
+    """
+    user = await db.run_sync(get_user_by_username, username)
+    if not user:
+        return None
+    matches, new_hash = await password_hasher.verify(password, user.hashed_password)
+    if not matches:
+        return None
+    if new_hash:
+        user.hashed_password = new_hash
+    return user
+
+
+async def get_current_user_async(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db)
+) -> User:
+    """Get the current authenticated user, loaded through the async session."""
+    return await _user_for_token_async(db, token)
+
+
+async def get_current_user_stream(
+    token: Optional[str] = Depends(oauth2_scheme_optional),
+    access_token: Optional[str] = Query(
+        None, description="Token for EventSource clients, which cannot send headers"
+    )
+) -> User:
+    """
+    Authenticate a long-lived streaming request. Uses its own short
+    session instead of get_async_db, so the stream does not hold a pooled
+    connection for its lifetime; the returned user is detached.
+    """
+    token = token or access_token
+    if token is None:
+        raise _credentials_exception()
+    async with AsyncSessionLocal() as db:
+        return await _user_for_token_async(db, token)
+
+
+async def _user_for_token_async(db: AsyncSession, token: str) -> User:
+    username = _username_from_token(token)
+    
+    cached = principal_cache.get(username)
+    if cached is not None:
+        return await db.merge(_cached_user(cached), load=False)
+    
+    user = await db.scalar(select(User).where(User.username == username).limit(1))
+    if user is None:
+        raise _credentials_exception()
+    principal_cache.put(user)
     return user
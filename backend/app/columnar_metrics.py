@@ -0,0 +1,251 @@
+"""
+Columnar (NumPy) Sleep Metrics
+
+Vectorised counterpart of compute_sleep_metrics for long sessions and
+bulk recomputation. Takes window data as parallel arrays instead of a
+list of dicts and returns identical SleepMetrics.
+
+Float sums are sequential (np.cumsum) to reproduce the pure-Python
+accumulation order bit for bit. Per-run sums that land close to a
+threshold (1 minute awakenings, 10 minute onset) are re-summed exactly
+from the run start, since a global prefix-sum difference can be off by
+an ulp.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from .sleep_computation import (
+    SleepMetrics, ONSET_THRESHOLD_MINUTES, AWAKENING_MIN_MINUTES,
+    _assemble_metrics, _empty_metrics
+)
+
+
+# uint8 state codes; anything unrecognised maps to STATE_OTHER
+STATE_STILL = 0
+STATE_MOVING = 1
+STATE_AWAKE = 2
+STATE_OUT_OF_BED = 3
+STATE_OTHER = 4
+
+STATE_CODES: Dict[str, int] = {
+    "still": STATE_STILL,
+    "moving": STATE_MOVING,
+    "awake": STATE_AWAKE,
+    "out_of_bed": STATE_OUT_OF_BED
+}
+
+# Display state (index into _DISPLAY_NAMES) for each state code,
+# matching generate_intervals
+_DISPLAY_CODES = np.array([0, 1, 2, 2, 0], dtype=np.uint8)
+_DISPLAY_NAMES = ["sleeping", "moving", "awake"]
+
+# Per-run sums within this distance of a threshold are re-summed exactly
+_THRESHOLD_EPSILON = 1e-6
+
+
+@dataclass
+class WindowColumns:
+    """Window data as parallel arrays, one element per window."""
+    ts_start: np.ndarray  # float64
+    ts_end: np.ndarray  # float64
+    state: np.ndarray  # uint8 state codes
+    movement_energy: np.ndarray  # float64
+
+    def __len__(self) -> int:
+        return len(self.ts_start)
+
+    @classmethod
+    def from_dicts(cls, windows: Sequence[dict]) -> "WindowColumns":
+        """Build columns from the window dicts used by compute_sleep_metrics."""
+        return cls(
+            ts_start=np.array([w["ts_start"] for w in windows], dtype=np.float64),
+            ts_end=np.array([w["ts_end"] for w in windows], dtype=np.float64),
+            state=encode_states([w.get("state", "still") for w in windows]),
+            movement_energy=np.array([w.get("movement_energy", 0) for w in windows], dtype=np.float64)
+        )
+
+
+def encode_states(states: Sequence[str]) -> np.ndarray:
+    """Map state strings to uint8 codes."""
+    return np.fromiter(
+        (STATE_CODES.get(s, STATE_OTHER) for s in states),
+        dtype=np.uint8,
+        count=len(states)
+    )
+
+
+def compute_sleep_metrics_columnar(
+    columns: WindowColumns,
+    session_start_ts: float,
+    session_end_ts: float
+) -> SleepMetrics:
+    """
+    Compute all sleep metrics from columnar window data.
+    Same contract and results as compute_sleep_metrics.
+    """
+    if not len(columns):
+        return _empty_metrics()
+
+    durations = (columns.ts_end - columns.ts_start) / 60.0
+    state = columns.state
+
+    still_minutes = _sequential_sum(durations[state == STATE_STILL])
+    moving_minutes = _sequential_sum(durations[state == STATE_MOVING])
+    awake_minutes = _sequential_sum(durations[state == STATE_AWAKE])
+    out_of_bed_minutes = _sequential_sum(durations[state == STATE_OUT_OF_BED])
+
+    return _assemble_metrics(
+        session_start_ts=session_start_ts,
+        session_end_ts=session_end_ts,
+        still_minutes=still_minutes,
+        moving_minutes=moving_minutes,
+        awake_minutes=awake_minutes,
+        out_of_bed_minutes=out_of_bed_minutes,
+        awakenings_count=count_awakenings(durations, state),
+        sleep_onset_offset=calculate_sleep_onset(columns, durations, session_start_ts),
+        stages=estimate_sleep_stages(columns, durations, still_minutes)
+    )
+
+
+def count_awakenings(durations: np.ndarray, state: np.ndarray) -> int:
+    """Runs of awake/out_of_bed windows lasting >= 1 minute."""
+    starts, ends = _runs((state == STATE_AWAKE) | (state == STATE_OUT_OF_BED))
+    if not len(starts):
+        return 0
+
+    totals = _run_sums(durations, starts, ends)
+    totals = _exact_near(totals, durations, starts, ends, AWAKENING_MIN_MINUTES, _sequential_sum)
+    return int(np.count_nonzero(totals >= AWAKENING_MIN_MINUTES))
+
+
+def calculate_sleep_onset(
+    columns: WindowColumns,
+    durations: np.ndarray,
+    session_start_ts: float
+) -> float:
+    """Offset (minutes) of the first still run reaching 10 minutes, else 0."""
+    starts, ends = _runs(columns.state == STATE_STILL)
+    if not len(starts):
+        return 0.0
+
+    # Onset triggers as soon as the running sum crosses the threshold,
+    # so compare each run's peak prefix sum rather than its total
+    peaks = _run_peaks(durations, starts, ends)
+    peaks = _exact_near(peaks, durations, starts, ends, ONSET_THRESHOLD_MINUTES, _sequential_peak)
+
+    hits = np.flatnonzero(peaks >= ONSET_THRESHOLD_MINUTES)
+    if not len(hits):
+        return 0.0
+
+    return (float(columns.ts_start[starts[hits[0]]]) - session_start_ts) / 60.0
+
+
+def estimate_sleep_stages(
+    columns: WindowColumns,
+    durations: np.ndarray,
+    total_still_minutes: float
+) -> Tuple[float, float, float]:
+    """Deep/REM/core estimates from still-window movement energy."""
+    if total_still_minutes <= 0:
+        return (0.0, 0.0, 0.0)
+
+    still = columns.state == STATE_STILL
+    energies = columns.movement_energy[still]
+    if not len(energies):
+        return (0.0, 0.0, 0.0)
+
+    still_durations = durations[still]
+    avg_energy = _sequential_sum(energies) / len(energies)
+
+    deep = energies < avg_energy * 0.5
+    rem = ~deep & (energies < avg_energy * 1.2)
+    core = ~deep & ~rem
+
+    return (
+        _sequential_sum(still_durations[deep]),
+        _sequential_sum(still_durations[rem]),
+        _sequential_sum(still_durations[core])
+    )
+
+
+def merged_intervals(columns: WindowColumns) -> List[dict]:
+    """
+    Consecutive windows with the same display state merged into
+    intervals. Same output as generate_intervals.
+    """
+    if not len(columns):
+        return []
+
+    order = np.argsort(columns.ts_start, kind="stable")
+    display = _DISPLAY_CODES[columns.state[order]]
+    ts_start = columns.ts_start[order]
+    ts_end = columns.ts_end[order]
+
+    boundaries = np.flatnonzero(display[1:] != display[:-1]) + 1
+    starts = np.concatenate(([0], boundaries))
+    ends = np.concatenate((boundaries, [len(display)])) - 1
+
+    return [
+        {
+            "start": datetime.fromtimestamp(ts_start[s]),
+            "end": datetime.fromtimestamp(ts_end[e]),
+            "state": _DISPLAY_NAMES[display[s]]
+        }
+        for s, e in zip(starts.tolist(), ends.tolist())
+    ]
+
+
+# ============= Run-length helpers =============
+
+def _runs(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Start (inclusive) and end (exclusive) indices of True runs."""
+    padded = np.concatenate(([False], mask, [False])).astype(np.int8)
+    edges = np.diff(padded)
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def _run_sums(values: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Approximate per-run sums from a global prefix sum."""
+    prefix = np.concatenate(([0.0], np.cumsum(values)))
+    return prefix[ends] - prefix[starts]
+
+
+def _run_peaks(values: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Approximate per-run maximum running sum from a global prefix sum."""
+    prefix = np.cumsum(values)
+    base = np.where(starts > 0, prefix[starts - 1], 0.0)
+    # reduceat over interleaved (start, end) pairs; even slots are the runs.
+    # The trailing pad keeps an end index of len(values) in range.
+    bounds = np.column_stack((starts, ends)).ravel()
+    peaks = np.maximum.reduceat(np.append(prefix, 0.0), bounds)[::2]
+    return peaks - base
+
+
+def _exact_near(
+    approx: np.ndarray,
+    values: np.ndarray,
+    starts: np.ndarray,
+    ends: np.ndarray,
+    threshold: float,
+    exact: Callable[[np.ndarray], float]
+) -> np.ndarray:
+    """Recompute runs whose approximate value is within epsilon of threshold."""
+    near = np.flatnonzero(np.abs(approx - threshold) < _THRESHOLD_EPSILON)
+    for i in near:
+        approx[i] = exact(values[starts[i]:ends[i]])
+    return approx
+
+
+def _sequential_sum(values: np.ndarray) -> float:
+    """Left-to-right float sum, matching a Python += loop from 0.0."""
+    if not len(values):
+        return 0.0
+    return float(np.cumsum(values)[-1])
+
+
+def _sequential_peak(values: np.ndarray) -> float:
+    """Largest running sum of a run, accumulated left to right."""
+    return float(np.max(np.cumsum(values)))
@@ -0,0 +1,476 @@
+"""
+Window Compaction
+
+Packs each finished session's sleep_windows rows into a single columnar
+blob (sleep_window_blobs) and deletes the rows, so the windows table and
+its indexes only hold recent nights instead of growing without bound.
+
+Readers decode blobs transparently: load_session_windows (accumulator
+rebuilds), the recompute job and the interval fallback all go through
+load_window_rows / load_window_columns here, which merge a session's
+blob with any rows still in the table (blob wins on a repeated
+ts_start), and read archived sessions' blobs from disk (see
+retention.py). Compaction builds the session's interval timeline first
+if it has none, so summaries never need the windows.
+
+Blob layout (little-endian), zlib-compressed after the header when the
+compressed flag is set:
+
+    header   magic "SWBL" | u8 version | u8 flags | u32 window count n
+    body     u8 state count | per state: u8 length | name (utf-8)
+             i64[n] ts_start, as float64 bit patterns, delta-encoded
+             i64[n] ts_end - ts_start, as float64 bit patterns
+             f32[n] avg_distance | f32[n] movement_energy | f32[n] active_ratio
+             u8[n] state (index into the state names)
+             u32[n] sample_count
+
+Timestamps round-trip exactly; the three sensor metrics are stored as
+float32 (about 7 significant digits).
+
+Sessions are compacted WINDOW_COMPACT_AFTER_HOURS after they end, one
+transaction per session. Windows uploaded for a session after it was
+compacted are stored as rows again and folded into its blob on the next
+run; re-sent windows already in the blob are dropped on ingest. A
+missing archive file is logged and read as no compacted windows.
+Re-running is safe.
+
+Usage (from the backend directory), e.g. hourly from cron:
+    python -m app.compaction                  # compact eligible sessions
+    python -m app.compaction --dry-run        # count eligible sessions only
+    python -m app.compaction --stats          # storage used by windows and blobs
+"""
+import argparse
+import logging
+import os
+import struct
+import zlib
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import exists, func, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from .columnar_metrics import STATE_CODES, STATE_OTHER, WindowColumns
+from .database import SessionLocal, init_db
+from .models import SleepSession, SleepSessionTimeline, SleepWindow, SleepWindowBlob, SleepWindowRetention
+from .timeline import rebuild_timeline
+
+logger = logging.getLogger("compaction")
+
+WINDOW_COMPACT_AFTER_HOURS = float(os.getenv("WINDOW_COMPACT_AFTER_HOURS", "24"))
+# 0 stores blobs uncompressed
+WINDOW_BLOB_ZLIB_LEVEL = int(os.getenv("WINDOW_BLOB_ZLIB_LEVEL", "6"))
+
+DEFAULT_BATCH_SIZE = 100  # Sessions per candidate query
+
+MAGIC = b"SWBL"
+VERSION = 1
+FLAG_ZLIB = 0x01
+
+_HEADER = struct.Struct("<4sBBI")
+_U8 = struct.Struct("<B")
+
+METRIC_COLUMNS = ("avg_distance", "movement_energy", "active_ratio")
+
+WINDOW_COLUMNS = (
+    SleepWindow.ts_start,
+    SleepWindow.ts_end,
+    SleepWindow.avg_distance,
+    SleepWindow.movement_energy,
+    SleepWindow.active_ratio,
+    SleepWindow.state,
+    SleepWindow.sample_count
+)
+
+
+class WindowBlobError(ValueError):
+    """A stored window blob could not be decoded."""
+
+
+# ============= Codec =============
+
+@dataclass
+class CompactedWindows:
+    """A decoded window blob as parallel arrays."""
+    ts_start: np.ndarray  # float64
+    ts_end: np.ndarray  # float64
+    avg_distance: np.ndarray  # float32
+    movement_energy: np.ndarray  # float32
+    active_ratio: np.ndarray  # float32
+    state: np.ndarray  # uint8, index into state_names
+    state_names: List[str]
+    sample_count: np.ndarray  # uint32
+
+    def __len__(self) -> int:
+        return len(self.ts_start)
+
+    def rows(self) -> List[dict]:
+        """Window dicts, in the shape of load_session_windows (plus sample_count)."""
+        names = self.state_names
+        return [
+            {
+                "ts_start": ts_start,
+                "ts_end": ts_end,
+                "avg_distance": avg_distance,
+                "movement_energy": movement_energy,
+                "active_ratio": active_ratio,
+                "state": names[state],
+                "sample_count": sample_count
+            }
+            for ts_start, ts_end, avg_distance, movement_energy, active_ratio, state, sample_count in zip(
+                self.ts_start.tolist(), self.ts_end.tolist(), self.avg_distance.tolist(),
+                self.movement_energy.tolist(), self.active_ratio.tolist(), self.state.tolist(),
+                self.sample_count.tolist()
+            )
+        ]
+
+    def columns(self) -> WindowColumns:
+        """Columns for the columnar metrics engine."""
+        codes = np.array([STATE_CODES.get(name, STATE_OTHER) for name in self.state_names], dtype=np.uint8)
+        return WindowColumns(
+            ts_start=self.ts_start,
+            ts_end=self.ts_end,
+            state=codes[self.state] if len(codes) else self.state,
+            movement_energy=self.movement_energy.astype(np.float64)
+        )
+
+
+def encode_window_blob(rows: Sequence[dict], zlib_level: int = WINDOW_BLOB_ZLIB_LEVEL) -> bytes:
+    """Pack window dicts (ordered by ts_start) into a blob."""
+    n = len(rows)
+    state_names = sorted({r["state"] for r in rows})
+    if len(state_names) > 255:
+        raise ValueError("Too many distinct states in one session")
+    state_index = {name: i for i, name in enumerate(state_names)}
+
+    start_bits = np.array([r["ts_start"] for r in rows], dtype=np.float64).view(np.int64)
+    end_bits = np.array([r["ts_end"] for r in rows], dtype=np.float64).view(np.int64)
+
+    parts = [_U8.pack(len(state_names))]
+    for name in state_names:
+        encoded = name.encode("utf-8")
+        parts.append(_U8.pack(len(encoded)) + encoded)
+
+    parts.append(np.diff(start_bits, prepend=np.int64(0)).astype("<i8").tobytes())
+    parts.append((end_bits - start_bits).astype("<i8").tobytes())
+    for name in METRIC_COLUMNS:
+        parts.append(np.array([r[name] for r in rows], dtype="<f4").tobytes())
+    parts.append(np.array([state_index[r["state"]] for r in rows], dtype=np.uint8).tobytes())
+    parts.append(np.array([r.get("sample_count") or 0 for r in rows], dtype="<u4").tobytes())
+
+    body = b"".join(parts)
+    flags = 0
+    if zlib_level:
+        body = zlib.compress(body, zlib_level)
+        flags |= FLAG_ZLIB
+    return _HEADER.pack(MAGIC, VERSION, flags, n) + body
+
+
+def decode_window_blob(data: bytes) -> CompactedWindows:
+    if len(data) < _HEADER.size:
+        raise WindowBlobError("Truncated window blob header")
+    magic, version, flags, n = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise WindowBlobError(f"Unsupported window blob (magic {magic!r}, version {version})")
+
+    try:
+        body = data[_HEADER.size:]
+        if flags & FLAG_ZLIB:
+            body = zlib.decompress(body)
+
+        (state_count,) = _U8.unpack_from(body, 0)
+        pos = _U8.size
+        state_names = []
+        for _ in range(state_count):
+            (length,) = _U8.unpack_from(body, pos)
+            pos += _U8.size
+            state_names.append(body[pos:pos + length].decode("utf-8"))
+            pos += length
+
+        def column(dtype: str) -> np.ndarray:
+            nonlocal pos
+            values = np.frombuffer(body, dtype=dtype, count=n, offset=pos)
+            pos += values.nbytes
+            return values
+
+        start_bits = np.cumsum(column("<i8"))
+        end_bits = start_bits + column("<i8")
+        metrics = [column("<f4") for _ in METRIC_COLUMNS]
+        state = column("u1")
+        sample_count = column("<u4")
+    except (struct.error, zlib.error, ValueError) as e:
+        raise WindowBlobError(f"Corrupt window blob: {e}") from e
+
+    if pos != len(body):
+        raise WindowBlobError("Trailing bytes after window blob")
+    if len(state) and int(state.max()) >= len(state_names):
+        raise WindowBlobError("Window state out of range")
+
+    return CompactedWindows(
+        ts_start=start_bits.view(np.float64),
+        ts_end=end_bits.view(np.float64),
+        avg_distance=metrics[0],
+        movement_energy=metrics[1],
+        active_ratio=metrics[2],
+        state=state,
+        state_names=state_names,
+        sample_count=sample_count
+    )
+
+
+# ============= Readers =============
+
+def merge_window_rows(compacted: List[dict], stored: List[dict]) -> List[dict]:
+    """Blob rows plus table rows in ts_start order; the blob wins on a repeated ts_start."""
+    if not stored:
+        return compacted
+    if not compacted:
+        return stored
+
+    seen = {w["ts_start"] for w in compacted}
+    merged = compacted + [w for w in stored if w["ts_start"] not in seen]
+    merged.sort(key=lambda w: w["ts_start"])
+    return merged
+
+
+def load_blobs(db: Session, session_ids: Sequence[int]) -> Dict[int, CompactedWindows]:
+    """Decoded blobs for the given sessions, read from the archive for archived ones."""
+    if not session_ids:
+        return {}
+
+    rows = db.query(SleepWindowBlob.session_id, SleepWindowBlob.data).filter(
+        SleepWindowBlob.session_id.in_(session_ids)
+    ).all()
+    blobs = {session_id: decode_window_blob(data) for session_id, data in rows}
+
+    missing = [session_id for session_id in session_ids if session_id not in blobs]
+    if missing:
+        archived = db.query(SleepWindowRetention.session_id, SleepWindowRetention.archive_path).filter(
+            SleepWindowRetention.session_id.in_(missing),
+            SleepWindowRetention.archive_path.isnot(None)
+        ).all()
+        for session_id, path in archived:
+            try:
+                with open(path, "rb") as f:
+                    blobs[session_id] = decode_window_blob(f.read())
+            except FileNotFoundError:
+                # Read as if the session had no compacted windows
+                logger.warning(f"Window archive for session {session_id} is missing: {path}")
+    return blobs
+
+
+def load_window_rows(db: Session, session_id: int) -> List[dict]:
+    """All of a session's windows as dicts ordered by ts_start, compacted or not."""
+    stored = [
+        dict(r._mapping)
+        for r in db.query(*WINDOW_COLUMNS).filter(
+            SleepWindow.session_id == session_id
+        ).order_by(SleepWindow.ts_start)
+    ]
+
+    blob = load_blobs(db, [session_id]).get(session_id)
+    if blob is None:
+        return stored
+    return merge_window_rows(blob.rows(), stored)
+
+
+def load_window_columns(db: Session, session_ids: Sequence[int]) -> Dict[int, WindowColumns]:
+    """
+    Columns for the columnar engine, for every session with windows.
+    Two queries for the whole set: the table rows and the blobs.
+    """
+    stored: Dict[int, List[dict]] = {}
+    rows = db.query(SleepWindow.session_id, *WINDOW_COLUMNS).filter(
+        SleepWindow.session_id.in_(session_ids)
+    ).order_by(SleepWindow.session_id, SleepWindow.ts_start).yield_per(10_000)
+    for row in rows:
+        window = dict(row._mapping)
+        stored.setdefault(window.pop("session_id"), []).append(window)
+
+    columns = {}
+    for session_id, blob in load_blobs(db, session_ids).items():
+        extra = stored.pop(session_id, None)
+        if extra:
+            columns[session_id] = WindowColumns.from_dicts(merge_window_rows(blob.rows(), extra))
+        elif len(blob):
+            columns[session_id] = blob.columns()
+
+    for session_id, windows in stored.items():
+        columns[session_id] = WindowColumns.from_dicts(windows)
+    return columns
+
+
+# ============= Compaction job =============
+
+def compaction_candidates(db: Session, cutoff: datetime, after_id: int, limit: int) -> List[int]:
+    """Sessions that ended before cutoff and still have window rows, in id order."""
+    rows = db.query(SleepSession.id).filter(
+        SleepSession.id > after_id,
+        SleepSession.end_time.isnot(None),
+        SleepSession.end_time < cutoff,
+        exists().where(SleepWindow.session_id == SleepSession.id)
+    ).order_by(SleepSession.id).limit(limit).all()
+    return [session_id for (session_id,) in rows]
+
+
+def read_session_windows(db: Session, session_id: int) -> Tuple[List[int], List[dict], Optional[SleepWindowBlob]]:
+    """
+    A session's window rows (ids and dicts) and its blob, with the
+    windows of both merged in ts_start order.
+    """
+    stored = db.query(SleepWindow.id, *WINDOW_COLUMNS).filter(
+        SleepWindow.session_id == session_id
+    ).order_by(SleepWindow.ts_start).all()
+
+    row_ids = [r.id for r in stored]
+    windows = [{k: v for k, v in r._mapping.items() if k != "id"} for r in stored]
+
+    blob = db.get(SleepWindowBlob, session_id)
+    if blob is not None:
+        windows = merge_window_rows(decode_window_blob(blob.data).rows(), windows)
+    return row_ids, windows, blob
+
+
+def store_session_windows(
+    db: Session,
+    session_id: int,
+    windows: List[dict],
+    row_ids: List[int],
+    blob: Optional[SleepWindowBlob]
+) -> int:
+    """Write windows as the session's blob and delete the given rows. Returns blob bytes."""
+    data = encode_window_blob(windows)
+    if blob is None:
+        blob = SleepWindowBlob(session_id=session_id)
+        db.add(blob)
+    blob.window_count = len(windows)
+    blob.first_ts = windows[0]["ts_start"]
+    blob.last_ts = windows[-1]["ts_end"]
+    blob.data = data
+    blob.compacted_at = datetime.utcnow()
+
+    # Only rows the caller read: windows arriving meanwhile stay for the next run
+    if row_ids:
+        db.query(SleepWindow).filter(SleepWindow.id.in_(row_ids)).delete(synchronize_session=False)
+    return len(data)
+
+
+def compact_session(db: Session, session_id: int) -> Tuple[int, int]:
+    """
+    Move a session's window rows into its blob, merging any existing
+    blob. Returns (rows removed, blob bytes). The caller commits.
+    """
+    row_ids, windows, blob = read_session_windows(db, session_id)
+    if not row_ids:
+        return 0, 0
+
+    if db.get(SleepSessionTimeline, session_id) is None:
+        rebuild_timeline(db, session_id, windows)
+
+    return len(row_ids), store_session_windows(db, session_id, windows, row_ids, blob)
+
+
+def compact(
+    db: Session,
+    older_than_hours: float = WINDOW_COMPACT_AFTER_HOURS,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    dry_run: bool = False
+) -> dict:
+    """Compact every eligible session, committing after each one."""
+    cutoff = datetime.now() - timedelta(hours=older_than_hours)
+    summary = {"sessions": 0, "windows": 0, "blob_bytes": 0, "failed": 0}
+
+    last_id = 0
+    while True:
+        candidates = compaction_candidates(db, cutoff, last_id, batch_size)
+        if not candidates:
+            break
+        last_id = candidates[-1]
+
+        for session_id in candidates:
+            if dry_run:
+                summary["sessions"] += 1
+                continue
+            try:
+                removed, size = compact_session(db, session_id)
+                db.commit()
+            except Exception as e:
+                # e.g. another run compacted it first; it is retried next time
+                db.rollback()
+                summary["failed"] += 1
+                logger.warning(f"Could not compact session {session_id}: {e}")
+                continue
+            summary["sessions"] += 1
+            summary["windows"] += removed
+            summary["blob_bytes"] += size
+
+    return summary
+
+
+def storage_stats(db: Session) -> dict:
+    """Window storage: rows and blobs, plus on-disk bytes per table where SQLite reports them."""
+    blob_count, blob_windows, blob_bytes = db.query(
+        func.count(SleepWindowBlob.session_id),
+        func.coalesce(func.sum(SleepWindowBlob.window_count), 0),
+        func.coalesce(func.sum(func.length(SleepWindowBlob.data)), 0)
+    ).one()
+
+    stats = {
+        "window_rows": db.query(func.count(SleepWindow.id)).scalar(),
+        "compacted_sessions": blob_count,
+        "compacted_windows": blob_windows,
+        "blob_bytes": blob_bytes,
+        "blob_bytes_per_window": round(blob_bytes / blob_windows, 1) if blob_windows else None
+    }
+
+    if db.get_bind().dialect.name == "sqlite":
+        try:
+            # Pages used by each table and its indexes (needs SQLITE_ENABLE_DBSTAT_VTAB)
+            rows = db.execute(text(
+                "SELECT tbl_name, SUM(pgsize) FROM dbstat JOIN sqlite_master USING (name) "
+                "WHERE tbl_name IN ('sleep_windows', 'sleep_window_blobs') GROUP BY tbl_name"
+            )).all()
+            stats["disk_bytes"] = {table: size for table, size in rows}
+        except OperationalError:
+            pass
+    return stats
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Pack finished sessions' windows into columnar blobs.")
+    parser.add_argument("--older-than-hours", type=float, default=WINDOW_COMPACT_AFTER_HOURS,
+                        help="Only sessions that ended at least this long ago")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Sessions fetched per candidate query")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Count eligible sessions without changing anything")
+    parser.add_argument("--stats", action="store_true",
+                        help="Only report window storage")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(name)s] %(levelname)s: %(message)s")
+    args = _parse_args(argv)
+    init_db()
+
+    db = SessionLocal()
+    try:
+        if not args.stats:
+            summary = compact(db, args.older_than_hours, args.batch_size, args.dry_run)
+            verb = "Would compact" if args.dry_run else "Compacted"
+            logger.info(
+                f"{verb} {summary['sessions']} sessions ({summary['windows']} windows "
+                f"into {summary['blob_bytes']} bytes, {summary['failed']} failed)"
+            )
+        for key, value in storage_stats(db).items():
+            print(f"{key}: {value}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
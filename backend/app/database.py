@@ -1,17 +1,99 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.schema import CreateColumn
+import logging
 import os
 
+logger = logging.getLogger("database")
+
 # Use SQLite for simplicity
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./recharge_royale.db")
 
-engine = create_engine(
-    DATABASE_URL, connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
-)
+# "production" enables WAL and the connection pragmas below on SQLite;
+# "basic" keeps SQLite's defaults (rollback journal, full sync)
+DB_PROFILE = os.getenv("DB_PROFILE", "production")
+
+# Per-process pool; each uvicorn worker gets its own
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# Applied to every new SQLite connection in the production profile
+SQLITE_PRAGMAS = {
+    # Readers no longer block on a writer (and vice versa)
+    "journal_mode": "WAL",
+    # Durable across application crashes; fsync only at checkpoints
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,
+    # Negative = KiB, i.e. 64 MiB page cache per connection
+    "cache_size": -64 * 1024,
+    "temp_store": "MEMORY",
+    # Wait for a lock held by another worker instead of failing immediately
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+}
+
+is_sqlite = DATABASE_URL.startswith("sqlite")
+is_memory = is_sqlite and (DATABASE_URL in ("sqlite://", "sqlite:///:memory:") or "mode=memory" in DATABASE_URL)
+
+
+def _engine_options() -> dict:
+    if is_sqlite:
+        options = {"connect_args": {"check_same_thread": False}}
+        if DB_PROFILE == "production" and not is_memory:
+            options["connect_args"]["timeout"] = SQLITE_PRAGMAS["busy_timeout"] / 1000
+            options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+        return options
+
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        # Drop connections the server closed while idle
+        "pool_pre_ping": True,
+        "pool_recycle": 1800,
+    }
+
+
+def _async_database_url() -> str:
+    """Async driver URL for DATABASE_URL (aiosqlite / asyncpg) unless set explicitly."""
+    explicit = os.getenv("ASYNC_DATABASE_URL")
+    if explicit:
+        return explicit
+
+    url = make_url(DATABASE_URL)
+    backend = url.get_backend_name()
+    if backend == "sqlite":
+        url = url.set(drivername="sqlite+aiosqlite")
+    elif backend == "postgresql":
+        url = url.set(drivername="postgresql+asyncpg")
+    return url.render_as_string(hide_password=False)
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+engine = create_engine(DATABASE_URL, **_engine_options())
+
+# Used by the async routers; shares the pool settings and pragmas
+async_engine = create_async_engine(_async_database_url(), **_engine_options())
+
+if is_sqlite and DB_PROFILE == "production" and not is_memory:
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# expire_on_commit=False: attribute access after commit would otherwise
+# need an implicit (blocking) refresh
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 
@@ -26,8 +108,84 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    """
+    Dependency for getting an async database session.
+
+    Shared sync helpers (ingest, metrics, rollups) run against it with
+    `await db.run_sync(fn, ...)`, which performs their I/O without
+    blocking the event loop.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def _add_missing_columns(conn):
+    """
+    Add model columns an existing table was created without.
+
+    SQLite cannot add a STORED generated column to an existing table, so
+    one is added as VIRTUAL there; it is computed on read, and any index
+    on it stores the values anyway.
+    """
+    inspector = inspect(conn)
+    existing_tables = set(inspector.get_table_names())
+
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = str(CreateColumn(column).compile(dialect=engine.dialect))
+            if is_sqlite and column.computed is not None:
+                ddl = ddl.replace(" STORED", " VIRTUAL")
+            conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {ddl}")
+
+
+def _drop_duplicates(conn, index):
+    """
+    Delete rows that would violate a new unique index, keeping the first
+    (lowest id) row of each key. Rows written before the index existed,
+    e.g. windows re-sent by older RPi clients, can repeat a key.
+    """
+    table = index.table
+    columns = ", ".join(column.name for column in index.columns)
+    result = conn.exec_driver_sql(
+        f"DELETE FROM {table.name} WHERE id NOT IN "
+        f"(SELECT MIN(id) FROM {table.name} GROUP BY {columns})"
+    )
+    if result.rowcount:
+        logger.warning(f"Removed {result.rowcount} duplicate {table.name} rows before creating {index.name}")
+
+
+def _create_missing_indexes(conn):
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            if index.unique and "id" in table.columns:
+                _drop_duplicates(conn, index)
+            index.create(bind=conn)
+
+
 def init_db():
     """
     Initialize the database by creating all tables.
+
+    create_all() skips tables that already exist, so columns and indexes
+    added to an existing table are created separately. Before a unique
+    index is added to an existing table, rows with a duplicate key are
+    removed.
+
+    Everything runs on one connection: SQLite PRAGMAs, which reflection
+    uses, can return stale schema on a connection that did not make the
+    change.
     """
-    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        _add_missing_columns(conn)
+        Base.metadata.create_all(bind=conn)
+        _create_missing_indexes(conn)
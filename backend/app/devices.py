@@ -0,0 +1,277 @@
+"""
+Device Fleet Registry
+
+Heartbeats from every RPi are recorded in a process-wide in-memory table
+instead of being discarded, so device status and fleet health are O(1)
+lookups rather than queries:
+
+- Devices are kept in last-seen order (heartbeats move a device to the
+  end), so stale devices are always at the front and finding them only
+  touches the stale ones.
+- Devices whose upload backlog exceeds DEVICE_BACKLOG_THRESHOLD are
+  tracked in a set as heartbeats arrive.
+- Each user's devices are indexed, so a user's view of their own fleet
+  only touches their devices.
+
+Changed entries are upserted to the devices table in one batch every
+DEVICE_FLUSH_INTERVAL_SECONDS (and on shutdown); databases without
+INSERT ... ON CONFLICT get a row-by-row merge instead. The same sync merges in
+rows other workers wrote, so every process converges on the full fleet
+within one interval. The table is loaded on startup.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from threading import Lock
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal
+from .models import Device, RpiHeartbeat
+
+logger = logging.getLogger("devices")
+
+DEVICE_FLUSH_INTERVAL_SECONDS = float(os.getenv("DEVICE_FLUSH_INTERVAL_SECONDS", "30"))
+# Three missed heartbeats (the RPi sends one every 5 minutes)
+DEVICE_STALE_AFTER_SECONDS = float(os.getenv("DEVICE_STALE_AFTER_SECONDS", "900"))
+DEVICE_BACKLOG_THRESHOLD = int(os.getenv("DEVICE_BACKLOG_THRESHOLD", "100"))
+
+
+@dataclass
+class DeviceStatus:
+    device_id: str
+    user_id: int
+    last_seen: float
+    device_time: Optional[float] = None
+    session_id: Optional[str] = None
+    buffer_size: int = 0
+    is_online: bool = True
+
+    def to_dict(self, now: float) -> dict:
+        status = asdict(self)
+        status["seconds_since_seen"] = round(now - self.last_seen, 1)
+        return status
+
+
+def device_key(heartbeat: RpiHeartbeat) -> str:
+    return heartbeat.device_id or f"user-{heartbeat.user_id}"
+
+
+# Dialects with INSERT ... ON CONFLICT DO UPDATE
+_UPSERT_INSERTS = {
+    "sqlite": sqlite.insert,
+    "postgresql": postgresql.insert
+}
+
+
+def _upsert(dialect: str):
+    """Build an INSERT ... ON CONFLICT DO UPDATE for the given dialect."""
+    table = Device.__table__
+    stmt = _UPSERT_INSERTS[dialect](table)
+
+    updated = {c.name: stmt.excluded[c.name] for c in table.columns if c.name != "device_id"}
+    # Never overwrite a newer heartbeat another worker already flushed
+    return stmt.on_conflict_do_update(
+        index_elements=["device_id"],
+        set_=updated,
+        where=table.c.last_seen < stmt.excluded.last_seen
+    )
+
+
+def _write_devices(db: Session, rows: List[dict]):
+    """Upsert device rows, keeping whichever heartbeat is newer."""
+    dialect = db.get_bind().dialect.name
+    if dialect in _UPSERT_INSERTS:
+        db.execute(_upsert(dialect), rows)
+        return
+
+    # Row-by-row merge where ON CONFLICT is not available
+    for row in rows:
+        existing = db.get(Device, row["device_id"])
+        if existing is None:
+            db.add(Device(**row))
+        elif existing.last_seen < row["last_seen"]:
+            for name, value in row.items():
+                setattr(existing, name, value)
+
+
+class DeviceRegistry:
+    """In-memory device table with batched write-behind to the database."""
+
+    def __init__(self, backlog_threshold: int = DEVICE_BACKLOG_THRESHOLD):
+        self.backlog_threshold = backlog_threshold
+        self._devices: "OrderedDict[str, DeviceStatus]" = OrderedDict()
+        self._backlogged: Set[str] = set()
+        self._by_user: Dict[int, Set[str]] = {}
+        self._dirty: Set[str] = set()
+        self._lock = Lock()
+        self._synced_until = 0.0
+        self.flushes = 0
+
+    def __len__(self) -> int:
+        return len(self._devices)
+
+    def _place(self, status: DeviceStatus):
+        """Insert or replace an entry, keeping last-seen order, the backlog set and the user index."""
+        previous = self._devices.get(status.device_id)
+        if previous is not None and previous.user_id != status.user_id:
+            self._by_user[previous.user_id].discard(status.device_id)
+        self._by_user.setdefault(status.user_id, set()).add(status.device_id)
+        self._devices[status.device_id] = status
+        self._devices.move_to_end(status.device_id)
+        if status.buffer_size > self.backlog_threshold:
+            self._backlogged.add(status.device_id)
+        else:
+            self._backlogged.discard(status.device_id)
+
+    def record_heartbeat(self, heartbeat: RpiHeartbeat, now: Optional[float] = None) -> DeviceStatus:
+        status = DeviceStatus(
+            device_id=device_key(heartbeat),
+            user_id=heartbeat.user_id,
+            last_seen=time.time() if now is None else now,
+            device_time=heartbeat.timestamp,
+            session_id=heartbeat.session_id,
+            buffer_size=heartbeat.buffer_size,
+            is_online=heartbeat.is_online
+        )
+        with self._lock:
+            self._place(status)
+            self._dirty.add(status.device_id)
+        return status
+
+    def get(self, device_id: str) -> Optional[DeviceStatus]:
+        return self._devices.get(device_id)
+
+    def fleet_status(
+        self,
+        stale_after: float = DEVICE_STALE_AFTER_SECONDS,
+        now: Optional[float] = None,
+        user_id: Optional[int] = None
+    ) -> dict:
+        """
+        Stale and backlogged devices, of one user's devices if user_id is
+        given. Cost is proportional to the stale and backlogged devices,
+        or to the user's devices.
+        """
+        now = time.time() if now is None else now
+        cutoff = now - stale_after
+        with self._lock:
+            if user_id is None:
+                stale = []
+                for status in self._devices.values():
+                    if status.last_seen >= cutoff:
+                        break
+                    stale.append(status)
+                backlogged = [self._devices[device_id] for device_id in self._backlogged]
+                total = len(self._devices)
+            else:
+                owned = [self._devices[device_id] for device_id in self._by_user.get(user_id, ())]
+                stale = sorted((s for s in owned if s.last_seen < cutoff), key=lambda s: s.last_seen)
+                backlogged = [s for s in owned if s.device_id in self._backlogged]
+                total = len(owned)
+            backlogged.sort(key=lambda s: -s.buffer_size)
+
+        return {
+            "devices": total,
+            "healthy": total - len(stale),
+            "stale_after_seconds": stale_after,
+            "backlog_threshold": self.backlog_threshold,
+            "stale": [s.to_dict(now) for s in stale],
+            "backlogged": [s.to_dict(now) for s in backlogged]
+        }
+
+    def load(self, db: Session):
+        """Replace the in-memory table with the database's."""
+        rows = db.query(Device).order_by(Device.last_seen).all()
+        with self._lock:
+            self._devices.clear()
+            self._backlogged.clear()
+            self._by_user.clear()
+            for row in rows:
+                self._place(self._from_row(row))
+            self._synced_until = rows[-1].last_seen if rows else 0.0
+
+    @staticmethod
+    def _from_row(row: Device) -> DeviceStatus:
+        return DeviceStatus(
+            device_id=row.device_id,
+            user_id=row.user_id,
+            last_seen=row.last_seen,
+            device_time=row.device_time,
+            session_id=row.session_id,
+            buffer_size=row.buffer_size,
+            is_online=row.is_online
+        )
+
+    def sync(self, db: Session) -> int:
+        """
+        Upsert changed devices in one statement, then merge rows other
+        workers flushed since the last sync. Returns devices written.
+        """
+        with self._lock:
+            dirty = [asdict(self._devices[device_id]) for device_id in self._dirty]
+            self._dirty.clear()
+
+        try:
+            if dirty:
+                _write_devices(db, dirty)
+            since = self._synced_until - DEVICE_FLUSH_INTERVAL_SECONDS
+            newer = db.query(Device).filter(Device.last_seen > since).order_by(Device.last_seen).all()
+            db.commit()
+        except Exception:
+            db.rollback()
+            with self._lock:
+                # Retry on the next sync
+                self._dirty.update(d["device_id"] for d in dirty if d["device_id"] in self._devices)
+            raise
+
+        with self._lock:
+            merged = False
+            for row in newer:
+                current = self._devices.get(row.device_id)
+                if current is None or row.last_seen > current.last_seen:
+                    self._place(self._from_row(row))
+                    merged = True
+            if newer:
+                self._synced_until = max(self._synced_until, newer[-1].last_seen)
+            if merged:
+                # Other workers' rows can be older than local heartbeats
+                self._devices = OrderedDict(sorted(self._devices.items(), key=lambda kv: kv[1].last_seen))
+        self.flushes += 1
+        return len(dirty)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "devices": len(self._devices),
+                "backlogged": len(self._backlogged),
+                "pending_flush": len(self._dirty),
+                "flushes": self.flushes
+            }
+
+
+def sync_now():
+    db = SessionLocal()
+    try:
+        return devices.sync(db)
+    finally:
+        db.close()
+
+
+async def run_flush_loop():
+    """Background task: sync the registry every DEVICE_FLUSH_INTERVAL_SECONDS."""
+    while True:
+        await asyncio.sleep(DEVICE_FLUSH_INTERVAL_SECONDS)
+        try:
+            await asyncio.to_thread(sync_now)
+        except Exception as e:
+            logger.exception(f"Device registry flush failed: {e}")
+
+
+# Singleton instance
+devices = DeviceRegistry()
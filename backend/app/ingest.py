@@ -0,0 +1,206 @@
+"""
+Bulk Window Ingestion
+
+Set-based write path for RPi window batches:
+- One query resolves every session UUID in the batch
+- One multi-row INSERT writes all windows
+- Duplicates (same session + ts_start) are dropped by the database's
+  unique index via ON CONFLICT DO NOTHING instead of per-row lookups;
+  databases without it look up the batch's existing windows in one query
+- Windows for sessions past the retention job's full-resolution tier
+  are dropped as duplicates, as are windows already packed into a
+  compacted session's blob (see compaction.py)
+"""
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Sequence, Set, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from .compaction import load_blobs
+from .models import SleepSession, SleepWindow, SleepWindowBlob, SleepWindowRetention
+
+
+WINDOW_CONFLICT_COLUMNS = ["session_id", "ts_start"]
+# Columns of each inserted window reported back to the caller
+INSERTED_COLUMNS = ["session_id", "ts_start", "ts_end", "movement_energy", "state"]
+
+# Dialects with INSERT ... ON CONFLICT DO NOTHING
+_CONFLICT_INSERTS = {
+    "sqlite": sqlite.insert,
+    "postgresql": postgresql.insert
+}
+
+
+@dataclass
+class SessionIngestResult:
+    """Per-session outcome of a bulk ingest."""
+    session_id: int
+    inserted: int = 0
+    duplicates: int = 0
+
+
+@dataclass
+class IngestResult:
+    """Outcome of a bulk ingest across all sessions in a batch."""
+    sessions: Dict[str, SessionIngestResult] = field(default_factory=dict)
+    unknown_sessions: List[str] = field(default_factory=list)
+    # Rows actually written (duplicates excluded), as returned by the insert
+    inserted_rows: List[dict] = field(default_factory=list)
+
+    @property
+    def total_inserted(self) -> int:
+        return sum(s.inserted for s in self.sessions.values())
+
+    def to_dict(self) -> dict:
+        return {
+            uuid: {"inserted": s.inserted, "duplicates": s.duplicates}
+            for uuid, s in self.sessions.items()
+        }
+
+    def merge(self, other: "IngestResult"):
+        """Fold another batch's counts into this one (inserted_rows are not kept)."""
+        for uuid, s in other.sessions.items():
+            total = self.sessions.setdefault(uuid, SessionIngestResult(session_id=s.session_id))
+            total.inserted += s.inserted
+            total.duplicates += s.duplicates
+        for uuid in other.unknown_sessions:
+            if uuid not in self.unknown_sessions:
+                self.unknown_sessions.append(uuid)
+
+
+def _insert_ignore_duplicates(dialect: str):
+    """Build an INSERT ... ON CONFLICT DO NOTHING for the given dialect."""
+    table = SleepWindow.__table__
+    return _CONFLICT_INSERTS[dialect](table).on_conflict_do_nothing(
+        index_elements=WINDOW_CONFLICT_COLUMNS
+    ).returning(*(table.c[name] for name in INSERTED_COLUMNS))
+
+
+def _insert_new_windows(db: Session, rows: List[dict]) -> List[dict]:
+    """Insert the rows that are not duplicates; returns the inserted ones' INSERTED_COLUMNS."""
+    dialect = db.get_bind().dialect.name
+    if dialect in _CONFLICT_INSERTS:
+        returned = db.execute(_insert_ignore_duplicates(dialect), rows).mappings().all()
+        return [dict(r) for r in returned]
+
+    # Without ON CONFLICT: one lookup of the batch's existing windows
+    seen = set(db.query(SleepWindow.session_id, SleepWindow.ts_start).filter(
+        SleepWindow.session_id.in_({row["session_id"] for row in rows}),
+        SleepWindow.ts_start.in_({row["ts_start"] for row in rows})
+    ).all())
+    new_rows = []
+    for row in rows:
+        key = (row["session_id"], row["ts_start"])
+        if key not in seen:
+            seen.add(key)
+            new_rows.append(row)
+    if new_rows:
+        db.execute(insert(SleepWindow), new_rows)
+    return [{name: row[name] for name in INSERTED_COLUMNS} for row in new_rows]
+
+
+def resolve_sessions(
+    db: Session,
+    session_uuids: Sequence[str]
+) -> Tuple[Dict[str, int], Set[int], Set[int]]:
+    """
+    Map session UUIDs to primary keys with a single query. Also returns
+    the sessions whose windows the retention job has already downsampled,
+    and the other sessions with a compacted window blob.
+    """
+    if not session_uuids:
+        return {}, set(), set()
+
+    rows = db.query(
+        SleepSession.session_uuid, SleepSession.id, SleepWindowRetention.session_id, SleepWindowBlob.session_id
+    ).outerjoin(
+        SleepWindowRetention, SleepWindowRetention.session_id == SleepSession.id
+    ).outerjoin(
+        SleepWindowBlob, SleepWindowBlob.session_id == SleepSession.id
+    ).filter(
+        SleepSession.session_uuid.in_(set(session_uuids))
+    ).all()
+    return (
+        {uuid: pk for uuid, pk, _, _ in rows},
+        {pk for _, pk, retired, _ in rows if retired is not None},
+        {pk for _, pk, retired, blob in rows if retired is None and blob is not None}
+    )
+
+
+def ingest_windows(db: Session, windows: Sequence) -> IngestResult:
+    """
+    Insert a batch of RpiWindowData-like objects in one statement.
+
+    Windows for unknown sessions are skipped. The caller owns the
+    transaction and must commit.
+    """
+    groups: Dict[str, List[dict]] = {}
+    for w in windows:
+        groups.setdefault(w.session_id, []).append({
+            "ts_start": w.ts_start,
+            "ts_end": w.ts_end,
+            "avg_distance": w.avg_distance,
+            "movement_energy": w.movement_energy,
+            "active_ratio": w.active_ratio,
+            "state": w.state,
+            "sample_count": w.sample_count
+        })
+    return ingest_window_rows(db, list(groups.items()))
+
+
+def ingest_window_rows(db: Session, groups: Sequence[Tuple[str, List[dict]]]) -> IngestResult:
+    """
+    Insert pre-built window rows, given as (session UUID, rows) groups,
+    in one statement. Used directly by the packed wire format (see
+    wire.py), which decodes into rows without per-window objects.
+
+    Windows for unknown sessions are skipped. The caller owns the
+    transaction and must commit.
+    """
+    result = IngestResult()
+    if not groups:
+        return result
+
+    session_ids, retired, compacted = resolve_sessions(db, [uuid for uuid, _ in groups])
+    # The unique index only covers window rows, not windows already in a blob
+    compacted_starts = {
+        pk: set(blob.ts_start.tolist()) for pk, blob in load_blobs(db, list(compacted)).items()
+    }
+
+    rows = []
+    submitted = Counter()
+    for uuid, group_rows in groups:
+        pk = session_ids.get(uuid)
+        if pk is None:
+            if uuid not in result.unknown_sessions:
+                result.unknown_sessions.append(uuid)
+            continue
+
+        submitted[uuid] += len(group_rows)
+        if pk in retired:
+            # Late re-uploads of long-finished nights; counted as duplicates
+            continue
+        packed = compacted_starts.get(pk, ())
+        for row in group_rows:
+            if row["ts_start"] in packed:
+                continue
+            row["session_id"] = pk
+            rows.append(row)
+
+    inserted = Counter()
+    if rows:
+        result.inserted_rows = _insert_new_windows(db, rows)
+        inserted.update(r["session_id"] for r in result.inserted_rows)
+
+    for uuid, count in submitted.items():
+        pk = session_ids[uuid]
+        result.sessions[uuid] = SessionIngestResult(
+            session_id=pk,
+            inserted=inserted[pk],
+            duplicates=count - inserted[pk]
+        )
+
+    return result
@@ -0,0 +1,233 @@
+"""
+Incremental Sleep Metrics
+
+Persists a SleepAccumulator per session and folds each ingested window
+batch into it, so ending a session does not reload and rescan every
+window, and active sessions can report partial quality and points.
+The session's interval timeline (see timeline.py) is extended in the
+same pass.
+"""
+from collections import defaultdict
+from dataclasses import fields
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, exists, func, or_
+from sqlalchemy.orm import Session
+
+from .models import (
+    SleepSession, SleepSessionAccumulator, SleepSessionResponse, SleepSessionTimeline, SleepWindow,
+    SleepWindowBlob, SleepWindowRetention
+)
+from .columnar_metrics import STATE_STILL
+from .compaction import load_window_columns, load_window_rows
+from .sleep_computation import SleepAccumulator, SleepMetrics
+from .timeline import extend_timeline, rebuild_timeline
+
+
+ACCUMULATOR_FIELDS = [f.name for f in fields(SleepAccumulator)]
+
+
+def _to_accumulator(row: SleepSessionAccumulator) -> SleepAccumulator:
+    return SleepAccumulator(**{name: getattr(row, name) for name in ACCUMULATOR_FIELDS})
+
+
+def _store(acc: SleepAccumulator, row: SleepSessionAccumulator):
+    for name in ACCUMULATOR_FIELDS:
+        setattr(row, name, getattr(acc, name))
+
+
+def load_session_windows(db: Session, session_id: int) -> List[dict]:
+    """Load a session's windows as dicts, ordered by ts_start, including compacted ones."""
+    return load_window_rows(db, session_id)
+
+
+def rebuild_accumulator(
+    db: Session,
+    session_id: int,
+    row: Optional[SleepSessionAccumulator] = None,
+    windows: Optional[List[dict]] = None
+) -> SleepSessionAccumulator:
+    """Recompute a session's accumulator from all of its stored windows."""
+    if windows is None:
+        windows = load_session_windows(db, session_id)
+
+    acc = SleepAccumulator()
+    for w in windows:
+        acc.update(w)
+
+    if row is None:
+        row = SleepSessionAccumulator(session_id=session_id)
+        db.add(row)
+    _store(acc, row)
+    return row
+
+
+def apply_windows(db: Session, windows: Iterable[dict]):
+    """
+    Fold newly inserted windows into their sessions' accumulators and
+    interval timelines.
+
+    Windows that arrive after the session's latest window are applied
+    in place. An out-of-order backfill (or a session without an
+    accumulator or timeline yet) triggers a one-off rebuild from the
+    stored windows, which must already include the new rows.
+    """
+    by_session: Dict[int, List[dict]] = defaultdict(list)
+    for w in windows:
+        by_session[w["session_id"]].append(w)
+
+    if not by_session:
+        return
+
+    existing = {
+        row.session_id: row
+        for row in db.query(SleepSessionAccumulator).filter(
+            SleepSessionAccumulator.session_id.in_(by_session.keys())
+        )
+    }
+    timelines = {
+        row.session_id: row
+        for row in db.query(SleepSessionTimeline).filter(
+            SleepSessionTimeline.session_id.in_(by_session.keys())
+        )
+    }
+
+    for session_id, session_windows in by_session.items():
+        row = existing.get(session_id)
+        timeline = timelines.get(session_id)
+        session_windows.sort(key=lambda w: w["ts_start"])
+
+        if row is not None:
+            acc = _to_accumulator(row)
+            if acc.accepts(session_windows[0]):
+                for w in session_windows:
+                    acc.update(w)
+                _store(acc, row)
+                if timeline is not None:
+                    extend_timeline(timeline, session_windows)
+                    continue
+                # Sessions that were active when timelines were introduced
+                rebuild_timeline(db, session_id, load_session_windows(db, session_id))
+                continue
+
+        stored = load_session_windows(db, session_id)
+        rebuild_accumulator(db, session_id, row, stored)
+        rebuild_timeline(db, session_id, stored, timeline)
+
+
+def estimate_stages(
+    db: Session,
+    session_id: int,
+    acc: SleepAccumulator
+) -> Tuple[float, float, float]:
+    """
+    Movement-based stage estimates as one aggregate over the session's
+    still windows, bucketed by the accumulator's energy thresholds.
+    Compacted or archived sessions are summed over their decoded windows.
+    """
+    if acc.still_minutes <= 0 or not acc.still_window_count:
+        return (0.0, 0.0, 0.0)
+
+    deep_cut, rem_cut = acc.stage_thresholds()
+
+    compacted = db.query(or_(
+        exists().where(SleepWindowBlob.session_id == session_id),
+        exists().where(
+            SleepWindowRetention.session_id == session_id,
+            SleepWindowRetention.archive_path.isnot(None)
+        )
+    )).scalar()
+    if compacted:
+        columns = load_window_columns(db, [session_id]).get(session_id)
+        if columns is None:
+            return (0.0, 0.0, 0.0)
+        still = columns.state == STATE_STILL
+        energies = columns.movement_energy[still]
+        durations = (columns.ts_end - columns.ts_start)[still] / 60.0
+        deep = energies < deep_cut
+        rem = ~deep & (energies < rem_cut)
+        return (float(durations[deep].sum()), float(durations[rem].sum()), float(durations[~deep & ~rem].sum()))
+    stage = case(
+        (SleepWindow.movement_energy < deep_cut, "deep"),
+        (SleepWindow.movement_energy < rem_cut, "rem"),
+        else_="core"
+    )
+
+    rows = db.query(
+        stage,
+        func.sum((SleepWindow.ts_end - SleepWindow.ts_start) / 60.0)
+    ).filter(
+        SleepWindow.session_id == session_id,
+        SleepWindow.state == "still"
+    ).group_by(stage).all()
+
+    minutes = {name: total or 0.0 for name, total in rows}
+    return (minutes.get("deep", 0.0), minutes.get("rem", 0.0), minutes.get("core", 0.0))
+
+
+def finalize_metrics(db: Session, session: SleepSession, end_ts: float) -> SleepMetrics:
+    """Final metrics for a session being ended, from its accumulator."""
+    row = session.accumulator or rebuild_accumulator(db, session.id)
+    acc = _to_accumulator(row)
+
+    return acc.to_metrics(
+        session_start_ts=session.start_time.timestamp(),
+        session_end_ts=end_ts,
+        stages=estimate_stages(db, session.id, acc)
+    )
+
+
+def partial_metrics(session: SleepSession) -> Optional[SleepMetrics]:
+    """
+    Live metrics for an active session, up to its latest window.
+    Stage estimates are omitted until the session ends.
+    """
+    row = session.accumulator
+    if row is None or not row.window_count:
+        return None
+
+    acc = _to_accumulator(row)
+    return acc.to_metrics(
+        session_start_ts=session.start_time.timestamp(),
+        session_end_ts=acc.last_ts_end
+    )
+
+
+def live_session_response(session: SleepSession) -> SleepSessionResponse:
+    """An active session with its metrics replaced by live partial values."""
+    response = SleepSessionResponse.model_validate(session)
+    
+    metrics = partial_metrics(session)
+    if metrics is None:
+        return response
+    
+    return response.model_copy(update={
+        "duration_minutes": metrics.total_minutes,
+        "quality_score": metrics.quality_score,
+        "points_earned": metrics.points_earned,
+        "awakenings_count": metrics.awakenings_count,
+        "restless_minutes": metrics.moving_minutes,
+        "still_minutes": metrics.still_minutes
+    })
+
+
+def session_metric_values(metrics: SleepMetrics, start_time: datetime) -> dict:
+    """SleepSession column values for a set of computed metrics."""
+    onset_time = start_time
+    if metrics.sleep_onset_offset_minutes > 0:
+        onset_time = start_time + timedelta(minutes=metrics.sleep_onset_offset_minutes)
+
+    return {
+        "duration_minutes": metrics.total_minutes,
+        "quality_score": metrics.quality_score,
+        "points_earned": metrics.points_earned,
+        "awakenings_count": metrics.awakenings_count,
+        "restless_minutes": metrics.moving_minutes,
+        "still_minutes": metrics.still_minutes,
+        "out_of_bed_minutes": metrics.out_of_bed_minutes,
+        "deep_estimate_minutes": metrics.deep_estimate_minutes,
+        "rem_estimate_minutes": metrics.rem_estimate_minutes,
+        "core_estimate_minutes": metrics.core_estimate_minutes,
+        "sleep_onset_time": onset_time
+    }
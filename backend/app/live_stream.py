@@ -0,0 +1,187 @@
+"""
+Live Session Event Bus
+
+In-process pub/sub fan-out behind GET /api/sleep/live (Server-Sent
+Events). The RPi ingest paths publish an event per session as windows
+arrive, carrying the new windows, the latest state and the running
+partial metrics, so the frontend no longer polls /api/sleep/current
+and the backend no longer re-queries the session for every poll.
+
+- Subscriptions are per user, so a stream follows the user from one
+  night's session to the next.
+- Events are only built when the session's owner is subscribed; with
+  no listeners, ingest pays one dictionary check per batch.
+- Every event carries the session in the /api/sleep/current shape, with
+  live partial metrics, so clients can replace their copy wholesale.
+- Each subscriber has a bounded queue. A subscriber that falls behind
+  gets a single "resync" marker instead of an unbounded backlog, and
+  the stream answers it with a fresh snapshot.
+- publish() is thread-safe: session start/end run on the threadpool.
+
+Subscribers only see events from the worker they are connected to;
+with several uvicorn workers, pin the stream and the device uploads
+to one worker or accept per-worker fan-out.
+"""
+import asyncio
+import os
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session, selectinload
+
+from .models import SleepSession
+from .live_metrics import live_session_response
+
+LIVE_QUEUE_SIZE = int(os.getenv("LIVE_QUEUE_SIZE", "100"))
+
+RESYNC = {"type": "resync"}
+
+# (user_id, event)
+LiveEvent = Tuple[int, dict]
+
+
+class Subscription:
+    """One SSE connection's queue, bound to the event loop it reads from."""
+
+    def __init__(self, user_id: int, max_size: int):
+        self.user_id = user_id
+        self.queue: "asyncio.Queue[dict]" = asyncio.Queue(max_size)
+        self.loop = asyncio.get_running_loop()
+        self.resyncs = 0
+
+    def _offer(self, event: dict):
+        # Runs on the subscriber's loop
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+            self.resyncs += 1
+
+    async def get(self) -> dict:
+        return await self.queue.get()
+
+
+class LiveSessionBus:
+    def __init__(self, queue_size: int = LIVE_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers: Dict[int, Set[Subscription]] = {}
+        self._lock = Lock()
+        self.published = 0
+
+    def subscribe(self, user_id: int) -> Subscription:
+        """Must be called from the event loop that will read the events."""
+        subscription = Subscription(user_id, self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def is_watched(self, user_id: int) -> bool:
+        return user_id in self._subscribers
+
+    def watched_users(self) -> List[int]:
+        with self._lock:
+            return list(self._subscribers)
+
+    def publish(self, user_id: int, event: dict):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscription in subscribers:
+            subscription.loop.call_soon_threadsafe(subscription._offer, event)
+        self.published += 1
+
+    def publish_all(self, events: Iterable[LiveEvent]):
+        for user_id, event in events:
+            self.publish(user_id, event)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            subscriptions = [s for subs in self._subscribers.values() for s in subs]
+        return {
+            "users": len({s.user_id for s in subscriptions}),
+            "subscriptions": len(subscriptions),
+            "published": self.published,
+            "resyncs": sum(s.resyncs for s in subscriptions)
+        }
+
+
+def snapshot(session: Optional[SleepSession]) -> dict:
+    """Full state of a session, sent when a stream opens or resyncs."""
+    if session is None:
+        return {"type": "snapshot", "session": None}
+    return {
+        "type": "snapshot",
+        "session": live_session_response(session).model_dump(mode="json")
+    }
+
+
+def window_events(db: Session, inserted_rows: List[dict]) -> List[LiveEvent]:
+    """
+    Events for freshly ingested windows, one per session whose owner is
+    subscribed. Costs one query per batch, and none when nobody listens.
+    Call after apply_windows, so partial metrics include the new windows.
+    """
+    watched = live_sessions.watched_users()
+    if not watched or not inserted_rows:
+        return []
+
+    by_session: Dict[int, List[dict]] = {}
+    for row in inserted_rows:
+        by_session.setdefault(row["session_id"], []).append(row)
+
+    sessions = db.query(SleepSession).options(
+        selectinload(SleepSession.accumulator)
+    ).filter(
+        SleepSession.id.in_(by_session.keys()),
+        SleepSession.user_id.in_(watched)
+    ).all()
+
+    events = []
+    for session in sessions:
+        windows = sorted(by_session[session.id], key=lambda w: w["ts_start"])
+        events.append((session.user_id, {
+            "type": "windows",
+            "session_id": session.id,
+            "session_uuid": session.session_uuid,
+            "windows": [
+                {
+                    "ts_start": w["ts_start"],
+                    "ts_end": w["ts_end"],
+                    "state": w["state"],
+                    "movement_energy": w["movement_energy"]
+                }
+                for w in windows
+            ],
+            "state": windows[-1]["state"],
+            # Same shape as the snapshot and /api/sleep/current
+            "session": live_session_response(session).model_dump(mode="json")
+        }))
+    return events
+
+
+def publish_session_event(kind: str, session: SleepSession):
+    """Publish session_start / session_end for a committed session row."""
+    if not live_sessions.is_watched(session.user_id):
+        return
+    live_sessions.publish(session.user_id, {
+        "type": kind,
+        "session_id": session.id,
+        "session_uuid": session.session_uuid,
+        "start_time": session.start_time.isoformat(),
+        "end_time": session.end_time.isoformat() if session.end_time else None,
+        "quality_score": session.quality_score,
+        "points_earned": session.points_earned
+    })
+
+
+# Singleton instance
+live_sessions = LiveSessionBus()
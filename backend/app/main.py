@@ -1,8 +1,17 @@
-from fastapi import FastAPI
+import asyncio
+
+from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from .hardware import sensor_manager, SLEEP_THRESHOLD_CM
 from .models import DistanceResponse
-from .database import init_db
+from .database import init_db, SessionLocal, async_engine
+from .rank_index import leaderboards
+from .devices import devices, run_flush_loop, sync_now as sync_devices
+from .live_stream import live_sessions
+from .middleware import GZipRequestMiddleware
+from .auth import principal_cache
+from .passwords import PasswordServiceBusy, password_hasher
 
 # Import routers
 from .routers import users, sleep, dreams, analytics, leaderboard, rpi
@@ -22,10 +31,43 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Inflate gzip-compressed request bodies (RPi window uploads)
+app.add_middleware(GZipRequestMiddleware)
+
 # Initialize database on startup
 @app.on_event("startup")
 def startup_event():
     init_db()
+    
+    # Build leaderboard rank indexes and load the device registry
+    db = SessionLocal()
+    try:
+        leaderboards.rebuild(db)
+        devices.load(db)
+    finally:
+        db.close()
+
+
+@app.on_event("startup")
+async def start_device_flush():
+    app.state.device_flush = asyncio.create_task(run_flush_loop())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    app.state.device_flush.cancel()
+    await asyncio.to_thread(sync_devices)
+    password_hasher.shutdown()
+    await async_engine.dispose()
+
+
+@app.exception_handler(PasswordServiceBusy)
+async def password_service_busy_handler(request: Request, exc: PasswordServiceBusy):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Too many login requests, please retry shortly"},
+        headers={"Retry-After": "1"}
+    )
 
 # Include routers
 app.include_router(users.router)
@@ -73,5 +115,9 @@ def get_current_distance():
 def health_check():
     return {
         "status": "online",
-        "mode": "MOCK" if sensor_manager.is_mock else "HARDWARE"
+        "mode": "MOCK" if sensor_manager.is_mock else "HARDWARE",
+        "auth_cache": principal_cache.stats(),
+        "password_hasher": password_hasher.stats(),
+        "devices": devices.stats(),
+        "live_sessions": live_sessions.stats()
     }
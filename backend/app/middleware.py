@@ -0,0 +1,132 @@
+"""
+Request Decompression Middleware
+
+Accepts request bodies sent with `Content-Encoding: gzip` (the RPi client
+gzips window batches) and hands routes the decompressed body, so
+endpoints are unaware of compression.
+
+Decompressed size is capped to protect against gzip bombs. Streaming
+uploads (NDJSON, which the endpoint consumes incrementally) are instead
+inflated chunk by chunk as the app reads them, with no total cap.
+"""
+import os
+import zlib
+from typing import Optional
+
+from starlette.responses import PlainTextResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+MAX_DECOMPRESSED_BYTES = int(os.getenv("MAX_DECOMPRESSED_BYTES", str(32 * 1024 * 1024)))
+STREAMING_CONTENT_TYPES = (b"application/x-ndjson",)
+# Largest inflated chunk handed to a streaming app per receive() call
+STREAM_CHUNK_BYTES = 64 * 1024
+
+
+class InvalidGzipBody(ValueError):
+    """A streamed gzip request body turned out to be corrupt mid-stream."""
+
+
+def _without_encoding(headers: list, content_length: Optional[int] = None) -> list:
+    headers = [(k, v) for k, v in headers if k not in (b"content-encoding", b"content-length")]
+    if content_length is not None:
+        headers.append((b"content-length", str(content_length).encode()))
+    return headers
+
+
+class GZipRequestMiddleware:
+    """Pure ASGI middleware that transparently inflates gzip request bodies."""
+
+    def __init__(self, app: ASGIApp, max_size: int = MAX_DECOMPRESSED_BYTES):
+        self.app = app
+        self.max_size = max_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = list(scope["headers"])
+        encoding = next((v for k, v in headers if k == b"content-encoding"), b"").lower()
+        if encoding != b"gzip":
+            await self.app(scope, receive, send)
+            return
+
+        content_type = next((v for k, v in headers if k == b"content-type"), b"")
+        if content_type.split(b";")[0].strip().lower() in STREAMING_CONTENT_TYPES:
+            scope = dict(scope)
+            scope["headers"] = _without_encoding(headers)
+            await self.app(scope, self._inflating_receive(receive), send)
+            return
+
+        # wbits=16+MAX_WBITS: expect a gzip header and trailer
+        inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        chunks = []
+        size = 0
+        more_body = True
+        try:
+            while more_body:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    return
+                more_body = message.get("more_body", False)
+
+                data = inflater.decompress(message.get("body", b""), self.max_size + 1 - size)
+                size += len(data)
+                if size > self.max_size or inflater.unconsumed_tail:
+                    response = PlainTextResponse("Decompressed request body too large", status_code=413)
+                    await response(scope, receive, send)
+                    return
+                chunks.append(data)
+            chunks.append(inflater.flush())
+        except zlib.error:
+            response = PlainTextResponse("Invalid gzip request body", status_code=400)
+            await response(scope, receive, send)
+            return
+
+        body = b"".join(chunks)
+        scope = dict(scope)
+        scope["headers"] = _without_encoding(headers, len(body))
+
+        sent = False
+
+        async def receive_decompressed() -> Message:
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        await self.app(scope, receive_decompressed, send)
+
+    def _inflating_receive(self, receive: Receive) -> Receive:
+        """Wrap receive() to inflate the body lazily, STREAM_CHUNK_BYTES at a time."""
+        inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        pending = b""  # compressed input not yet inflated
+        upstream_done = False
+
+        async def receive_inflated() -> Message:
+            nonlocal pending, upstream_done
+            try:
+                while True:
+                    if pending:
+                        data = inflater.decompress(pending, STREAM_CHUNK_BYTES)
+                        pending = inflater.unconsumed_tail
+                    elif upstream_done:
+                        tail = inflater.flush()
+                        if not inflater.eof:
+                            raise InvalidGzipBody("Truncated gzip request body")
+                        return {"type": "http.request", "body": tail, "more_body": False}
+                    else:
+                        message = await receive()
+                        if message["type"] == "http.disconnect":
+                            return message
+                        upstream_done = not message.get("more_body", False)
+                        pending = message.get("body", b"")
+                        continue
+
+                    if data:
+                        return {"type": "http.request", "body": data, "more_body": True}
+            except zlib.error as e:
+                raise InvalidGzipBody(f"Invalid gzip request body: {e}") from e
+
+        return receive_inflated
@@ -1,7 +1,7 @@
 from pydantic import BaseModel, EmailStr
 from datetime import datetime
 from typing import Optional, List
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Text, Enum as SQLEnum
+from sqlalchemy import Column, Computed, Integer, BigInteger, String, Float, Date, DateTime, ForeignKey, Boolean, Text, LargeBinary, Index, Enum as SQLEnum, text
 from sqlalchemy.orm import relationship
 from .database import Base
 import enum
@@ -35,6 +35,27 @@ class User(Base):
 
 class SleepSession(Base):
     __tablename__ = "sleep_sessions"
+    __table_args__ = (
+        # The user's active session (start/end/current, RPi start, live stream)
+        Index(
+            "ix_sleep_sessions_user_active", "user_id",
+            sqlite_where=text("end_time IS NULL"), postgresql_where=text("end_time IS NULL")
+        ),
+        # Session history and per-user start_time windows (trends, consistency)
+        Index("ix_sleep_sessions_user_start", "user_id", "start_time"),
+        # Latest summary and analytics; scanned backwards for end_time DESC
+        Index(
+            "ix_sleep_sessions_user_completed", "user_id", "end_time",
+            sqlite_where=text("end_time IS NOT NULL"), postgresql_where=text("end_time IS NOT NULL")
+        ),
+        # Daily rollup refresh and rebuild
+        Index("ix_sleep_sessions_user_day", "user_id", "start_day"),
+        # Day view, across all users
+        Index(
+            "ix_sleep_sessions_completed_day", "start_day",
+            sqlite_where=text("end_time IS NOT NULL"), postgresql_where=text("end_time IS NOT NULL")
+        ),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     session_uuid = Column(String, unique=True, index=True, nullable=False)  # From RPi
@@ -43,6 +64,8 @@ class SleepSession(Base):
     # Timestamps
     start_time = Column(DateTime, nullable=False)
     end_time = Column(DateTime, nullable=True)
+    # Day the session belongs to (the day it started), kept by the database
+    start_day = Column(Date, Computed("date(start_time)", persisted=True))
     sleep_onset_time = Column(DateTime, nullable=True)  # First 10min of stillness
     
     # Computed metrics
@@ -67,11 +90,28 @@ class SleepSession(Base):
     # Relationships
     user = relationship("User", back_populates="sleep_sessions")
     windows = relationship("SleepWindow", back_populates="session", cascade="all, delete-orphan")
+    accumulator = relationship(
+        "SleepSessionAccumulator", back_populates="session", uselist=False, cascade="all, delete-orphan"
+    )
+    timeline = relationship(
+        "SleepSessionTimeline", back_populates="session", uselist=False, cascade="all, delete-orphan"
+    )
+    window_blob = relationship(
+        "SleepWindowBlob", back_populates="session", uselist=False, cascade="all, delete-orphan"
+    )
+    window_retention = relationship(
+        "SleepWindowRetention", back_populates="session", uselist=False, cascade="all, delete-orphan"
+    )
 
 
 class SleepWindow(Base):
     """30-second aggregated window from RPi."""
     __tablename__ = "sleep_windows"
+    __table_args__ = (
+        # One window per session start timestamp; bulk ingest relies on this
+        # for ON CONFLICT DO NOTHING de-duplication
+        Index("ix_sleep_windows_session_ts", "session_id", "ts_start", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(Integer, ForeignKey("sleep_sessions.id"), nullable=False)
@@ -88,6 +128,159 @@ class SleepWindow(Base):
     session = relationship("SleepSession", back_populates="windows")
 
 
+class SleepWindowBlob(Base):
+    """
+    A finished session's windows packed column-wise into one blob by the
+    compaction job, replacing its sleep_windows rows. Format in app.compaction.
+    """
+    __tablename__ = "sleep_window_blobs"
+    
+    session_id = Column(Integer, ForeignKey("sleep_sessions.id"), primary_key=True)
+    
+    window_count = Column(Integer, nullable=False)
+    first_ts = Column(Float, nullable=False)  # ts_start of the first window
+    last_ts = Column(Float, nullable=False)  # ts_end of the last window
+    data = Column(LargeBinary, nullable=False)
+    compacted_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Relationship
+    session = relationship("SleepSession", back_populates="window_blob")
+
+
+class SleepWindowRetention(Base):
+    """
+    Retention tier of a session whose windows have left full resolution:
+    downsampled, then archived to disk. Maintained by app.retention.
+    """
+    __tablename__ = "sleep_window_retention"
+    
+    session_id = Column(Integer, ForeignKey("sleep_sessions.id"), primary_key=True)
+    
+    resolution_seconds = Column(Integer, nullable=False)  # Window length after downsampling
+    downsampled_at = Column(DateTime, nullable=False)
+    archive_path = Column(String, nullable=True)  # Archived blob file, once moved out of the database
+    archived_at = Column(DateTime, nullable=True)
+    
+    # Relationship
+    session = relationship("SleepSession", back_populates="window_retention")
+
+
+class SleepSessionAccumulator(Base):
+    """
+    Running metrics for a session, updated as windows arrive.
+    Columns mirror sleep_computation.SleepAccumulator.
+    """
+    __tablename__ = "sleep_session_accumulators"
+    
+    session_id = Column(Integer, ForeignKey("sleep_sessions.id"), primary_key=True)
+    
+    window_count = Column(Integer, nullable=False, default=0)
+    last_ts_start = Column(Float, nullable=True)
+    last_ts_end = Column(Float, nullable=True)
+    
+    still_minutes = Column(Float, nullable=False, default=0)
+    moving_minutes = Column(Float, nullable=False, default=0)
+    awake_minutes = Column(Float, nullable=False, default=0)
+    out_of_bed_minutes = Column(Float, nullable=False, default=0)
+    
+    awakenings_count = Column(Integer, nullable=False, default=0)
+    in_awakening = Column(Boolean, nullable=False, default=False)
+    awakening_minutes = Column(Float, nullable=False, default=0)
+    
+    onset_ts = Column(Float, nullable=True)
+    onset_run_start_ts = Column(Float, nullable=True)
+    onset_run_minutes = Column(Float, nullable=False, default=0)
+    
+    still_energy_sum = Column(Float, nullable=False, default=0)
+    still_window_count = Column(Integer, nullable=False, default=0)
+    
+    # Relationship
+    session = relationship("SleepSession", back_populates="accumulator")
+
+
+class SleepSessionTimeline(Base):
+    """
+    Merged display intervals of a session, run-length packed and
+    extended as windows arrive. Encoding in app.timeline.
+    """
+    __tablename__ = "sleep_session_timelines"
+    
+    session_id = Column(Integer, ForeignKey("sleep_sessions.id"), primary_key=True)
+    
+    # Closed intervals, packed
+    packed = Column(LargeBinary, nullable=False, default=b"")
+    interval_count = Column(Integer, nullable=False, default=0)
+    closed_end_us = Column(BigInteger, nullable=False, default=0)  # End of the last packed interval
+    
+    # Last interval, still growing while windows arrive (microsecond timestamps)
+    open_state = Column(Integer, nullable=True)
+    open_start_us = Column(BigInteger, nullable=True)
+    open_end_us = Column(BigInteger, nullable=True)
+    
+    # Relationship
+    session = relationship("SleepSession", back_populates="timeline")
+
+
+class UserDailyStats(Base):
+    """
+    Per-user daily rollup of completed sessions, keyed by the day a
+    session STARTED. Maintained when sessions are finalised.
+    """
+    __tablename__ = "user_daily_stats"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    
+    session_count = Column(Integer, nullable=False, default=0)
+    total_points = Column(Integer, nullable=False, default=0)
+    total_minutes = Column(Float, nullable=False, default=0)
+    total_awakenings = Column(Integer, nullable=False, default=0)
+    
+    # Average quality is kept as sum/count so days can be combined
+    quality_sum = Column(Float, nullable=False, default=0)
+    quality_count = Column(Integer, nullable=False, default=0)
+    
+    @property
+    def average_quality(self) -> Optional[float]:
+        if not self.quality_count:
+            return None
+        return self.quality_sum / self.quality_count
+
+
+class RankSnapshot(Base):
+    """
+    A user's leaderboard rank and value at the end of a day.
+    Written by the daily snapshot job (app.rank_snapshots).
+    """
+    __tablename__ = "rank_snapshots"
+    
+    leaderboard = Column(String, primary_key=True)  # points, sleep_hours, quality, consistency
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    
+    rank = Column(Integer, nullable=False)
+    value = Column(Float, nullable=False)  # In the leaderboard's units (hours for sleep_hours)
+
+
+class Device(Base):
+    """
+    Last known status of an RPi device, from its heartbeats. Written in
+    batches by the in-memory device registry (app.devices).
+    """
+    __tablename__ = "devices"
+    
+    device_id = Column(String, primary_key=True)
+    # Not a foreign key: heartbeats are recorded without a users lookup, and
+    # one unknown user must not fail a whole batched flush
+    user_id = Column(Integer, index=True, nullable=False)
+    
+    last_seen = Column(Float, index=True, nullable=False)  # Server time (Unix timestamp)
+    device_time = Column(Float, nullable=True)  # Device clock at last heartbeat
+    session_id = Column(String, nullable=True)  # Session UUID in progress, if any
+    buffer_size = Column(Integer, nullable=False, default=0)  # Items waiting to upload
+    is_online = Column(Boolean, nullable=False, default=True)
+
+
 class DreamLog(Base):
     __tablename__ = "dream_logs"
     
@@ -203,6 +396,7 @@ class RpiSessionEnd(BaseModel):
 
 class RpiHeartbeat(BaseModel):
     user_id: int
+    device_id: Optional[str] = None  # Defaults to one device per user
     session_id: Optional[str] = None
     timestamp: float
     is_online: bool = True
@@ -271,6 +465,7 @@ class DaySleepResponse(BaseModel):
     # Comparison
     points_delta_vs_yesterday: int
     current_rank: int
+    rank_change: int = 0  # Positive = moved up, negative = moved down
 
 
 # Dream Log Models
@@ -0,0 +1,167 @@
+"""
+Password Hashing Service
+
+bcrypt is deliberately slow (tens of milliseconds of CPU per hash or
+verify). Run on the request threadpool it holds the GIL and the slots
+that window ingestion and dashboard reads need, so hashing and
+verification run in a small dedicated process pool instead.
+
+At most PASSWORD_HASH_MAX_PENDING operations may be queued or running per
+API worker; beyond that callers get PasswordServiceBusy (served as 503)
+instead of an ever-growing queue, so a burst of logins cannot starve the
+rest of the API.
+
+If a worker process dies (crash, OOM kill) the pool is broken for good;
+it is then discarded and the operation retried once on a new pool. If
+that fails too (e.g. workers cannot start) the failure is logged and
+raised as PasswordServiceUnavailable, a server error rather than busy,
+so clients do not retry a broken service as if it were a load spike.
+
+Hashes created with fewer than BCRYPT_ROUNDS rounds are flagged on
+verify, so the login path can transparently re-hash at the current cost.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+from passlib.context import CryptContext
+
+logger = logging.getLogger("passwords")
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    # Anything weaker than the current cost needs_update()
+    bcrypt__min_rounds=BCRYPT_ROUNDS
+)
+
+
+class PasswordServiceBusy(Exception):
+    """The hashing pool is at its admission limit."""
+
+
+class PasswordServiceUnavailable(Exception):
+    """The hashing pool's worker processes died or could not start, even on a new pool."""
+
+
+# Worker entry points (module level so they can be pickled)
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify_and_update(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return pwd_context.verify_and_update(password, hashed_password)
+
+
+class PasswordHasher:
+    """Bounded process pool for bcrypt work, with queue-depth counters."""
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = Lock()
+        self.pending = 0
+        self.peak_pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.pool_restarts = 0
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: forking a threaded server process is not safe
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    def _discard_pool(self, pool: ProcessPoolExecutor):
+        """Drop a broken pool; the next submit starts a new one."""
+        with self._lock:
+            if self._pool is not pool:
+                # Another caller already replaced it
+                return
+            self._pool = None
+            self.pool_restarts += 1
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _job_done(self, future: Future):
+        with self._lock:
+            self.pending -= 1
+            self.completed += 1
+
+    def _submit(self, fn, *args) -> Tuple[ProcessPoolExecutor, Optional[Future]]:
+        """Admit and submit a job; the future is None if the pool is already broken."""
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise PasswordServiceBusy()
+            pool = self._get_pool()
+            try:
+                future = pool.submit(fn, *args)
+            except BrokenProcessPool:
+                return pool, None
+            self.pending += 1
+            self.peak_pending = max(self.peak_pending, self.pending)
+
+        # Counted until the job finishes, even if the awaiting request is
+        # cancelled: a job already running in the pool is not stopped
+        future.add_done_callback(self._job_done)
+        return pool, future
+
+    async def _run(self, fn, *args):
+        # Retried once on a new pool if a worker process died
+        error: Optional[BrokenProcessPool] = None
+        for _ in range(2):
+            pool, future = self._submit(fn, *args)
+            if future is None:
+                error = BrokenProcessPool("Pool was already broken")
+            else:
+                try:
+                    return await asyncio.wrap_future(future)
+                except BrokenProcessPool as e:
+                    error = e
+            self._discard_pool(pool)
+        logger.error(f"Password hashing pool failed twice, last error: {error}")
+        raise PasswordServiceUnavailable() from error
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """(matches, new_hash); new_hash is set when the stored hash should be upgraded."""
+        return await self._run(_verify_and_update, password, hashed_password)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "pending": self.pending,
+                "peak_pending": self.peak_pending,
+                "max_pending": self.max_pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "pool_restarts": self.pool_restarts
+            }
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+# Singleton instance
+password_hasher = PasswordHasher(PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING)
@@ -0,0 +1,260 @@
+"""
+In-Memory Leaderboard Rank Index
+
+Process-wide order-statistics indexes for the leaderboards, so rank,
+top-N and "users around me" lookups are binary searches over a sorted
+key list instead of a GROUP BY over every user's sessions.
+
+Indexes are built from the database on startup, updated per user when a
+session is finalised, and fully rebuilt after RANK_INDEX_MAX_AGE_SECONDS
+so that processes which did not see an update (other uvicorn workers,
+the recompute CLI) converge.
+"""
+import heapq
+import os
+import time
+from bisect import bisect_left, insort
+from collections import deque
+from datetime import datetime, timedelta
+from threading import Lock, RLock
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal
+from .models import User, SleepSession, UserDailyStats
+
+RANK_INDEX_MAX_AGE_SECONDS = float(os.getenv("RANK_INDEX_MAX_AGE_SECONDS", "300"))
+CONSISTENCY_WINDOW_DAYS = 30
+# Rolling: sessions that started within this long before now
+CONSISTENCY_WINDOW = timedelta(days=CONSISTENCY_WINDOW_DAYS)
+
+
+class RankIndex:
+    """
+    Users ordered by a score, highest first; ties broken by user id.
+    Lookups are O(log n) via bisect on a sorted (-score, user_id) list.
+    """
+
+    def __init__(self):
+        self._keys: List[Tuple[float, int]] = []
+        self._values: Dict[int, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def set(self, user_id: int, value: Optional[float]):
+        """Insert or move a user; None removes them."""
+        self.remove(user_id)
+        if value is None:
+            return
+        self._values[user_id] = value
+        insort(self._keys, (-value, user_id))
+
+    def remove(self, user_id: int):
+        value = self._values.pop(user_id, None)
+        if value is None:
+            return
+        i = bisect_left(self._keys, (-value, user_id))
+        del self._keys[i]
+
+    def value(self, user_id: int) -> Optional[float]:
+        return self._values.get(user_id)
+
+    def rank(self, user_id: int) -> Optional[int]:
+        """1-based rank, or None if the user is not ranked."""
+        value = self._values.get(user_id)
+        if value is None:
+            return None
+        return bisect_left(self._keys, (-value, user_id)) + 1
+
+    def slice(self, start: int, stop: int) -> List[Tuple[int, int, float]]:
+        """(rank, user_id, value) for 0-based positions [start, stop)."""
+        start = max(0, start)
+        return [
+            (position + 1, user_id, -neg_value)
+            for position, (neg_value, user_id) in enumerate(self._keys[start:stop], start=start)
+        ]
+
+    def top(self, n: int) -> List[Tuple[int, int, float]]:
+        return self.slice(0, n)
+
+    def around(self, user_id: int, radius: int) -> List[Tuple[int, int, float]]:
+        """Up to `radius` users either side of user_id, including them."""
+        rank = self.rank(user_id)
+        if rank is None:
+            return []
+        return self.slice(rank - 1 - radius, rank + radius)
+
+
+class WindowedCountIndex(RankIndex):
+    """
+    RankIndex of per-user session counts over a sliding time window.
+    Sessions that fall out of the window are expired lazily on read.
+    """
+
+    def __init__(self, window: timedelta):
+        super().__init__()
+        self.window = window
+        self._starts: Dict[int, Deque[datetime]] = {}
+        # (earliest start, user_id); stale entries are skipped on pop
+        self._expiry: List[Tuple[datetime, int]] = []
+
+    def set_sessions(self, user_id: int, start_times: List[datetime]):
+        """Replace a user's in-window session start times (ascending)."""
+        starts = deque(sorted(start_times))
+        if starts:
+            self._starts[user_id] = starts
+            heapq.heappush(self._expiry, (starts[0], user_id))
+        else:
+            self._starts.pop(user_id, None)
+        self.set(user_id, float(len(starts)) if starts else None)
+
+    def expire(self, now: datetime):
+        cutoff = now - self.window
+        while self._expiry and self._expiry[0][0] < cutoff:
+            earliest, user_id = heapq.heappop(self._expiry)
+            starts = self._starts.get(user_id)
+            if not starts or starts[0] != earliest:
+                continue
+            while starts and starts[0] < cutoff:
+                starts.popleft()
+            self.set_sessions(user_id, list(starts))
+
+
+class LeaderboardIndexes:
+    """The leaderboard rank indexes plus the usernames needed to render them."""
+
+    def __init__(self):
+        self.lock = RLock()
+        # Serialises rebuilds; readers only take `lock`, for the swap
+        self._rebuild_lock = Lock()
+        self.points = RankIndex()
+        self.sleep_minutes = RankIndex()
+        self.quality = RankIndex()
+        self.consistency = WindowedCountIndex(CONSISTENCY_WINDOW)
+        self.usernames: Dict[int, str] = {}
+        self.built_at: Optional[float] = None
+        # Users refreshed while a rebuild runs; None when not rebuilding
+        self._refreshed_during_rebuild: Optional[Set[int]] = None
+
+    def rebuild(self, db: Session):
+        """
+        Rebuild every index from the database. Users refreshed while the
+        build runs are written to the indexes being replaced, so they are
+        refreshed again after the swap.
+        """
+        with self.lock:
+            self._refreshed_during_rebuild = set()
+        try:
+            refreshed = self._build_and_swap(db)
+        finally:
+            with self.lock:
+                self._refreshed_during_rebuild = None
+
+        for user_id in refreshed:
+            self.refresh_user(db, user_id)
+
+    def _build_and_swap(self, db: Session) -> Set[int]:
+        """Swap in freshly built indexes; returns the users refreshed meanwhile."""
+        totals = db.query(
+            UserDailyStats.user_id,
+            func.sum(UserDailyStats.total_points),
+            func.sum(UserDailyStats.total_minutes),
+            func.sum(UserDailyStats.quality_sum),
+            func.sum(UserDailyStats.quality_count)
+        ).group_by(UserDailyStats.user_id).all()
+
+        cutoff = datetime.utcnow() - self.consistency.window
+        recent = db.query(SleepSession.user_id, SleepSession.start_time).filter(
+            SleepSession.start_time >= cutoff,
+            SleepSession.end_time.isnot(None)
+        ).all()
+        recent_by_user: Dict[int, List[datetime]] = {}
+        for user_id, start_time in recent:
+            recent_by_user.setdefault(user_id, []).append(start_time)
+
+        usernames = dict(db.query(User.id, User.username).all())
+
+        # Built outside the lock and swapped in, so readers never wait
+        # for the build itself
+        fresh = LeaderboardIndexes()
+        for user_id, points, minutes, quality_sum, quality_count in totals:
+            fresh._set_totals(user_id, points, minutes, quality_sum, quality_count)
+        for user_id, start_times in recent_by_user.items():
+            fresh.consistency.set_sessions(user_id, start_times)
+
+        with self.lock:
+            self.points = fresh.points
+            self.sleep_minutes = fresh.sleep_minutes
+            self.quality = fresh.quality
+            self.consistency = fresh.consistency
+            self.usernames = usernames
+            self.built_at = time.monotonic()
+            refreshed, self._refreshed_during_rebuild = self._refreshed_during_rebuild, None
+        return refreshed
+
+    def _set_totals(self, user_id, points, minutes, quality_sum, quality_count):
+        self.points.set(user_id, float(points or 0))
+        self.sleep_minutes.set(user_id, float(minutes or 0))
+        # Only sessions with a quality score count towards average quality
+        self.quality.set(user_id, quality_sum / quality_count if quality_count else None)
+
+    def refresh_user(self, db: Session, user_id: int):
+        """Re-read one user's totals after one of their sessions changed."""
+        points, minutes, quality_sum, quality_count = db.query(
+            func.sum(UserDailyStats.total_points),
+            func.sum(UserDailyStats.total_minutes),
+            func.sum(UserDailyStats.quality_sum),
+            func.sum(UserDailyStats.quality_count)
+        ).filter(UserDailyStats.user_id == user_id).one()
+
+        cutoff = datetime.utcnow() - self.consistency.window
+        start_times = [
+            start_time for (start_time,) in db.query(SleepSession.start_time).filter(
+                SleepSession.user_id == user_id,
+                SleepSession.start_time >= cutoff,
+                SleepSession.end_time.isnot(None)
+            )
+        ]
+        username = db.query(User.username).filter(User.id == user_id).scalar()
+
+        with self.lock:
+            if self._refreshed_during_rebuild is not None:
+                self._refreshed_during_rebuild.add(user_id)
+            if username is not None:
+                self.usernames[user_id] = username
+            if points is None:
+                # No completed sessions left
+                self.points.remove(user_id)
+                self.sleep_minutes.remove(user_id)
+                self.quality.remove(user_id)
+            else:
+                self._set_totals(user_id, points, minutes, quality_sum, quality_count)
+            self.consistency.set_sessions(user_id, start_times)
+
+    def _stale(self) -> bool:
+        return self.built_at is None or time.monotonic() - self.built_at > RANK_INDEX_MAX_AGE_SECONDS
+
+    def ensure_fresh(self, db: Optional[Session] = None):
+        """
+        Rebuild if never built or older than RANK_INDEX_MAX_AGE_SECONDS,
+        on a session of its own unless one is given. Blocking: async
+        routes call it through asyncio.to_thread.
+        """
+        if self._stale():
+            with self._rebuild_lock:
+                # Another thread may have rebuilt while this one waited
+                if self._stale():
+                    if db is None:
+                        with SessionLocal() as own_db:
+                            self.rebuild(own_db)
+                    else:
+                        self.rebuild(db)
+        with self.lock:
+            self.consistency.expire(datetime.utcnow())
+
+
+# Singleton instance
+leaderboards = LeaderboardIndexes()
@@ -0,0 +1,220 @@
+"""
+Daily Rank Snapshots
+
+Records every user's rank on each leaderboard as of the end of a day in
+rank_snapshots, so "how far did I move" is a primary-key lookup of two
+snapshot rows instead of re-ranking every user as of a past date.
+
+Snapshots are built from user_daily_stats in a single pass in day order,
+carrying cumulative per-user totals forward, so a backfill over the whole
+history costs one scan of the rollup table. Totals from before the first
+day's consistency window are summed per user in SQL, so a daily run reads
+only that window's rows. Re-running a day replaces its rows, so the job
+is idempotent.
+
+A day's snapshot is the leaderboard as of midnight at its end; the
+consistency window is the live index's rolling CONSISTENCY_WINDOW
+measured back from that instant.
+
+Usage (from the backend directory), e.g. daily from cron after midnight:
+    python -m app.rank_snapshots                 # snapshot yesterday
+    python -m app.rank_snapshots --day 2024-01-31
+    python -m app.rank_snapshots --backfill      # every day with data
+"""
+import argparse
+import logging
+from collections import deque
+from datetime import date, datetime, time, timedelta
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal, init_db
+from .models import RankSnapshot, UserDailyStats
+from .rank_index import CONSISTENCY_WINDOW
+
+logger = logging.getLogger("rank_snapshots")
+
+LEADERBOARDS = ("points", "sleep_hours", "quality", "consistency")
+# Stored values are in the leaderboard's units: sleep_hours is ranked
+# on minutes, like the live index, and stored in hours
+VALUE_DIVISORS = {"sleep_hours": 60.0}
+
+
+def _ranked(values: Dict[int, float]) -> List[Tuple[int, int, float]]:
+    """(rank, user_id, value), ordered like RankIndex: highest first, ties by user id."""
+    ordered = sorted(values.items(), key=lambda item: (-item[1], item[0]))
+    return [(position + 1, user_id, value) for position, (user_id, value) in enumerate(ordered)]
+
+
+def _end_of_day(day: date) -> datetime:
+    return datetime.combine(day + timedelta(days=1), time.min)
+
+
+def snapshot_days(db: Session, first_day: date, last_day: date) -> int:
+    """
+    Write snapshots for every day in [first_day, last_day], replacing any
+    existing ones. Returns the number of rows written; the caller commits.
+    """
+    # First day whose sessions count towards first_day's consistency window
+    window_start = (_end_of_day(first_day) - CONSISTENCY_WINDOW).date()
+
+    carried = db.query(
+        UserDailyStats.user_id,
+        func.sum(UserDailyStats.total_points),
+        func.sum(UserDailyStats.total_minutes),
+        func.sum(UserDailyStats.quality_sum),
+        func.sum(UserDailyStats.quality_count)
+    ).filter(
+        UserDailyStats.day < window_start
+    ).group_by(UserDailyStats.user_id).all()
+
+    rows = db.query(
+        UserDailyStats.user_id,
+        UserDailyStats.day,
+        UserDailyStats.session_count,
+        UserDailyStats.total_points,
+        UserDailyStats.total_minutes,
+        UserDailyStats.quality_sum,
+        UserDailyStats.quality_count
+    ).filter(
+        UserDailyStats.day >= window_start,
+        UserDailyStats.day <= last_day
+    ).order_by(UserDailyStats.day).all()
+
+    db.query(RankSnapshot).filter(
+        RankSnapshot.day >= first_day,
+        RankSnapshot.day <= last_day
+    ).delete(synchronize_session=False)
+
+    points: Dict[int, float] = {}
+    minutes: Dict[int, float] = {}
+    quality_totals: Dict[int, Tuple[float, int]] = {}
+    for user_id, user_points, user_minutes, quality_sum, quality_count in carried:
+        points[user_id] = float(user_points or 0)
+        minutes[user_id] = float(user_minutes or 0)
+        quality_totals[user_id] = (float(quality_sum or 0), int(quality_count or 0))
+    window_counts: Dict[int, float] = {}
+    # (day, user_id, session_count) still inside the consistency window
+    window: Deque[Tuple[date, int, int]] = deque()
+
+    written = 0
+    position = 0
+    day = window_start
+    while day <= last_day:
+        while position < len(rows) and rows[position].day == day:
+            row = rows[position]
+            position += 1
+            points[row.user_id] = points.get(row.user_id, 0.0) + row.total_points
+            minutes[row.user_id] = minutes.get(row.user_id, 0.0) + row.total_minutes
+            quality_sum, quality_count = quality_totals.get(row.user_id, (0.0, 0))
+            quality_totals[row.user_id] = (quality_sum + row.quality_sum, quality_count + row.quality_count)
+            window_counts[row.user_id] = window_counts.get(row.user_id, 0) + row.session_count
+            window.append((day, row.user_id, row.session_count))
+
+        cutoff = _end_of_day(day) - CONSISTENCY_WINDOW
+        while window and datetime.combine(window[0][0], time.min) < cutoff:
+            _, user_id, session_count = window.popleft()
+            window_counts[user_id] -= session_count
+            if not window_counts[user_id]:
+                del window_counts[user_id]
+
+        if day >= first_day:
+            quality = {
+                user_id: quality_sum / quality_count
+                for user_id, (quality_sum, quality_count) in quality_totals.items()
+                if quality_count
+            }
+            snapshots = []
+            for leaderboard, values in (
+                ("points", points),
+                ("sleep_hours", minutes),
+                ("quality", quality),
+                ("consistency", window_counts)
+            ):
+                divisor = VALUE_DIVISORS.get(leaderboard, 1.0)
+                snapshots.extend(
+                    {
+                        "leaderboard": leaderboard, "user_id": user_id, "day": day,
+                        "rank": rank, "value": value / divisor
+                    }
+                    for rank, user_id, value in _ranked(values)
+                )
+            if snapshots:
+                db.bulk_insert_mappings(RankSnapshot, snapshots)
+                written += len(snapshots)
+
+        day += timedelta(days=1)
+
+    return written
+
+
+def rank_changes(
+    db: Session,
+    user_id: int,
+    days: Iterable[date],
+    current_rank: Optional[int] = None,
+    leaderboard: str = "points"
+) -> Dict[date, int]:
+    """
+    Rank movement on each day: rank at the end of the previous day minus
+    rank at the end of the day (positive = moved up). Days not yet
+    snapshotted (today) use current_rank. 0 when either side is unknown.
+    """
+    days = set(days)
+    if not days:
+        return {}
+
+    wanted = days | {day - timedelta(days=1) for day in days}
+    ranks = dict(db.query(RankSnapshot.day, RankSnapshot.rank).filter(
+        RankSnapshot.leaderboard == leaderboard,
+        RankSnapshot.user_id == user_id,
+        RankSnapshot.day.in_(wanted)
+    ).all())
+
+    today = datetime.utcnow().date()
+    changes = {}
+    for day in days:
+        before = ranks.get(day - timedelta(days=1))
+        after = ranks.get(day)
+        if after is None and day >= today:
+            after = current_rank
+        changes[day] = before - after if before is not None and after is not None else 0
+    return changes
+
+
+def _parse_args(argv=None):
+    parse_day = lambda s: datetime.strptime(s, "%Y-%m-%d").date()
+    parser = argparse.ArgumentParser(description="Record daily leaderboard rank snapshots.")
+    parser.add_argument("--day", type=parse_day, default=None,
+                        help="Day to snapshot (YYYY-MM-DD, default: yesterday)")
+    parser.add_argument("--backfill", action="store_true",
+                        help="Snapshot every day from the first recorded day through --day")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(name)s] %(levelname)s: %(message)s")
+    args = _parse_args(argv)
+    init_db()
+
+    last_day = args.day or datetime.utcnow().date() - timedelta(days=1)
+
+    db = SessionLocal()
+    try:
+        first_day = last_day
+        if args.backfill:
+            first_recorded = db.query(UserDailyStats.day).order_by(UserDailyStats.day).limit(1).scalar()
+            first_day = min(first_recorded or last_day, last_day)
+
+        rows = snapshot_days(db, first_day, last_day)
+        db.commit()
+    finally:
+        db.close()
+
+    logger.info(f"Wrote {rows} rank snapshots for {first_day} .. {last_day}")
+
+
+if __name__ == "__main__":
+    main()
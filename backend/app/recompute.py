@@ -0,0 +1,311 @@
+"""
+Offline Bulk Recompute
+
+Rescores every completed RPi sleep session from its stored windows, e.g.
+after _calculate_quality_score or _calculate_points changes. Sessions
+whose windows were downsampled by the retention job keep their scores.
+
+Sessions are streamed in id order in chunks; each chunk's windows (rows
+and compacted blobs) are loaded with two queries, scored in a process
+pool with the columnar engine, and written back with one bulk UPDATE.
+Progress is checkpointed after every chunk so an interrupted run resumes
+where it stopped; a checkpoint is only resumed with the same --since.
+Dry runs report each chunk's changes as it finishes.
+
+Usage (from the backend directory):
+    python -m app.recompute [--since YYYY-MM-DD] [--dry-run] [--workers N] [--reset]
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import exists, update
+from sqlalchemy.orm import Session
+
+from .columnar_metrics import WindowColumns, compute_sleep_metrics_columnar
+from .compaction import load_window_columns
+from .database import SessionLocal
+from .live_metrics import session_metric_values
+from .models import SleepSession, SleepWindowRetention
+from .rollups import refresh_daily_stats
+from .sleep_computation import SleepMetrics
+
+logger = logging.getLogger("recompute")
+
+DEFAULT_CHUNK_SIZE = 100  # Sessions per chunk
+DEFAULT_CHECKPOINT = ".recompute_checkpoint.json"
+
+# Columns compared in the dry-run report
+DIFF_COLUMNS = [
+    "duration_minutes", "quality_score", "points_earned", "awakenings_count",
+    "restless_minutes", "still_minutes", "out_of_bed_minutes",
+    "deep_estimate_minutes", "rem_estimate_minutes", "core_estimate_minutes"
+]
+
+# (session_id, start_ts, end_ts, columns)
+SessionPayload = Tuple[int, float, float, WindowColumns]
+
+
+# ============= Checkpointing =============
+
+class CheckpointMismatch(ValueError):
+    """The checkpoint was written by a run with a different --since."""
+
+
+def _since_key(since: Optional[datetime]) -> Optional[str]:
+    return since.isoformat() if since is not None else None
+
+
+def load_checkpoint(path: str, since: Optional[datetime] = None) -> int:
+    """Last fully processed session id, or 0. The checkpoint must be for the same since."""
+    if not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        checkpoint = json.load(f)
+
+    # Session ids past the checkpoint are only complete for the same filter
+    if checkpoint.get("since") != _since_key(since):
+        raise CheckpointMismatch(
+            f"Checkpoint {path} is from a run with --since {checkpoint.get('since') or '(none)'}, "
+            f"not {_since_key(since) or '(none)'}; pass --reset to start over"
+        )
+    return int(checkpoint.get("last_session_id", 0))
+
+
+def save_checkpoint(path: str, last_session_id: int, since: Optional[datetime] = None):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({
+            "last_session_id": last_session_id,
+            "since": _since_key(since),
+            "updated_at": datetime.utcnow().isoformat()
+        }, f)
+    os.replace(tmp_path, path)
+
+
+# ============= Streaming =============
+
+def iter_session_chunks(
+    db: Session,
+    after_id: int,
+    chunk_size: int,
+    since: Optional[datetime] = None
+) -> Iterator[List[SleepSession]]:
+    """Completed sessions in id order, chunk_size at a time (keyset paging)."""
+    last_id = after_id
+    while True:
+        query = db.query(
+            SleepSession.id, SleepSession.user_id, SleepSession.start_time, SleepSession.end_time
+        ).filter(
+            SleepSession.id > last_id,
+            SleepSession.end_time.isnot(None),
+            # Downsampled windows would not reproduce full-resolution scores
+            ~exists().where(SleepWindowRetention.session_id == SleepSession.id)
+        )
+        if since is not None:
+            query = query.filter(SleepSession.start_time >= since)
+
+        chunk = query.order_by(SleepSession.id).limit(chunk_size).all()
+        if not chunk:
+            return
+
+        yield chunk
+        last_id = chunk[-1].id
+
+
+def load_chunk_payloads(db: Session, sessions: List) -> List[SessionPayload]:
+    """Load all windows for a chunk of sessions, compacted or not, as columns."""
+    columns_by_session = load_window_columns(db, [s.id for s in sessions])
+
+    payloads = []
+    for s in sessions:
+        columns = columns_by_session.get(s.id)
+        if columns is None:
+            # Manual sessions have no windows; their values are user-entered
+            continue
+        payloads.append((s.id, s.start_time.timestamp(), s.end_time.timestamp(), columns))
+
+    return payloads
+
+
+def score_chunk(payloads: List[SessionPayload]) -> List[Tuple[int, dict]]:
+    """Worker entry point: compute metrics for every session in a chunk."""
+    return [
+        (session_id, asdict(compute_sleep_metrics_columnar(columns, start_ts, end_ts)))
+        for session_id, start_ts, end_ts, columns in payloads
+    ]
+
+
+# ============= Write-back =============
+
+def build_updates(start_times: Dict[int, datetime], results: List[Tuple[int, dict]]) -> List[dict]:
+    """Turn worker results into SleepSession bulk-update parameter dicts."""
+    updates = []
+    for session_id, metrics in results:
+        values = session_metric_values(SleepMetrics(**metrics), start_times[session_id])
+        values["id"] = session_id
+        updates.append(values)
+    return updates
+
+
+def diff_updates(db: Session, updates: List[dict]) -> List[dict]:
+    """Per-session changes between stored values and recomputed ones."""
+    current = {
+        row.id: row
+        for row in db.query(SleepSession.id, *[getattr(SleepSession, c) for c in DIFF_COLUMNS]).filter(
+            SleepSession.id.in_([u["id"] for u in updates])
+        )
+    }
+
+    diffs = []
+    for u in updates:
+        row = current[u["id"]]
+        changed = {
+            column: (getattr(row, column), u[column])
+            for column in DIFF_COLUMNS
+            if getattr(row, column) != u[column]
+        }
+        if changed:
+            diffs.append({"session_id": u["id"], "changes": changed})
+    return diffs
+
+
+# ============= Driver =============
+
+def run(
+    since: Optional[datetime] = None,
+    dry_run: bool = False,
+    workers: Optional[int] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    checkpoint_path: str = DEFAULT_CHECKPOINT,
+    reset: bool = False,
+    on_diff: Optional[Callable[[List[dict]], None]] = None
+) -> dict:
+    """
+    Recompute metrics for all completed sessions.
+
+    Returns a summary dict of counters. In dry-run mode nothing is
+    written (database or checkpoint) and each chunk's per-session diff
+    is passed to on_diff as soon as it is computed, so memory stays
+    bounded by the chunks in flight.
+    """
+    workers = workers or os.cpu_count() or 1
+    resume_from = 0 if (reset or dry_run) else load_checkpoint(checkpoint_path, since)
+    if resume_from:
+        logger.info(f"Resuming after session id {resume_from}")
+
+    summary = {"sessions_scanned": 0, "sessions_scored": 0, "sessions_changed": 0}
+    read_db = SessionLocal()
+    write_db = SessionLocal()
+
+    def finish(chunk_last_id: int, sessions: Dict[int, tuple], results: List[Tuple[int, dict]]):
+        start_times = {session_id: s.start_time for session_id, s in sessions.items()}
+        updates = build_updates(start_times, results)
+        summary["sessions_scored"] += len(updates)
+
+        if updates:
+            diffs = diff_updates(write_db, updates)
+            summary["sessions_changed"] += len(diffs)
+            if dry_run:
+                if diffs and on_diff is not None:
+                    on_diff(diffs)
+            else:
+                write_db.execute(update(SleepSession), updates)
+                refresh_daily_stats(write_db, [
+                    (sessions[u["id"]].user_id, sessions[u["id"]].start_time.date())
+                    for u in updates
+                ])
+                write_db.commit()
+
+        if not dry_run:
+            save_checkpoint(checkpoint_path, chunk_last_id, since)
+        logger.info(f"Processed through session id {chunk_last_id} ({summary['sessions_scored']} scored)")
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # Bounded number of chunks in flight keeps memory flat;
+            # results are applied in submission order so the checkpoint
+            # never skips an unfinished chunk
+            in_flight = deque()
+            for chunk in iter_session_chunks(read_db, resume_from, chunk_size, since):
+                summary["sessions_scanned"] += len(chunk)
+                payloads = load_chunk_payloads(read_db, chunk)
+                sessions = {s.id: s for s in chunk}
+                in_flight.append((chunk[-1].id, sessions, pool.submit(score_chunk, payloads)))
+
+                while len(in_flight) >= workers * 2:
+                    chunk_last_id, sessions, future = in_flight.popleft()
+                    finish(chunk_last_id, sessions, future.result())
+
+            while in_flight:
+                chunk_last_id, sessions, future = in_flight.popleft()
+                finish(chunk_last_id, sessions, future.result())
+    finally:
+        read_db.close()
+        write_db.close()
+
+    if not dry_run and os.path.exists(checkpoint_path):
+        # Completed run: next invocation starts from scratch
+        os.remove(checkpoint_path)
+
+    return summary
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Recompute sleep metrics for completed sessions.")
+    parser.add_argument("--since", type=lambda s: datetime.strptime(s, "%Y-%m-%d"),
+                        help="Only sessions that started on or after this date (YYYY-MM-DD)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Report what would change without writing anything")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes (default: all cores)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="Sessions per chunk")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT,
+                        help="Checkpoint file used to resume interrupted runs")
+    parser.add_argument("--reset", action="store_true",
+                        help="Ignore any existing checkpoint and start from the first session")
+    return parser.parse_args(argv)
+
+
+def print_diffs(diffs: List[dict]):
+    for entry in diffs:
+        changes = ", ".join(
+            f"{column}: {old} -> {new}" for column, (old, new) in entry["changes"].items()
+        )
+        print(f"  session {entry['session_id']}: {changes}", flush=True)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(name)s] %(levelname)s: %(message)s")
+    args = _parse_args(argv)
+
+    try:
+        summary = run(
+            since=args.since,
+            dry_run=args.dry_run,
+            workers=args.workers,
+            chunk_size=args.chunk_size,
+            checkpoint_path=args.checkpoint,
+            reset=args.reset,
+            on_diff=print_diffs
+        )
+    except CheckpointMismatch as e:
+        sys.exit(str(e))
+
+    if args.dry_run:
+        print("\nDry run - no changes written.")
+    print(f"Sessions scanned: {summary['sessions_scanned']}")
+    print(f"Sessions scored:  {summary['sessions_scored']}")
+    print(f"Sessions changed: {summary['sessions_changed']}")
+
+
+if __name__ == "__main__":
+    main()
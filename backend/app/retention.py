@@ -0,0 +1,301 @@
+"""
+Window Retention
+
+Ages out raw window data in three tiers, by how long ago a session ended:
+
+1. Full resolution (rows, then a compacted blob, see compaction.py) for
+   WINDOW_RETENTION_FULL_DAYS.
+2. Downsampled: windows are merged into per-minute aggregates, stored
+   in the session's blob in the same format, so every blob reader keeps
+   working. Averages are weighted by window duration, sample counts are
+   summed, and a minute takes the state it spent the most time in (ties
+   go to the more wakeful state).
+3. Archived after WINDOW_RETENTION_ARCHIVE_DAYS: the aggregate blob is
+   written to a compressed file under WINDOW_ARCHIVE_DIR and removed
+   from the database. Blob readers load it from the file.
+
+Session metrics, stage estimates, rollups and interval timelines are
+computed before any of this and kept, so summaries and analytics do not
+depend on the windows. A session's timeline is built from full-resolution
+windows before they are downsampled if it does not have one yet. Windows
+uploaded for a session that has left the full-resolution tier are
+treated as duplicates by ingest, and recompute skips such sessions.
+
+Each tier is applied in transactions of at most --batch-size sessions.
+Re-running is safe; an interrupted run continues where it stopped.
+
+Usage (from the backend directory), e.g. daily from cron:
+    python -m app.retention
+    python -m app.retention --dry-run
+    python -m app.retention --full-days 14 --archive-days 180
+"""
+import argparse
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import exists, or_
+from sqlalchemy.orm import Session
+
+from .compaction import (
+    decode_window_blob, encode_window_blob, read_session_windows, store_session_windows
+)
+from .database import SessionLocal, init_db
+from .models import SleepSession, SleepSessionTimeline, SleepWindow, SleepWindowBlob, SleepWindowRetention
+from .timeline import rebuild_timeline
+
+logger = logging.getLogger("retention")
+
+WINDOW_RETENTION_FULL_DAYS = float(os.getenv("WINDOW_RETENTION_FULL_DAYS", "30"))
+WINDOW_RETENTION_ARCHIVE_DAYS = float(os.getenv("WINDOW_RETENTION_ARCHIVE_DAYS", "365"))
+WINDOW_ARCHIVE_DIR = os.getenv("WINDOW_ARCHIVE_DIR", "./window_archive")
+
+DOWNSAMPLE_SECONDS = 60
+ARCHIVE_ZLIB_LEVEL = 9
+DEFAULT_BATCH_SIZE = 50  # Sessions per transaction
+
+# Tie-break when a minute spent equal time in two states
+_STATE_SEVERITY = {"still": 0, "moving": 1, "awake": 2, "out_of_bed": 3}
+
+
+# ============= Downsampling =============
+
+def downsample_windows(windows: List[dict], resolution: int = DOWNSAMPLE_SECONDS) -> List[dict]:
+    """Merge windows (ts_start order) into clock-aligned buckets of `resolution` seconds."""
+    buckets: List[List[dict]] = []
+    current = None
+    for w in windows:
+        key = int(w["ts_start"] // resolution)
+        if key != current:
+            buckets.append([])
+            current = key
+        buckets[-1].append(w)
+
+    return [_aggregate(bucket) for bucket in buckets]
+
+
+def _aggregate(windows: List[dict]) -> dict:
+    if len(windows) == 1:
+        return dict(windows[0])
+
+    weights = [max(w["ts_end"] - w["ts_start"], 0.0) for w in windows]
+    total = sum(weights)
+    if total <= 0:
+        weights = [1.0] * len(windows)
+        total = float(len(windows))
+
+    def mean(name: str) -> float:
+        return sum(w[name] * weight for w, weight in zip(windows, weights)) / total
+
+    time_in_state: Dict[str, float] = {}
+    for w, weight in zip(windows, weights):
+        time_in_state[w["state"]] = time_in_state.get(w["state"], 0.0) + weight
+
+    return {
+        "ts_start": windows[0]["ts_start"],
+        "ts_end": max(w["ts_end"] for w in windows),
+        "avg_distance": mean("avg_distance"),
+        "movement_energy": mean("movement_energy"),
+        "active_ratio": mean("active_ratio"),
+        "state": max(time_in_state, key=lambda s: (time_in_state[s], _STATE_SEVERITY.get(s, 0))),
+        "sample_count": sum(w.get("sample_count") or 0 for w in windows)
+    }
+
+
+def downsample_session(db: Session, session_id: int, resolution: int = DOWNSAMPLE_SECONDS) -> int:
+    """
+    Replace a session's windows with per-resolution aggregates and record
+    its retention tier. Returns windows removed. The caller commits.
+    """
+    row_ids, windows, blob = read_session_windows(db, session_id)
+
+    reduced = 0
+    if windows:
+        if db.get(SleepSessionTimeline, session_id) is None:
+            rebuild_timeline(db, session_id, windows)
+        aggregates = downsample_windows(windows, resolution)
+        store_session_windows(db, session_id, aggregates, row_ids, blob)
+        reduced = len(windows) - len(aggregates)
+
+    db.add(SleepWindowRetention(
+        session_id=session_id,
+        resolution_seconds=resolution,
+        downsampled_at=datetime.utcnow()
+    ))
+    return reduced
+
+
+# ============= Archival =============
+
+def archive_path(archive_dir: str, session: SleepSession) -> str:
+    return os.path.join(
+        archive_dir, session.start_time.strftime("%Y"), session.start_time.strftime("%m"),
+        f"{session.session_uuid}.swbl"
+    )
+
+
+def _write_file(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def archive_session(db: Session, session: SleepSession, archive_dir: str = WINDOW_ARCHIVE_DIR) -> int:
+    """
+    Move a downsampled session's blob to a file. Returns bytes written.
+    The file is written before the caller commits, so a failed commit
+    only leaves a file the next run overwrites.
+    """
+    retention = db.get(SleepWindowRetention, session.id)
+    blob = db.get(SleepWindowBlob, session.id)
+
+    size = 0
+    path = None
+    if blob is not None:
+        # Re-encoded at the archive level: lossless, whatever the blob's compression
+        data = encode_window_blob(decode_window_blob(blob.data).rows(), zlib_level=ARCHIVE_ZLIB_LEVEL)
+        path = archive_path(archive_dir, session)
+        _write_file(path, data)
+        db.delete(blob)
+        size = len(data)
+
+    retention.archive_path = path
+    retention.archived_at = datetime.utcnow()
+    return size
+
+
+# ============= Job =============
+
+def downsample_candidates(db: Session, cutoff: datetime, after_id: int, limit: int) -> List[int]:
+    """Sessions that ended before cutoff, still at full resolution and with windows."""
+    rows = db.query(SleepSession.id).filter(
+        SleepSession.id > after_id,
+        SleepSession.end_time.isnot(None),
+        SleepSession.end_time < cutoff,
+        ~exists().where(SleepWindowRetention.session_id == SleepSession.id),
+        or_(
+            exists().where(SleepWindow.session_id == SleepSession.id),
+            exists().where(SleepWindowBlob.session_id == SleepSession.id)
+        )
+    ).order_by(SleepSession.id).limit(limit).all()
+    return [session_id for (session_id,) in rows]
+
+
+def archive_candidates(db: Session, cutoff: datetime, after_id: int, limit: int) -> List[SleepSession]:
+    """Downsampled sessions that ended before cutoff and are not archived yet."""
+    return db.query(SleepSession).join(
+        SleepWindowRetention, SleepWindowRetention.session_id == SleepSession.id
+    ).filter(
+        SleepSession.id > after_id,
+        SleepSession.end_time < cutoff,
+        SleepWindowRetention.archived_at.is_(None)
+    ).order_by(SleepSession.id).limit(limit).all()
+
+
+def enforce(
+    db: Session,
+    full_days: float = WINDOW_RETENTION_FULL_DAYS,
+    archive_days: float = WINDOW_RETENTION_ARCHIVE_DAYS,
+    archive_dir: str = WINDOW_ARCHIVE_DIR,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    dry_run: bool = False,
+    now: Optional[datetime] = None
+) -> dict:
+    """Apply the retention policy, committing every batch_size sessions."""
+    if archive_days < full_days:
+        raise ValueError("archive_days must not be shorter than full_days")
+
+    now = now or datetime.now()
+    summary = {"downsampled": 0, "windows_removed": 0, "archived": 0, "archive_bytes": 0, "failed": 0}
+
+    last_id = 0
+    while True:
+        batch = downsample_candidates(db, now - timedelta(days=full_days), last_id, batch_size)
+        if not batch:
+            break
+        last_id = batch[-1]
+        if dry_run:
+            summary["downsampled"] += len(batch)
+            continue
+        try:
+            removed = sum(downsample_session(db, session_id) for session_id in batch)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            summary["failed"] += len(batch)
+            logger.warning(f"Downsampling sessions {batch[0]}..{batch[-1]} failed: {e}")
+            continue
+        summary["downsampled"] += len(batch)
+        summary["windows_removed"] += removed
+
+    last_id = 0
+    while True:
+        batch = archive_candidates(db, now - timedelta(days=archive_days), last_id, batch_size)
+        if not batch:
+            break
+        last_id = batch[-1].id
+        if dry_run:
+            summary["archived"] += len(batch)
+            continue
+        try:
+            size = sum(archive_session(db, session, archive_dir) for session in batch)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            summary["failed"] += len(batch)
+            logger.warning(f"Archiving sessions {batch[0].id}..{batch[-1].id} failed: {e}")
+            continue
+        summary["archived"] += len(batch)
+        summary["archive_bytes"] += size
+
+    return summary
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Downsample and archive old window data.")
+    parser.add_argument("--full-days", type=float, default=WINDOW_RETENTION_FULL_DAYS,
+                        help="Keep full-resolution windows for sessions that ended within this many days")
+    parser.add_argument("--archive-days", type=float, default=WINDOW_RETENTION_ARCHIVE_DAYS,
+                        help="Move aggregates to disk for sessions that ended this many days ago")
+    parser.add_argument("--archive-dir", default=WINDOW_ARCHIVE_DIR,
+                        help="Directory for archived window files")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Sessions per transaction")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Count sessions each tier would process without changing anything "
+                             "(archival only counts sessions already downsampled)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(name)s] %(levelname)s: %(message)s")
+    args = _parse_args(argv)
+    init_db()
+
+    db = SessionLocal()
+    try:
+        summary = enforce(
+            db,
+            full_days=args.full_days,
+            archive_days=args.archive_days,
+            archive_dir=args.archive_dir,
+            batch_size=args.batch_size,
+            dry_run=args.dry_run
+        )
+    finally:
+        db.close()
+
+    prefix = "Dry run - would have " if args.dry_run else ""
+    logger.info(
+        f"{prefix}downsampled {summary['downsampled']} sessions ({summary['windows_removed']} windows removed), "
+        f"archived {summary['archived']} sessions ({summary['archive_bytes']} bytes), {summary['failed']} failed"
+    )
+
+
+if __name__ == "__main__":
+    main()
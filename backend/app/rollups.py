@@ -0,0 +1,109 @@
+"""
+Per-User Daily Rollups
+
+Maintains the user_daily_stats table: one row per (user, start day) with
+totals over that day's completed sessions. Rows are refreshed in the same
+transaction that finalises a session, so read endpoints can aggregate
+over days by indexed key instead of scanning sleep_sessions. Sessions
+are grouped by their generated start_day column.
+
+Backfill / repair (from the backend directory):
+    python -m app.rollups
+"""
+import logging
+from datetime import date
+from typing import Iterable, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal, init_db
+from .models import SleepSession, UserDailyStats
+
+logger = logging.getLogger("rollups")
+
+
+def _aggregates():
+    """Rollup columns computed over a group of completed sessions."""
+    return (
+        func.count(SleepSession.id),
+        func.coalesce(func.sum(SleepSession.points_earned), 0),
+        func.coalesce(func.sum(SleepSession.duration_minutes), 0.0),
+        func.coalesce(func.sum(SleepSession.awakenings_count), 0),
+        func.coalesce(func.sum(SleepSession.quality_score), 0.0),
+        func.count(SleepSession.quality_score)
+    )
+
+
+def _stats_row(user_id: int, day: date, values) -> UserDailyStats:
+    session_count, points, minutes, awakenings, quality_sum, quality_count = values
+    return UserDailyStats(
+        user_id=user_id,
+        day=day,
+        session_count=session_count,
+        total_points=int(points),
+        total_minutes=float(minutes),
+        total_awakenings=int(awakenings),
+        quality_sum=float(quality_sum),
+        quality_count=quality_count
+    )
+
+
+def session_day_key(session: SleepSession) -> Tuple[int, date]:
+    """Rollup key a session contributes to."""
+    return (session.user_id, session.start_time.date())
+
+
+def refresh_daily_stats(db: Session, keys: Iterable[Tuple[int, date]]):
+    """
+    Recompute the rollup rows for the given (user_id, day) keys from
+    sleep_sessions. Idempotent; the caller owns the transaction.
+    """
+    # Pending session changes must be visible to the aggregate
+    db.flush()
+
+    for user_id, day in set(keys):
+        values = db.query(*_aggregates()).filter(
+            SleepSession.user_id == user_id,
+            SleepSession.start_day == day,
+            SleepSession.end_time.isnot(None)
+        ).one()
+
+        existing = db.get(UserDailyStats, (user_id, day))
+        if not values[0]:
+            if existing is not None:
+                db.delete(existing)
+            continue
+
+        db.merge(_stats_row(user_id, day, values))
+
+
+def rebuild_daily_stats(db: Session) -> int:
+    """Rebuild the whole rollup table from sleep_sessions in one pass."""
+    groups = db.query(SleepSession.user_id, SleepSession.start_day, *_aggregates()).filter(
+        SleepSession.end_time.isnot(None)
+    ).group_by(SleepSession.user_id, SleepSession.start_day).all()
+
+    db.query(UserDailyStats).delete()
+    for user_id, day, *values in groups:
+        db.add(_stats_row(user_id, day, values))
+
+    db.commit()
+    return len(groups)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(name)s] %(levelname)s: %(message)s")
+    init_db()
+
+    db = SessionLocal()
+    try:
+        rows = rebuild_daily_stats(db)
+    finally:
+        db.close()
+
+    logger.info(f"Rebuilt user_daily_stats: {rows} rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,34 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import case, func, true
 from typing import List
 from datetime import datetime, timedelta
 
 from ..database import get_db
 from ..models import (
-    User, SleepSession, AnalyticsOverview, AnalyticsTrends, SleepTrend
+    User, SleepSession, UserDailyStats, AnalyticsOverview, AnalyticsTrends, SleepTrend
 )
 from ..auth import get_current_user
 
 router = APIRouter(prefix="/api/analytics", tags=["Analytics"])
 
 
+def _overview_query(db: Session, user_id: int):
+    """All overview statistics over the user's completed sessions, in one row."""
+    # Zero durations are left out of best/worst, as before
+    duration = func.nullif(SleepSession.duration_minutes, 0)
+    return db.query(
+        func.count(SleepSession.id),
+        func.coalesce(func.sum(SleepSession.duration_minutes), 0.0),
+        func.avg(SleepSession.quality_score),
+        func.max(duration),
+        func.min(duration)
+    ).filter(
+        SleepSession.user_id == user_id,
+        SleepSession.end_time.isnot(None)
+    )
+
+
 @router.get("/overview", response_model=AnalyticsOverview)
 def get_analytics_overview(
     current_user: User = Depends(get_current_user),
@@ -21,13 +37,11 @@ def get_analytics_overview(
     """
     Get overall sleep statistics for the current user.
     """
-    # Get all completed sleep sessions
-    sessions = db.query(SleepSession).filter(
-        SleepSession.user_id == current_user.id,
-        SleepSession.end_time.isnot(None)
-    ).all()
+    session_count, total_minutes, avg_quality, best_duration, worst_duration = (
+        _overview_query(db, current_user.id).one()
+    )
     
-    if not sessions:
+    if not session_count:
         return AnalyticsOverview(
             total_sleep_hours=0.0,
             average_sleep_duration=0.0,
@@ -37,24 +51,13 @@ def get_analytics_overview(
             worst_sleep_duration=None
         )
     
-    # Calculate statistics
-    total_minutes = sum(s.duration_minutes for s in sessions if s.duration_minutes)
     total_hours = total_minutes / 60
-    average_duration = total_minutes / len(sessions) if sessions else 0
-    
-    # Quality scores
-    quality_scores = [s.quality_score for s in sessions if s.quality_score is not None]
-    avg_quality = sum(quality_scores) / len(quality_scores) if quality_scores else None
-    
-    # Best and worst sleep durations
-    durations = [s.duration_minutes for s in sessions if s.duration_minutes]
-    best_duration = max(durations) if durations else None
-    worst_duration = min(durations) if durations else None
+    average_duration = total_minutes / session_count
     
     return AnalyticsOverview(
         total_sleep_hours=round(total_hours, 2),
         average_sleep_duration=round(average_duration, 2),
-        total_sessions=len(sessions),
+        total_sessions=session_count,
         average_quality_score=round(avg_quality, 2) if avg_quality else None,
         best_sleep_duration=round(best_duration, 2) if best_duration else None,
         worst_sleep_duration=round(worst_duration, 2) if worst_duration else None
@@ -92,6 +95,57 @@ def get_sleep_trends(
     return AnalyticsTrends(trends=trends)
 
 
+# Quality distribution buckets, by inclusive upper bound; anything
+# above the last bound is excellent
+QUALITY_BUCKETS = [
+    ("poor (0-20)", 20),
+    ("fair (21-40)", 40),
+    ("average (41-60)", 60),
+    ("good (61-80)", 80),
+]
+EXCELLENT_BUCKET = "excellent (81-100)"
+RECENT_QUALITY_SESSIONS = 7
+
+
+def _quality_query(db: Session, user_id: int):
+    """
+    Quality statistics over the user's scored sessions, joined to their
+    most recent scored sessions: one row per recent session (oldest
+    first), each carrying the same aggregates, or a single row with
+    NULL recent columns if there are none.
+    """
+    scored = (
+        SleepSession.user_id == user_id,
+        SleepSession.end_time.isnot(None),
+        SleepSession.quality_score.isnot(None)
+    )
+    
+    score = SleepSession.quality_score
+    bucket = case(
+        *((score <= bound, index) for index, (_, bound) in enumerate(QUALITY_BUCKETS)),
+        else_=len(QUALITY_BUCKETS)
+    )
+    stats = db.query(
+        func.count(SleepSession.id).label("session_count"),
+        func.avg(score).label("avg_quality"),
+        *(
+            func.sum(case((bucket == index, 1), else_=0)).label(f"bucket_{index}")
+            for index in range(len(QUALITY_BUCKETS) + 1)
+        )
+    ).filter(*scored).subquery()
+    
+    # Ties on start_time keep the order the sessions were stored in
+    recent = db.query(
+        SleepSession.id, SleepSession.start_time, SleepSession.quality_score
+    ).filter(*scored).order_by(
+        SleepSession.start_time.desc(), SleepSession.id
+    ).limit(RECENT_QUALITY_SESSIONS).subquery()
+    
+    return db.query(stats, recent.c.start_time, recent.c.quality_score).select_from(stats).outerjoin(
+        recent, true()
+    ).order_by(recent.c.start_time, recent.c.id.desc())
+
+
 @router.get("/quality", response_model=dict)
 def get_quality_metrics(
     current_user: User = Depends(get_current_user),
@@ -100,57 +154,33 @@ def get_quality_metrics(
     """
     Get detailed sleep quality metrics.
     """
-    # Get all completed sessions with quality scores
-    sessions = db.query(SleepSession).filter(
-        SleepSession.user_id == current_user.id,
-        SleepSession.end_time.isnot(None),
-        SleepSession.quality_score.isnot(None)
-    ).all()
+    rows = _quality_query(db, current_user.id).all()
+    stats = rows[0]
     
-    if not sessions:
+    if not stats.session_count:
         return {
             "average_quality": None,
             "quality_distribution": {},
             "recent_quality_trend": []
         }
     
-    # Calculate average quality
-    quality_scores = [s.quality_score for s in sessions]
-    avg_quality = sum(quality_scores) / len(quality_scores)
-    
     # Quality distribution (grouped by ranges: 0-20, 21-40, 41-60, 61-80, 81-100)
+    labels = [label for label, _ in QUALITY_BUCKETS] + [EXCELLENT_BUCKET]
     distribution = {
-        "poor (0-20)": 0,
-        "fair (21-40)": 0,
-        "average (41-60)": 0,
-        "good (61-80)": 0,
-        "excellent (81-100)": 0
+        label: getattr(stats, f"bucket_{index}") for index, label in enumerate(labels)
     }
     
-    for score in quality_scores:
-        if score <= 20:
-            distribution["poor (0-20)"] += 1
-        elif score <= 40:
-            distribution["fair (21-40)"] += 1
-        elif score <= 60:
-            distribution["average (41-60)"] += 1
-        elif score <= 80:
-            distribution["good (61-80)"] += 1
-        else:
-            distribution["excellent (81-100)"] += 1
-    
     # Recent quality trend (last 7 sessions)
-    recent_sessions = sorted(sessions, key=lambda s: s.start_time, reverse=True)[:7]
     recent_trend = [
         {
-            "date": s.start_time.strftime("%Y-%m-%d"),
-            "quality_score": s.quality_score
+            "date": row.start_time.strftime("%Y-%m-%d"),
+            "quality_score": row.quality_score
         }
-        for s in reversed(recent_sessions)
+        for row in rows
     ]
     
     return {
-        "average_quality": round(avg_quality, 2),
+        "average_quality": round(stats.avg_quality, 2),
         "quality_distribution": distribution,
         "recent_quality_trend": recent_trend
     }
@@ -165,25 +195,21 @@ def get_sleep_streak(
     Get the current sleep streak for the user.
     A streak is counted as consecutive days with at least one completed sleep session.
     """
-    # Get all completed sessions ordered by date (most recent first)
-    sessions = db.query(SleepSession).filter(
-        SleepSession.user_id == current_user.id,
-        SleepSession.end_time.isnot(None)
-    ).order_by(SleepSession.start_time.desc()).all()
+    # Days with at least one completed session, from the daily rollup
+    sleep_dates = {
+        day for (day,) in db.query(UserDailyStats.day).filter(
+            UserDailyStats.user_id == current_user.id,
+            UserDailyStats.session_count > 0
+        )
+    }
     
-    if not sessions:
+    if not sleep_dates:
         return {
             "current_streak": 0,
             "longest_streak": 0,
             "last_sleep_date": None
         }
     
-    # Get unique dates with sleep sessions (using the date of sleep start)
-    sleep_dates = set()
-    for session in sessions:
-        # Use the date when the sleep session started
-        sleep_dates.add(session.start_time.date())
-    
     # Sort dates in descending order
     sorted_dates = sorted(sleep_dates, reverse=True)
     
@@ -1,121 +1,146 @@
+import asyncio
+
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select
+from typing import Callable, List
 from datetime import datetime, timedelta
 
-from ..database import get_db
+from ..database import get_async_db
 from ..models import (
-    User, SleepSession, LeaderboardResponse, LeaderboardEntry
+    User, SleepSession, UserDailyStats, LeaderboardResponse, LeaderboardEntry
 )
-from ..auth import get_current_user
+from ..auth import get_current_user_async
+from ..rank_index import leaderboards, RankIndex, CONSISTENCY_WINDOW_DAYS
 
 router = APIRouter(prefix="/api/leaderboard", tags=["Leaderboard"])
 
 
-@router.get("/sleep-hours", response_model=LeaderboardResponse)
-def get_sleep_hours_leaderboard(
-    limit: int = 10,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
+def _index_response(
+    index: RankIndex,
+    rows: List[tuple],
+    current_user: User,
+    format_value: Callable[[float], float],
+    format_label: Callable[[float], str]
+) -> LeaderboardResponse:
     """
-    Get leaderboard ranked by total sleep hours.
+    Build a response from (rank, user_id, raw_value) rows of a rank index,
+    plus the current user's rank and value. Call with leaderboards.lock held.
     """
-    # Get total sleep hours for each user
-    leaderboard_data = db.query(
-        User.id,
-        User.username,
-        func.sum(SleepSession.duration_minutes).label('total_minutes')
-    ).join(
-        SleepSession, User.id == SleepSession.user_id
-    ).filter(
-        SleepSession.end_time.isnot(None)
-    ).group_by(
-        User.id, User.username
-    ).order_by(
-        func.sum(SleepSession.duration_minutes).desc()
-    ).limit(limit).all()
-    
-    # Convert to leaderboard entries
-    entries = []
-    user_rank = None
-    user_value = None
-    
-    for rank, (user_id, username, total_minutes) in enumerate(leaderboard_data, start=1):
-        total_hours = total_minutes / 60 if total_minutes else 0
-        entries.append(LeaderboardEntry(
+    entries = [
+        LeaderboardEntry(
             rank=rank,
-            username=username,
-            value=round(total_hours, 2),
-            label=f"{round(total_hours, 1)}h"
-        ))
-        
-        if user_id == current_user.id:
-            user_rank = rank
-            user_value = round(total_hours, 2)
+            username=leaderboards.usernames.get(user_id, ""),
+            value=format_value(value),
+            label=format_label(value)
+        )
+        for rank, user_id, value in rows
+    ]
     
-    # If current user is not in top entries, find their rank
-    if user_rank is None:
-        user_stats = db.query(
-            func.sum(SleepSession.duration_minutes)
-        ).filter(
-            SleepSession.user_id == current_user.id,
-            SleepSession.end_time.isnot(None)
-        ).scalar()
-        
-        if user_stats:
-            user_value = round(user_stats / 60, 2)
-            # Find rank by counting users with more sleep hours using a subquery
-            from sqlalchemy import select
-            user_totals = select(
-                SleepSession.user_id,
-                func.sum(SleepSession.duration_minutes).label('total')
-            ).where(
-                SleepSession.end_time.isnot(None)
-            ).group_by(
-                SleepSession.user_id
-            ).having(
-                func.sum(SleepSession.duration_minutes) > user_stats
-            ).alias()
-            
-            users_above = db.query(func.count()).select_from(user_totals).scalar() or 0
-            user_rank = users_above + 1
+    user_value = index.value(current_user.id)
     
     return LeaderboardResponse(
         entries=entries,
-        user_rank=user_rank,
-        user_value=user_value
+        user_rank=index.rank(current_user.id),
+        user_value=format_value(user_value) if user_value is not None else None
+    )
+
+
+async def _indexed_response(
+    attribute: str,
+    select_rows: Callable[[RankIndex], List[tuple]],
+    current_user: User,
+    format_value: Callable[[float], float],
+    format_label: Callable[[float], str]
+) -> LeaderboardResponse:
+    """
+    Response from the rank index named by `attribute`, with rows chosen
+    by select_rows. Refreshing a stale index (a full rebuild) and waiting
+    for its lock happen in a worker thread, not on the event loop.
+    """
+    def build() -> LeaderboardResponse:
+        leaderboards.ensure_fresh()
+        with leaderboards.lock:
+            index = getattr(leaderboards, attribute)
+            return _index_response(index, select_rows(index), current_user, format_value, format_label)
+    
+    return await asyncio.to_thread(build)
+
+
+def _hours_value(minutes: float) -> float:
+    return round(minutes / 60, 2)
+
+
+def _hours_label(minutes: float) -> str:
+    return f"{round(minutes / 60, 1)}h"
+
+
+def _count_label(count: float) -> str:
+    return f"{int(count)} sessions"
+
+
+def _quality_value(quality: float) -> float:
+    return round(quality, 2)
+
+
+def _quality_label(quality: float) -> str:
+    return f"{round(quality, 1)}/100"
+
+
+def _points_value(points: float) -> float:
+    return float(int(points))
+
+
+def _points_label(points: float) -> str:
+    return f"{int(points)} pts"
+
+
+@router.get("/sleep-hours", response_model=LeaderboardResponse)
+async def get_sleep_hours_leaderboard(
+    limit: int = 10,
+    current_user: User = Depends(get_current_user_async)
+):
+    """
+    Get leaderboard ranked by total sleep hours.
+    """
+    return await _indexed_response(
+        "sleep_minutes", lambda index: index.top(limit), current_user, _hours_value, _hours_label
     )
 
 
 @router.get("/consistency", response_model=LeaderboardResponse)
-def get_consistency_leaderboard(
+async def get_consistency_leaderboard(
     limit: int = 10,
     days: int = 30,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get leaderboard ranked by sleep consistency (number of sessions in recent days).
     """
+    if days == CONSISTENCY_WINDOW_DAYS:
+        return await _indexed_response(
+            "consistency", lambda index: index.top(limit), current_user, float, _count_label
+        )
+    
+    # Non-default windows are not indexed
     cutoff_date = datetime.utcnow() - timedelta(days=days)
     
     # Get session count for each user in the specified period
-    leaderboard_data = db.query(
+    leaderboard_data = (await db.execute(select(
         User.id,
         User.username,
         func.count(SleepSession.id).label('session_count')
     ).join(
         SleepSession, User.id == SleepSession.user_id
-    ).filter(
+    ).where(
         SleepSession.start_time >= cutoff_date,
         SleepSession.end_time.isnot(None)
     ).group_by(
         User.id, User.username
     ).order_by(
         func.count(SleepSession.id).desc()
-    ).limit(limit).all()
+    ).limit(limit))).all()
     
     # Convert to leaderboard entries
     entries = []
@@ -136,13 +161,13 @@ def get_consistency_leaderboard(
     
     # If current user is not in top entries, find their stats
     if user_rank is None:
-        user_stats = db.query(
+        user_stats = await db.scalar(select(
             func.count(SleepSession.id)
-        ).filter(
+        ).where(
             SleepSession.user_id == current_user.id,
             SleepSession.start_time >= cutoff_date,
             SleepSession.end_time.isnot(None)
-        ).scalar()
+        ))
         
         if user_stats:
             user_value = float(user_stats)
@@ -155,94 +180,41 @@ def get_consistency_leaderboard(
 
 
 @router.get("/quality", response_model=LeaderboardResponse)
-def get_quality_leaderboard(
+async def get_quality_leaderboard(
     limit: int = 10,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async)
 ):
     """
     Get leaderboard ranked by average sleep quality score.
     """
-    # Get average quality score for each user
-    leaderboard_data = db.query(
-        User.id,
-        User.username,
-        func.avg(SleepSession.quality_score).label('avg_quality')
-    ).join(
-        SleepSession, User.id == SleepSession.user_id
-    ).filter(
-        SleepSession.end_time.isnot(None),
-        SleepSession.quality_score.isnot(None)
-    ).group_by(
-        User.id, User.username
-    ).order_by(
-        func.avg(SleepSession.quality_score).desc()
-    ).limit(limit).all()
-    
-    # Convert to leaderboard entries
-    entries = []
-    user_rank = None
-    user_value = None
-    
-    for rank, (user_id, username, avg_quality) in enumerate(leaderboard_data, start=1):
-        quality_score = avg_quality if avg_quality else 0
-        entries.append(LeaderboardEntry(
-            rank=rank,
-            username=username,
-            value=round(quality_score, 2),
-            label=f"{round(quality_score, 1)}/100"
-        ))
-        
-        if user_id == current_user.id:
-            user_rank = rank
-            user_value = round(quality_score, 2)
-    
-    # If current user is not in top entries, find their stats
-    if user_rank is None:
-        user_stats = db.query(
-            func.avg(SleepSession.quality_score)
-        ).filter(
-            SleepSession.user_id == current_user.id,
-            SleepSession.end_time.isnot(None),
-            SleepSession.quality_score.isnot(None)
-        ).scalar()
-        
-        if user_stats:
-            user_value = round(user_stats, 2)
-    
-    return LeaderboardResponse(
-        entries=entries,
-        user_rank=user_rank,
-        user_value=user_value
+    return await _indexed_response(
+        "quality", lambda index: index.top(limit), current_user, _quality_value, _quality_label
     )
 
 
 @router.get("/points/daily", response_model=LeaderboardResponse)
-def get_daily_points_leaderboard(
+async def get_daily_points_leaderboard(
     limit: int = 10,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get today's points leaderboard.
     """
     today = datetime.utcnow().date()
     
-    # Get today's points for each user
-    today_data = db.query(
+    # Get today's points for each user from the daily rollup
+    today_data = (await db.execute(select(
         User.id,
         User.username,
-        func.sum(SleepSession.points_earned).label('today_points')
+        UserDailyStats.total_points
     ).join(
-        SleepSession, User.id == SleepSession.user_id
-    ).filter(
-        func.date(SleepSession.start_time) == today,
-        SleepSession.end_time.isnot(None)
-    ).group_by(
-        User.id, User.username
+        UserDailyStats, User.id == UserDailyStats.user_id
+    ).where(
+        UserDailyStats.day == today
     ).order_by(
-        func.sum(SleepSession.points_earned).desc()
-    ).limit(limit).all()
+        UserDailyStats.total_points.desc()
+    ).limit(limit))).all()
     
     # Convert to entries
     entries = []
@@ -270,10 +242,10 @@ def get_daily_points_leaderboard(
 
 
 @router.get("/points/monthly", response_model=LeaderboardResponse)
-def get_monthly_points_leaderboard(
+async def get_monthly_points_leaderboard(
     limit: int = 10,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get this month's total points leaderboard.
@@ -281,21 +253,20 @@ def get_monthly_points_leaderboard(
     now = datetime.utcnow()
     month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     
-    # Get monthly points for each user
-    monthly_data = db.query(
+    # Get monthly points for each user from the daily rollup
+    monthly_data = (await db.execute(select(
         User.id,
         User.username,
-        func.sum(SleepSession.points_earned).label('monthly_points')
+        func.sum(UserDailyStats.total_points).label('monthly_points')
     ).join(
-        SleepSession, User.id == SleepSession.user_id
-    ).filter(
-        SleepSession.start_time >= month_start,
-        SleepSession.end_time.isnot(None)
+        UserDailyStats, User.id == UserDailyStats.user_id
+    ).where(
+        UserDailyStats.day >= month_start.date()
     ).group_by(
         User.id, User.username
     ).order_by(
-        func.sum(SleepSession.points_earned).desc()
-    ).limit(limit).all()
+        func.sum(UserDailyStats.total_points).desc()
+    ).limit(limit))).all()
     
     # Convert to entries
     entries = []
@@ -323,49 +294,45 @@ def get_monthly_points_leaderboard(
 
 
 @router.get("/points/alltime", response_model=LeaderboardResponse)
-def get_alltime_points_leaderboard(
+async def get_alltime_points_leaderboard(
     limit: int = 10,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async)
 ):
     """
     Get all-time total points leaderboard.
     """
-    # Get total points for each user
-    alltime_data = db.query(
-        User.id,
-        User.username,
-        func.sum(SleepSession.points_earned).label('total_points')
-    ).join(
-        SleepSession, User.id == SleepSession.user_id
-    ).filter(
-        SleepSession.end_time.isnot(None)
-    ).group_by(
-        User.id, User.username
-    ).order_by(
-        func.sum(SleepSession.points_earned).desc()
-    ).limit(limit).all()
-    
-    # Convert to entries
-    entries = []
-    user_rank = None
-    user_value = None
+    return await _indexed_response(
+        "points", lambda index: index.top(limit), current_user, _points_value, _points_label
+    )
+
+
+# Indexed leaderboards: metric name -> (index attribute, value, label formatters)
+INDEXED_METRICS = {
+    "points": ("points", _points_value, _points_label),
+    "sleep-hours": ("sleep_minutes", _hours_value, _hours_label),
+    "quality": ("quality", _quality_value, _quality_label),
+    "consistency": ("consistency", float, _count_label),
+}
+
+
+@router.get("/{metric}/around-me", response_model=LeaderboardResponse)
+async def get_leaderboard_around_me(
+    metric: str,
+    radius: int = 5,
+    current_user: User = Depends(get_current_user_async)
+):
+    """
+    Get the users ranked just above and below the current user.
+    Metric is one of: points, sleep-hours, quality, consistency (30 days).
+    """
+    if metric not in INDEXED_METRICS:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Unknown leaderboard metric: {metric}"
+        )
     
-    for rank, (user_id, username, points) in enumerate(alltime_data, start=1):
-        pts = int(points) if points else 0
-        entries.append(LeaderboardEntry(
-            rank=rank,
-            username=username,
-            value=float(pts),
-            label=f"{pts} pts"
-        ))
-        
-        if user_id == current_user.id:
-            user_rank = rank
-            user_value = float(pts)
+    attribute, format_value, format_label = INDEXED_METRICS[metric]
     
-    return LeaderboardResponse(
-        entries=entries,
-        user_rank=user_rank,
-        user_value=user_value
+    return await _indexed_response(
+        attribute, lambda index: index.around(current_user.id, radius), current_user, format_value, format_label
     )
@@ -8,29 +8,46 @@ Handles communication from Raspberry Pi devices:
 
 These endpoints are called by the RPi client, not the frontend.
 """
-from fastapi import APIRouter, Depends, HTTPException, status
+import json
+import os
+import struct
+import time
+
+from fastapi import APIRouter, Depends, HTTPException, Request, WebSocket, WebSocketDisconnect, status
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from datetime import datetime
 from typing import List
 
-from ..database import get_db
+from ..database import get_db, get_async_db, AsyncSessionLocal
 from ..models import (
-    User, SleepSession, SleepWindow,
-    RpiSessionStart, RpiSessionEnd, RpiWindowBatch, RpiHeartbeat
+    User, SleepSession,
+    RpiSessionStart, RpiSessionEnd, RpiWindowBatch, RpiWindowData, RpiHeartbeat
 )
-from ..sleep_computation import compute_sleep_metrics
+from ..ingest import IngestResult, ingest_windows, ingest_window_rows
+from ..live_metrics import apply_windows, finalize_metrics, session_metric_values
+from ..rollups import refresh_daily_stats, session_day_key
+from ..rank_index import leaderboards
+from .. import wire
+from ..middleware import InvalidGzipBody
+from ..auth import get_current_user_async
+from ..devices import devices, DEVICE_STALE_AFTER_SECONDS
+from ..live_stream import live_sessions, publish_session_event, window_events
 
 router = APIRouter(prefix="/api/rpi", tags=["RPi Device API"])
 
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+# Windows validated and inserted per transaction by the streaming endpoint
+STREAM_CHUNK_WINDOWS = int(os.getenv("STREAM_CHUNK_WINDOWS", "1000"))
+MAX_NDJSON_LINE_BYTES = 64 * 1024
+MAX_REPORTED_LINE_ERRORS = 20
 
-@router.post("/sessions/start", status_code=status.HTTP_201_CREATED)
-def rpi_start_session(
-    data: RpiSessionStart,
-    db: Session = Depends(get_db)
-):
-    """
-    RPi notifies backend that a new sleep session has started.
-    """
+# Binary WebSocket frames: u64 message seq, then a packed window batch
+WS_SEQ = struct.Struct("<Q")
+
+
+def _start_session(db: Session, data: RpiSessionStart) -> dict:
     # Verify user exists
     user = db.query(User).filter(User.id == data.user_id).first()
     if not user:
@@ -55,7 +72,10 @@ def rpi_start_session(
     if active:
         # Auto-close the previous session
         active.end_time = datetime.fromtimestamp(data.start_ts)
+        refresh_daily_stats(db, [session_day_key(active)])
         db.commit()
+        leaderboards.refresh_user(db, active.user_id)
+        publish_session_event("session_end", active)
     
     # Create new session
     session = SleepSession(
@@ -67,6 +87,7 @@ def rpi_start_session(
     db.add(session)
     db.commit()
     db.refresh(session)
+    publish_session_event("session_start", session)
     
     return {
         "status": "ok",
@@ -75,74 +96,189 @@ def rpi_start_session(
     }
 
 
+@router.post("/sessions/start", status_code=status.HTTP_201_CREATED)
+def rpi_start_session(
+    data: RpiSessionStart,
+    db: Session = Depends(get_db)
+):
+    """
+    RPi notifies backend that a new sleep session has started.
+    """
+    return _start_session(db, data)
+
+
+def _ingest_batch(db: Session, windows):
+    result = ingest_windows(db, windows)
+    apply_windows(db, result.inserted_rows)
+    return result, window_events(db, result.inserted_rows)
+
+
+def _ingest_packed_batch(db: Session, groups):
+    result = ingest_window_rows(db, groups)
+    apply_windows(db, result.inserted_rows)
+    return result, window_events(db, result.inserted_rows)
+
+
+async def _store_windows(db: AsyncSession, ingest, batch) -> IngestResult:
+    """Ingest and commit a batch, then push it to live session streams."""
+    result, events = await db.run_sync(ingest, batch)
+    await db.commit()
+    live_sessions.publish_all(events)
+    return result
+
+
+def _batch_response(result: IngestResult) -> dict:
+    return {
+        "status": "ok",
+        "windows_added": result.total_inserted,
+        "sessions": result.to_dict(),
+        "unknown_sessions": result.unknown_sessions
+    }
+
+
 @router.post("/sessions/windows")
-def rpi_add_windows(
+async def rpi_add_windows(
     data: RpiWindowBatch,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     RPi sends a batch of 30-second windows.
+    
+    Windows are written with a single bulk insert; re-sent windows are
+    reported as duplicates per session rather than inserted twice.
+    Each session's running metrics are updated in the same transaction.
     """
-    if not data.windows:
-        return {"status": "ok", "windows_added": 0}
-    
-    # Group windows by session
-    windows_by_session = {}
-    for w in data.windows:
-        if w.session_id not in windows_by_session:
-            windows_by_session[w.session_id] = []
-        windows_by_session[w.session_id].append(w)
-    
-    total_added = 0
-    
-    for session_uuid, windows in windows_by_session.items():
-        # Find the session
-        session = db.query(SleepSession).filter(
-            SleepSession.session_uuid == session_uuid
-        ).first()
-        
-        if not session:
-            # Session not found - skip these windows
-            continue
-        
-        # Add windows
-        for w in windows:
-            # Check for duplicate (same session + ts_start)
-            existing = db.query(SleepWindow).filter(
-                SleepWindow.session_id == session.id,
-                SleepWindow.ts_start == w.ts_start
-            ).first()
-            
-            if existing:
-                continue
-            
-            window = SleepWindow(
-                session_id=session.id,
-                ts_start=w.ts_start,
-                ts_end=w.ts_end,
-                avg_distance=w.avg_distance,
-                movement_energy=w.movement_energy,
-                active_ratio=w.active_ratio,
-                state=w.state,
-                sample_count=w.sample_count
-            )
-            db.add(window)
-            total_added += 1
+    result = await _store_windows(db, _ingest_batch, data.windows)
     
-    db.commit()
+    return _batch_response(result)
+
+
+@router.post(
+    "/sessions/windows/packed",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {wire.CONTENT_TYPE: {"schema": {"type": "string", "format": "binary"}}}
+        }
+    }
+)
+async def rpi_add_windows_packed(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Same as /sessions/windows, with the batch in the packed columnar
+    format (see app/wire.py) instead of JSON. Decodes straight into
+    insert rows, skipping per-window validation objects.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type != wire.CONTENT_TYPE:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Expected Content-Type: {wire.CONTENT_TYPE}"
+        )
+    
+    try:
+        groups = wire.decode_windows(await request.body())
+    except wire.WireFormatError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    result = await _store_windows(db, _ingest_packed_batch, groups)
     
-    return {"status": "ok", "windows_added": total_added}
+    return _batch_response(result)
 
 
-@router.post("/sessions/end")
-def rpi_end_session(
-    data: RpiSessionEnd,
-    db: Session = Depends(get_db)
+@router.post(
+    "/sessions/windows/stream",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {NDJSON_CONTENT_TYPE: {"schema": {"type": "string"}}}
+        }
+    }
+)
+async def rpi_stream_windows(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    RPi notifies backend that a sleep session has ended.
-    Triggers computation of all metrics.
+    Streaming ingest for large backfills: one RpiWindowData JSON object
+    per line (NDJSON), read incrementally from the request body.
+    
+    Windows are validated and inserted STREAM_CHUNK_WINDOWS at a time,
+    each chunk in its own transaction, so memory stays flat however long
+    the stream is. Invalid lines are skipped and reported. Ingest is
+    idempotent, so an interrupted backfill can simply be re-sent.
     """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type != NDJSON_CONTENT_TYPE:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Expected Content-Type: {NDJSON_CONTENT_TYPE}"
+        )
+    
+    total = IngestResult()
+    chunk: List[RpiWindowData] = []
+    errors = []
+    invalid_lines = 0
+    line_number = 0
+    chunks = 0
+    
+    def parse(line: bytes):
+        nonlocal invalid_lines
+        try:
+            chunk.append(RpiWindowData.model_validate_json(line))
+        except ValidationError as e:
+            invalid_lines += 1
+            if len(errors) < MAX_REPORTED_LINE_ERRORS:
+                errors.append({"line": line_number, "error": e.errors(include_url=False)[0]["msg"]})
+    
+    async def flush():
+        nonlocal chunk, chunks
+        result = await _store_windows(db, _ingest_batch, chunk)
+        total.merge(result)
+        chunk = []
+        chunks += 1
+    
+    buffer = b""
+    try:
+        async for data in request.stream():
+            buffer += data
+            *lines, buffer = buffer.split(b"\n")
+            if len(buffer) > MAX_NDJSON_LINE_BYTES:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Line {line_number + len(lines) + 1} exceeds {MAX_NDJSON_LINE_BYTES} bytes"
+                )
+            for line in lines:
+                line_number += 1
+                if line.strip():
+                    parse(line)
+                if len(chunk) >= STREAM_CHUNK_WINDOWS:
+                    await flush()
+    except InvalidGzipBody as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"{e} after line {line_number}; {total.total_inserted} windows were stored"
+        )
+    
+    if buffer.strip():
+        line_number += 1
+        parse(buffer)
+    if chunk:
+        await flush()
+    
+    response = _batch_response(total)
+    response.update({
+        "lines": line_number,
+        "chunks": chunks,
+        "invalid_lines": invalid_lines,
+        "errors": errors
+    })
+    return response
+
+
+def _end_session(db: Session, data: RpiSessionEnd) -> dict:
     # Find the session
     session = db.query(SleepSession).filter(
         SleepSession.session_uuid == data.session_id
@@ -166,54 +302,18 @@ def rpi_end_session(
     # Set end time
     session.end_time = datetime.fromtimestamp(data.end_ts)
     
-    # Get all windows for this session
-    windows = db.query(SleepWindow).filter(
-        SleepWindow.session_id == session.id
-    ).order_by(SleepWindow.ts_start).all()
-    
-    # Convert to dict for computation
-    window_dicts = [
-        {
-            "ts_start": w.ts_start,
-            "ts_end": w.ts_end,
-            "avg_distance": w.avg_distance,
-            "movement_energy": w.movement_energy,
-            "active_ratio": w.active_ratio,
-            "state": w.state
-        }
-        for w in windows
-    ]
-    
-    # Compute metrics
-    metrics = compute_sleep_metrics(
-        windows=window_dicts,
-        session_start_ts=session.start_time.timestamp(),
-        session_end_ts=data.end_ts
-    )
+    # Compute metrics from the running accumulator
+    metrics = finalize_metrics(db, session, data.end_ts)
     
     # Update session with computed values
-    session.duration_minutes = metrics.total_minutes
-    session.quality_score = metrics.quality_score
-    session.points_earned = metrics.points_earned
-    session.awakenings_count = metrics.awakenings_count
-    session.restless_minutes = metrics.moving_minutes
-    session.still_minutes = metrics.still_minutes
-    session.out_of_bed_minutes = metrics.out_of_bed_minutes
-    session.deep_estimate_minutes = metrics.deep_estimate_minutes
-    session.rem_estimate_minutes = metrics.rem_estimate_minutes
-    session.core_estimate_minutes = metrics.core_estimate_minutes
-    
-    # Calculate sleep onset time
-    if metrics.sleep_onset_offset_minutes > 0:
-        from datetime import timedelta
-        session.sleep_onset_time = session.start_time + timedelta(
-            minutes=metrics.sleep_onset_offset_minutes
-        )
-    else:
-        session.sleep_onset_time = session.start_time
+    for column, value in session_metric_values(metrics, session.start_time).items():
+        setattr(session, column, value)
     
+    refresh_daily_stats(db, [session_day_key(session)])
     db.commit()
     db.refresh(session)
+    leaderboards.refresh_user(db, session.user_id)
+    publish_session_event("session_end", session)
     
     return {
         "status": "ok",
@@ -225,19 +325,167 @@ def rpi_end_session(
     }
 
 
-@router.post("/heartbeat")
-def rpi_heartbeat(
-    data: RpiHeartbeat,
+@router.post("/sessions/end")
+def rpi_end_session(
+    data: RpiSessionEnd,
     db: Session = Depends(get_db)
 ):
     """
-    RPi sends periodic heartbeat.
-    Used for device health monitoring.
+    RPi notifies backend that a sleep session has ended.
+    Finalises metrics from the session's running accumulator.
     """
-    # For now, just acknowledge
-    # Could store device status for monitoring dashboard
+    return _end_session(db, data)
+
+
+def _heartbeat_response(data: RpiHeartbeat) -> dict:
+    # Recorded in memory; flushed to the devices table in batches
+    device = devices.record_heartbeat(data)
     return {
         "status": "ok",
         "timestamp": datetime.utcnow().isoformat(),
-        "ack_session": data.session_id
+        "ack_session": data.session_id,
+        "device_id": device.device_id
     }
+
+
+@router.post("/heartbeat")
+def rpi_heartbeat(data: RpiHeartbeat):
+    """
+    RPi sends periodic heartbeat.
+    Used for device health monitoring (see /fleet).
+    """
+    return _heartbeat_response(data)
+
+
+@router.get("/fleet")
+async def fleet_status(
+    stale_after: float = DEVICE_STALE_AFTER_SECONDS,
+    current_user: User = Depends(get_current_user_async)
+):
+    """
+    The current user's devices that have stopped sending heartbeats
+    (stale) or are holding an upload backlog, from the in-memory device
+    registry. Cost grows with the user's devices, not the fleet size or
+    history.
+    """
+    return devices.fleet_status(stale_after, user_id=current_user.id)
+
+
+@router.get("/devices/{device_id}")
+async def device_status(
+    device_id: str,
+    current_user: User = Depends(get_current_user_async)
+):
+    """Last known status of one of the current user's devices."""
+    device = devices.get(device_id)
+    # Other users' devices are indistinguishable from unknown ones
+    if device is None or device.user_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Device {device_id} not found"
+        )
+    return device.to_dict(time.time())
+
+
+# Sequenced text messages: type -> (payload model, sync handler)
+WS_SESSION_HANDLERS = {
+    "session_start": (RpiSessionStart, _start_session),
+    "session_end": (RpiSessionEnd, _end_session)
+}
+
+
+def _ws_rejected(seq: int, error) -> dict:
+    """Ack for a message that can never be stored, so the device drops it."""
+    return {"type": "ack", "seq": seq, "rejected": True, "error": error}
+
+
+async def _handle_ws_windows(frame: bytes) -> dict:
+    (seq,) = WS_SEQ.unpack_from(frame)
+    try:
+        groups = wire.decode_windows(frame[WS_SEQ.size:])
+    except wire.WireFormatError as e:
+        return _ws_rejected(seq, str(e))
+    
+    async with AsyncSessionLocal() as db:
+        result = await _store_windows(db, _ingest_packed_batch, groups)
+    
+    return {"type": "ack", "seq": seq, **_batch_response(result)}
+
+
+async def _handle_ws_text(message: dict) -> dict:
+    kind = message.pop("type", None)
+    if kind == "heartbeat":
+        try:
+            return {"type": "heartbeat", **_heartbeat_response(RpiHeartbeat.model_validate(message))}
+        except ValidationError as e:
+            return {"type": "heartbeat", "status": "error", "error": e.errors(include_url=False)[0]["msg"]}
+    
+    seq = message.pop("seq")
+    if kind not in WS_SESSION_HANDLERS:
+        return _ws_rejected(seq, f"Unknown message type: {kind}")
+    model, handler = WS_SESSION_HANDLERS[kind]
+    try:
+        data = model.model_validate(message)
+    except ValidationError as e:
+        return _ws_rejected(seq, e.errors(include_url=False)[0]["msg"])
+    
+    async with AsyncSessionLocal() as db:
+        try:
+            result = await db.run_sync(handler, data)
+        except HTTPException as e:
+            if e.status_code >= 500:
+                raise
+            return _ws_rejected(seq, e.detail)
+    
+    return {"type": "ack", "seq": seq, **result}
+
+
+@router.websocket("/ws")
+async def rpi_websocket(websocket: WebSocket):
+    """
+    Persistent ingest channel: session events, window batches and
+    heartbeats as framed messages over one connection, instead of one
+    HTTP request each.
+    
+    - Text frames are JSON: {"type": "session_start" | "session_end",
+      "seq": n, ...RpiSessionStart / RpiSessionEnd fields}, or
+      {"type": "heartbeat", ...RpiHeartbeat fields} (not sequenced).
+    - Binary frames are window batches: u64 seq, then a packed batch
+      (see app/wire.py).
+    
+    Messages are handled in order and each sequenced one is answered
+    with {"type": "ack", "seq": n}, which is cumulative: everything the
+    device sent up to n is stored. Messages that can never succeed
+    (invalid, unknown user or session) are acked with "rejected": true,
+    so the device drops them instead of retrying. If storing fails the
+    socket is closed without an ack; the device reconnects and resends
+    from its last ack, which is safe because every handler is idempotent.
+    
+    Each message uses its own short-lived DB session, so idle
+    connections hold no pooled database connection.
+    """
+    await websocket.accept()
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            
+            if message.get("bytes") is not None:
+                if len(message["bytes"]) < WS_SEQ.size:
+                    await websocket.close(code=1003, reason="Binary frame too short")
+                    return
+                reply = await _handle_ws_windows(message["bytes"])
+            else:
+                try:
+                    payload = json.loads(message["text"])
+                    if payload.get("type") != "heartbeat" and not isinstance(payload.get("seq"), int):
+                        raise ValueError("missing seq")
+                except (ValueError, AttributeError):
+                    await websocket.close(code=1003, reason="Malformed message")
+                    return
+                reply = await _handle_ws_text(payload)
+            
+            await websocket.send_json(reply)
+    except WebSocketDisconnect:
+        return
@@ -1,19 +1,35 @@
+import asyncio
+import json
+
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
 from datetime import datetime, date, timedelta
 from typing import List, Optional
 
-from ..database import get_db
+from ..database import get_db, get_async_db, AsyncSessionLocal
 from ..models import (
     User, SleepSession, SleepSessionCreate, SleepSessionResponse,
-    SleepSessionEnd, SleepWindow, SleepSummaryResponse, SleepInterval,
-    SleepStageEstimates, DaySleepResponse
+    SleepSessionEnd, SleepSummaryResponse, SleepInterval,
+    SleepStageEstimates, DaySleepResponse, UserDailyStats
 )
-from ..auth import get_current_user
-from ..sleep_computation import generate_intervals
+from ..auth import get_current_user, get_current_user_async, get_current_user_stream
+from ..columnar_metrics import merged_intervals
+from ..compaction import load_window_columns
+from ..timeline import load_timelines
+from ..live_metrics import live_session_response
+from ..rollups import refresh_daily_stats, session_day_key
+from ..rank_index import leaderboards
+from ..rank_snapshots import rank_changes
+from ..live_stream import RESYNC, live_sessions, publish_session_event, snapshot
 
 router = APIRouter(prefix="/api/sleep", tags=["Sleep Tracking"])
 
+# Comment lines sent on idle live streams so proxies keep them open
+LIVE_KEEPALIVE_SECONDS = 15
+
 
 @router.post("/start", response_model=SleepSessionResponse, status_code=status.HTTP_201_CREATED)
 def start_sleep_session(
@@ -45,6 +61,7 @@ def start_sleep_session(
     db.add(new_session)
     db.commit()
     db.refresh(new_session)
+    publish_session_event("session_start", new_session)
     
     return new_session
 
@@ -84,8 +101,11 @@ def end_sleep_session(
     if end_data.notes:
         active_session.notes = end_data.notes
     
+    refresh_daily_stats(db, [session_day_key(active_session)])
     db.commit()
     db.refresh(active_session)
+    leaderboards.refresh_user(db, current_user.id)
+    publish_session_event("session_end", active_session)
     
     return active_session
 
@@ -114,29 +134,95 @@ def get_current_session(
 ):
     """
     Get the current active sleep session if one exists.
+    For RPi sessions, metrics are live partial values up to the latest window.
     """
     active_session = db.query(SleepSession).filter(
         SleepSession.user_id == current_user.id,
         SleepSession.end_time.is_(None)
     ).first()
     
-    return active_session
+    if not active_session:
+        return None
+    
+    return live_session_response(active_session)
+
+
+def _active_session_snapshot(db: Session, user_id: int) -> dict:
+    active_session = db.query(SleepSession).options(
+        selectinload(SleepSession.accumulator)
+    ).filter(
+        SleepSession.user_id == user_id,
+        SleepSession.end_time.is_(None)
+    ).first()
+    return snapshot(active_session)
+
+
+async def _live_snapshot(user_id: int) -> dict:
+    async with AsyncSessionLocal() as db:
+        return await db.run_sync(_active_session_snapshot, user_id)
+
+
+def _sse(event: dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
+
+
+async def _live_events(user_id: int):
+    subscription = live_sessions.subscribe(user_id)
+    try:
+        # Subscribed first, so nothing published after the snapshot is missed
+        yield _sse(await _live_snapshot(user_id))
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.get(), LIVE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if event is RESYNC:
+                event = await _live_snapshot(user_id)
+            yield _sse(event)
+    finally:
+        live_sessions.unsubscribe(subscription)
+
+
+@router.get("/live")
+async def live_session_stream(current_user: User = Depends(get_current_user_stream)):
+    """
+    Server-Sent Events stream of the current user's active session.
+    
+    Opens with a `snapshot` event (the same session as /current, or
+    null), then pushes `windows` events as the RPi uploads windows (new
+    windows, latest state and the session with live partial metrics),
+    plus `session_start` / `session_end`. A `snapshot` is re-sent if the
+    client falls behind. Replaces polling /current.
+    
+    EventSource clients can pass the token as ?access_token=.
+    """
+    return StreamingResponse(
+        _live_events(current_user.id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def _refresh_leaderboards():
+    """Rebuild a stale rank index in a worker thread, not on the event loop."""
+    await asyncio.to_thread(leaderboards.ensure_fresh)
 
 
 @router.get("/latest/summary", response_model=SleepSummaryResponse)
-def get_latest_session_summary(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+async def get_latest_session_summary(
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get the full summary of the latest completed sleep session.
     Includes all metrics, intervals, and stage estimates.
     """
     # Get latest completed session
-    session = db.query(SleepSession).filter(
+    session = await db.scalar(select(SleepSession).where(
         SleepSession.user_id == current_user.id,
         SleepSession.end_time.isnot(None)
-    ).order_by(SleepSession.end_time.desc()).first()
+    ).order_by(SleepSession.end_time.desc()).limit(1))
     
     if not session:
         raise HTTPException(
@@ -144,22 +230,23 @@ def get_latest_session_summary(
             detail="No completed sleep sessions found"
         )
     
-    return _build_session_summary(session, current_user, db)
+    await _refresh_leaderboards()
+    return await db.run_sync(lambda sync_db: _build_session_summary(session, current_user, sync_db))
 
 
 @router.get("/sessions/{session_uuid}/summary", response_model=SleepSummaryResponse)
-def get_session_summary(
+async def get_session_summary(
     session_uuid: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get the full summary of a specific sleep session.
     """
-    session = db.query(SleepSession).filter(
+    session = await db.scalar(select(SleepSession).where(
         SleepSession.session_uuid == session_uuid,
         SleepSession.user_id == current_user.id
-    ).first()
+    ).limit(1))
     
     if not session:
         raise HTTPException(
@@ -167,14 +254,15 @@ def get_session_summary(
             detail="Session not found"
         )
     
-    return _build_session_summary(session, current_user, db)
+    await _refresh_leaderboards()
+    return await db.run_sync(lambda sync_db: _build_session_summary(session, current_user, sync_db))
 
 
 @router.get("/day/{day_date}", response_model=DaySleepResponse)
-def get_sleep_by_day(
+async def get_sleep_by_day(
     day_date: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get all sleep data for a specific day (YYYY-MM-DD format).
@@ -182,8 +270,6 @@ def get_sleep_by_day(
     
     A sleep session belongs to a day based on when it STARTED.
     """
-    from sqlalchemy import func
-    
     try:
         target_date = datetime.strptime(day_date, "%Y-%m-%d").date()
     except ValueError:
@@ -192,54 +278,17 @@ def get_sleep_by_day(
             detail="Invalid date format. Use YYYY-MM-DD"
         )
     
-    # Get all completed sessions that started on this day
-    sessions = db.query(SleepSession).filter(
-        func.date(SleepSession.start_time) == target_date,
-        SleepSession.end_time.isnot(None)
-    ).order_by(SleepSession.start_time).all()
-    
-    # Build summaries for each session
-    session_summaries = [
-        _build_session_summary(session, current_user, db)
-        for session in sessions
-    ]
-    
-    # Calculate daily aggregates
-    total_hours = sum(s.hours_slept for s in session_summaries)
-    total_points = sum(s.points_earned for s in session_summaries)
-    avg_quality = int(sum(s.sleep_quality for s in session_summaries) / len(session_summaries)) if session_summaries else 0
-    total_awakenings = sum(s.awakenings_count for s in session_summaries)
-    
-    # Get points delta vs yesterday
-    yesterday = target_date - timedelta(days=1)
-    yesterday_points = db.query(func.sum(SleepSession.points_earned)).filter(
-        SleepSession.user_id == current_user.id,
-        func.date(SleepSession.start_time) == yesterday
-    ).scalar() or 0
-    
-    points_delta = total_points - yesterday_points
-    
-    # Get current rank
-    current_rank = _get_user_rank(current_user.id, db)
-    
-    return DaySleepResponse(
-        date=day_date,
-        sessions=session_summaries,
-        total_hours_slept=round(total_hours, 2),
-        total_points_earned=total_points,
-        average_quality=avg_quality,
-        total_awakenings=total_awakenings,
-        points_delta_vs_yesterday=points_delta,
-        current_rank=current_rank
-    )
+    await _refresh_leaderboards()
+    days = await db.run_sync(_build_day_responses, target_date, target_date, current_user)
+    return days[0]
 
 
 @router.get("/days", response_model=List[DaySleepResponse])
-def get_sleep_by_date_range(
+async def get_sleep_by_date_range(
     start_date: str = Query(..., description="Start date (YYYY-MM-DD)"),
     end_date: str = Query(..., description="End date (YYYY-MM-DD)"),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get sleep data for a date range. Returns a list of daily summaries.
@@ -267,33 +316,126 @@ def get_sleep_by_date_range(
             detail="Date range cannot exceed 31 days"
         )
     
+    await _refresh_leaderboards()
+    return await db.run_sync(_build_day_responses, start, end, current_user)
+
+
+def _build_day_responses(
+    db: Session,
+    start: date,
+    end: date,
+    current_user: User
+) -> List[DaySleepResponse]:
+    """
+    Build daily summaries for every day in [start, end].
+    
+    Uses a fixed number of queries regardless of range length: sessions,
+    their windows, the user's daily points, the rank and the rank
+    snapshots are each fetched once and the per-day deltas derived in
+    memory.
+    """
+    # Completed sessions that started in the range (a session belongs to
+    # the day it STARTED)
+    sessions = db.query(SleepSession).filter(
+        SleepSession.start_day.between(start, end),
+        SleepSession.end_time.isnot(None)
+    ).order_by(SleepSession.start_time).all()
+    
+    intervals_by_session = _load_intervals([s.id for s in sessions], db)
+    daily_points = _get_daily_points(current_user.id, start - timedelta(days=1), end, db)
+    current_rank = _get_user_rank(current_user.id, db)
+    day_rank_changes = rank_changes(
+        db, current_user.id, (start + timedelta(days=i) for i in range((end - start).days + 1)), current_rank
+    )
+    
+    sessions_by_day = {}
+    for session in sessions:
+        sessions_by_day.setdefault(session.start_time.date(), []).append(session)
+    
     results = []
     current_date = start
     
     while current_date <= end:
-        day_str = current_date.strftime("%Y-%m-%d")
-        day_response = get_sleep_by_day(day_str, current_user, db)
-        results.append(day_response)
+        yesterday_points = daily_points.get(current_date - timedelta(days=1), 0)
+        
+        # Build summaries for each session
+        session_summaries = []
+        for session in sessions_by_day.get(current_date, []):
+            session_date = session.start_time.date()
+            points_delta = (
+                daily_points.get(session_date, 0)
+                - daily_points.get(session_date - timedelta(days=1), 0)
+            )
+            session_summaries.append(_summary_response(
+                session,
+                intervals=intervals_by_session.get(session.id, []),
+                points_delta=points_delta,
+                rank_change=day_rank_changes[session_date],
+                current_rank=current_rank
+            ))
+        
+        # Calculate daily aggregates
+        total_hours = sum(s.hours_slept for s in session_summaries)
+        total_points = sum(s.points_earned for s in session_summaries)
+        avg_quality = int(sum(s.sleep_quality for s in session_summaries) / len(session_summaries)) if session_summaries else 0
+        total_awakenings = sum(s.awakenings_count for s in session_summaries)
+        
+        results.append(DaySleepResponse(
+            date=current_date.strftime("%Y-%m-%d"),
+            sessions=session_summaries,
+            total_hours_slept=round(total_hours, 2),
+            total_points_earned=total_points,
+            average_quality=avg_quality,
+            total_awakenings=total_awakenings,
+            points_delta_vs_yesterday=total_points - yesterday_points,
+            current_rank=current_rank,
+            rank_change=day_rank_changes[current_date]
+        ))
         current_date += timedelta(days=1)
     
     return results
 
 
-def _get_user_rank(user_id: int, db: Session) -> int:
-    """Get user's current rank by total points."""
-    from sqlalchemy import func
-    
-    user_totals = db.query(
-        SleepSession.user_id,
-        func.sum(SleepSession.points_earned).label("total")
-    ).group_by(SleepSession.user_id).order_by(
-        func.sum(SleepSession.points_earned).desc()
+def _get_daily_points(user_id: int, first_day: date, last_day: date, db: Session) -> dict:
+    """User's total points per start day in [first_day, last_day], from the rollup."""
+    rows = db.query(UserDailyStats.day, UserDailyStats.total_points).filter(
+        UserDailyStats.user_id == user_id,
+        UserDailyStats.day >= first_day,
+        UserDailyStats.day <= last_day
     ).all()
     
-    for i, (uid, _) in enumerate(user_totals, 1):
-        if uid == user_id:
-            return i
-    return 1
+    return {day: points for day, points in rows}
+
+
+def _load_intervals(session_ids: List[int], db: Session) -> dict:
+    """
+    Merged display intervals for each session, from the stored timelines.
+    Sessions without one (ended before timelines were kept) are merged
+    from their windows, compacted or not.
+    """
+    if not session_ids:
+        return {}
+    
+    intervals = load_timelines(db, session_ids)
+    missing = [session_id for session_id in session_ids if session_id not in intervals]
+    
+    if missing:
+        for session_id, columns in load_window_columns(db, missing).items():
+            intervals[session_id] = merged_intervals(columns)
+    
+    return {
+        session_id: [SleepInterval(start=i["start"], end=i["end"], state=i["state"]) for i in session_intervals]
+        for session_id, session_intervals in intervals.items()
+    }
+
+
+def _get_user_rank(user_id: int, db: Session) -> int:
+    """
+    Get user's current rank by total points. Callers refresh the index
+    first, off the event loop (see _refresh_leaderboards).
+    """
+    with leaderboards.lock:
+        return leaderboards.points.rank(user_id) or 1
 
 
 def _build_session_summary(
@@ -304,30 +446,7 @@ def _build_session_summary(
     """
     Build a complete session summary response.
     """
-    # Get windows for intervals
-    windows = db.query(SleepWindow).filter(
-        SleepWindow.session_id == session.id
-    ).order_by(SleepWindow.ts_start).all()
-    
-    window_dicts = [
-        {
-            "ts_start": w.ts_start,
-            "ts_end": w.ts_end,
-            "state": w.state
-        }
-        for w in windows
-    ]
-    
-    # Generate merged intervals
-    intervals_raw = generate_intervals(window_dicts)
-    intervals = [
-        SleepInterval(
-            start=i["start"],
-            end=i["end"],
-            state=i["state"]
-        )
-        for i in intervals_raw
-    ]
+    intervals = _load_intervals([session.id], db).get(session.id, [])
     
     # Calculate deltas vs yesterday
     points_delta, rank_change, current_rank = _calculate_deltas(
@@ -336,6 +455,19 @@ def _build_session_summary(
         db=db
     )
     
+    return _summary_response(session, intervals, points_delta, rank_change, current_rank)
+
+
+def _summary_response(
+    session: SleepSession,
+    intervals: List[SleepInterval],
+    points_delta: int,
+    rank_change: int,
+    current_rank: int
+) -> SleepSummaryResponse:
+    """
+    Assemble a SleepSummaryResponse from a session and precomputed parts.
+    """
     # Build stage estimates
     stages = SleepStageEstimates(
         deep_minutes=session.deep_estimate_minutes,
@@ -368,42 +500,19 @@ def _calculate_deltas(user_id: int, session_date, db: Session):
     """
     Calculate points delta vs yesterday and rank change.
     """
-    from datetime import timedelta
-    from sqlalchemy import func
-    
     yesterday = session_date - timedelta(days=1)
     
-    # Get today's total points
-    today_points = db.query(func.sum(SleepSession.points_earned)).filter(
-        SleepSession.user_id == user_id,
-        func.date(SleepSession.start_time) == session_date
-    ).scalar() or 0
-    
-    # Get yesterday's total points
-    yesterday_points = db.query(func.sum(SleepSession.points_earned)).filter(
-        SleepSession.user_id == user_id,
-        func.date(SleepSession.start_time) == yesterday
-    ).scalar() or 0
+    # Today's and yesterday's total points from the daily rollup
+    daily_points = _get_daily_points(user_id, yesterday, session_date, db)
+    today_points = daily_points.get(session_date, 0)
+    yesterday_points = daily_points.get(yesterday, 0)
     
     points_delta = today_points - yesterday_points
     
     # Calculate current rank (by total points)
-    # Get all users' total points
-    user_totals = db.query(
-        SleepSession.user_id,
-        func.sum(SleepSession.points_earned).label("total")
-    ).group_by(SleepSession.user_id).order_by(
-        func.sum(SleepSession.points_earned).desc()
-    ).all()
-    
-    current_rank = 1
-    for i, (uid, _) in enumerate(user_totals, 1):
-        if uid == user_id:
-            current_rank = i
-            break
+    current_rank = _get_user_rank(user_id, db)
     
-    # For rank change, we'd need historical data
-    # For now, return 0 (no change) as placeholder
-    rank_change = 0
+    # Rank movement over the session's day, from the daily snapshots
+    rank_change = rank_changes(db, user_id, [session_date], current_rank)[session_date]
     
     return points_delta, rank_change, current_rank
@@ -1,29 +1,30 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
 from typing import List
 
-from ..database import get_db
+from ..database import get_async_db
 from ..models import (
     User, UserCreate, UserResponse, UserLogin, UserUpdate, Token
 )
 from ..auth import (
-    get_password_hash, authenticate_user, create_access_token,
-    get_current_user, get_user_by_username, get_user_by_email,
-    ACCESS_TOKEN_EXPIRE_MINUTES
+    authenticate_user_async, create_access_token,
+    get_current_user_async, get_user_by_username, get_user_by_email,
+    principal_cache, ACCESS_TOKEN_EXPIRE_MINUTES
 )
+from ..passwords import password_hasher
 
 router = APIRouter(prefix="/api/users", tags=["Users"])
 
 
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-def register_user(user: UserCreate, db: Session = Depends(get_db)):
+async def register_user(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """
     Register a new user.
     """
     # Check if username already exists
-    db_user = get_user_by_username(db, user.username)
+    db_user = await db.run_sync(get_user_by_username, user.username)
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -31,7 +32,7 @@ def register_user(user: UserCreate, db: Session = Depends(get_db)):
         )
     
     # Check if email already exists
-    db_user = get_user_by_email(db, user.email)
+    db_user = await db.run_sync(get_user_by_email, user.email)
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -39,7 +40,7 @@ def register_user(user: UserCreate, db: Session = Depends(get_db)):
         )
     
     # Create new user
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await password_hasher.hash(user.password)
     db_user = User(
         username=user.username,
         email=user.email,
@@ -47,18 +48,18 @@ def register_user(user: UserCreate, db: Session = Depends(get_db)):
         hashed_password=hashed_password
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     
     return db_user
 
 
 @router.post("/login", response_model=Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
     """
     Login with username and password to get access token.
     """
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user_async(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -66,6 +67,11 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    if db.dirty:
+        # Password hash was upgraded to the current bcrypt cost
+        await db.commit()
+        principal_cache.invalidate(user.username)
+    
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": user.username}, expires_delta=access_token_expires
@@ -75,7 +81,7 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
 
 
 @router.get("/me", response_model=UserResponse)
-def get_current_user_profile(current_user: User = Depends(get_current_user)):
+async def get_current_user_profile(current_user: User = Depends(get_current_user_async)):
     """
     Get current user's profile.
     """
@@ -83,17 +89,17 @@ def get_current_user_profile(current_user: User = Depends(get_current_user)):
 
 
 @router.put("/me", response_model=UserResponse)
-def update_user_profile(
+async def update_user_profile(
     user_update: UserUpdate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Update current user's profile.
     """
     if user_update.email:
         # Check if email is already taken by another user
-        existing_user = get_user_by_email(db, user_update.email)
+        existing_user = await db.run_sync(get_user_by_email, user_update.email)
         if existing_user and existing_user.id != current_user.id:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -105,9 +111,10 @@ def update_user_profile(
         current_user.full_name = user_update.full_name
     
     if user_update.password:
-        current_user.hashed_password = get_password_hash(user_update.password)
+        current_user.hashed_password = await password_hasher.hash(user_update.password)
     
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
+    await db.refresh(current_user)
+    principal_cache.invalidate(current_user.username)
     
     return current_user
@@ -9,6 +9,10 @@ from typing import List, Tuple, Optional
 from dataclasses import dataclass
 
 
+ONSET_THRESHOLD_MINUTES = 10.0  # Consecutive stillness that marks sleep onset
+AWAKENING_MIN_MINUTES = 1.0  # Minimum awake run counted as an awakening
+
+
 @dataclass
 class SleepMetrics:
     """Computed sleep metrics from window data."""
@@ -26,6 +30,147 @@ class SleepMetrics:
     core_estimate_minutes: float
 
 
+@dataclass
+class SleepAccumulator:
+    """
+    Running per-session state for incremental metric computation.
+    
+    Windows must be fed in ts_start order. Replays the same per-window
+    logic as compute_sleep_metrics, so totals, awakenings and onset match
+    the batch path exactly. Stage estimates need the final still-energy
+    average and are computed separately at finalisation.
+    """
+    window_count: int = 0
+    last_ts_start: Optional[float] = None
+    last_ts_end: Optional[float] = None
+    
+    # State totals (minutes)
+    still_minutes: float = 0.0
+    moving_minutes: float = 0.0
+    awake_minutes: float = 0.0
+    out_of_bed_minutes: float = 0.0
+    
+    # Awakenings: closed runs plus the currently open run
+    awakenings_count: int = 0
+    in_awakening: bool = False
+    awakening_minutes: float = 0.0
+    
+    # Sleep onset progress
+    onset_ts: Optional[float] = None
+    onset_run_start_ts: Optional[float] = None
+    onset_run_minutes: float = 0.0
+    
+    # Movement energy of still windows (for stage estimates)
+    still_energy_sum: float = 0.0
+    still_window_count: int = 0
+    
+    def accepts(self, window: dict) -> bool:
+        """True if the window can be appended without breaking ordering."""
+        return self.last_ts_start is None or window["ts_start"] > self.last_ts_start
+    
+    def update(self, window: dict):
+        """Fold one window into the running state."""
+        duration = (window["ts_end"] - window["ts_start"]) / 60.0
+        state = window.get("state", "still")
+        
+        self.window_count += 1
+        self.last_ts_start = window["ts_start"]
+        self.last_ts_end = window["ts_end"]
+        
+        if state == "still":
+            self.still_minutes += duration
+            self.still_energy_sum += window.get("movement_energy", 0)
+            self.still_window_count += 1
+        elif state == "moving":
+            self.moving_minutes += duration
+        elif state == "awake":
+            self.awake_minutes += duration
+        elif state == "out_of_bed":
+            self.out_of_bed_minutes += duration
+        
+        if state in ("awake", "out_of_bed"):
+            if not self.in_awakening:
+                self.in_awakening = True
+                self.awakening_minutes = duration
+            else:
+                self.awakening_minutes += duration
+        else:
+            if self.in_awakening and self.awakening_minutes >= AWAKENING_MIN_MINUTES:
+                self.awakenings_count += 1
+            self.in_awakening = False
+            self.awakening_minutes = 0.0
+        
+        if self.onset_ts is None:
+            if state == "still":
+                if self.onset_run_start_ts is None:
+                    self.onset_run_start_ts = window["ts_start"]
+                self.onset_run_minutes += duration
+                
+                if self.onset_run_minutes >= ONSET_THRESHOLD_MINUTES:
+                    self.onset_ts = self.onset_run_start_ts
+            else:
+                self.onset_run_minutes = 0.0
+                self.onset_run_start_ts = None
+    
+    @property
+    def total_awakenings(self) -> int:
+        """Closed awakenings plus the open run if it already qualifies."""
+        if self.in_awakening and self.awakening_minutes >= AWAKENING_MIN_MINUTES:
+            return self.awakenings_count + 1
+        return self.awakenings_count
+    
+    @property
+    def still_energy_avg(self) -> float:
+        if not self.still_window_count:
+            return 0.0
+        return self.still_energy_sum / self.still_window_count
+    
+    def to_metrics(
+        self,
+        session_start_ts: float,
+        session_end_ts: float,
+        stages: Tuple[float, float, float] = (0.0, 0.0, 0.0)
+    ) -> SleepMetrics:
+        """
+        Build SleepMetrics from the running state.
+        
+        Args:
+            session_start_ts: Session start Unix timestamp
+            session_end_ts: Session end (or "now" for partial metrics)
+            stages: (deep, rem, core) minutes, see stage_thresholds()
+        """
+        if not self.window_count:
+            return _empty_metrics()
+        
+        onset_offset = 0.0
+        if self.onset_ts is not None:
+            onset_offset = (self.onset_ts - session_start_ts) / 60.0
+        
+        if self.still_minutes <= 0:
+            stages = (0.0, 0.0, 0.0)
+        
+        return _assemble_metrics(
+            session_start_ts=session_start_ts,
+            session_end_ts=session_end_ts,
+            still_minutes=self.still_minutes,
+            moving_minutes=self.moving_minutes,
+            awake_minutes=self.awake_minutes,
+            out_of_bed_minutes=self.out_of_bed_minutes,
+            awakenings_count=self.total_awakenings,
+            sleep_onset_offset=onset_offset,
+            stages=stages
+        )
+    
+    def stage_thresholds(self) -> Tuple[float, float]:
+        """
+        (deep, rem) movement-energy cut-offs for still windows, matching
+        _estimate_sleep_stages: energy < deep is deep, < rem is REM,
+        anything else core.
+        """
+        avg_energy = self.still_energy_avg
+        return (avg_energy * 0.5, avg_energy * 1.2)
+
+
 def compute_sleep_metrics(
     windows: List[dict],  # List of window dicts with state, ts_start, ts_end, movement_energy
     session_start_ts: float,
@@ -43,12 +188,7 @@ def compute_sleep_metrics(
         SleepMetrics with all computed values
     """
     if not windows:
-        return SleepMetrics(
-            total_minutes=0, still_minutes=0, moving_minutes=0,
-            awake_minutes=0, out_of_bed_minutes=0, awakenings_count=0,
-            sleep_onset_offset_minutes=0, quality_score=0, points_earned=0,
-            deep_estimate_minutes=0, rem_estimate_minutes=0, core_estimate_minutes=0
-        )
+        return _empty_metrics()
     
     # Categorize windows
     still_minutes = 0.0
@@ -69,15 +209,55 @@ def compute_sleep_metrics(
         elif state == "out_of_bed":
             out_of_bed_minutes += duration
     
-    total_minutes = (session_end_ts - session_start_ts) / 60.0
-    in_bed_minutes = total_minutes - out_of_bed_minutes
-    
     # Count awakenings (transitions into awake state lasting >= 1 minute)
     awakenings_count = _count_awakenings(windows)
     
     # Calculate sleep onset (first 10 consecutive minutes of stillness)
     sleep_onset_offset = _calculate_sleep_onset(windows, session_start_ts)
     
+    # Estimate sleep stages (movement-based heuristic only)
+    stages = _estimate_sleep_stages(windows, still_minutes)
+    
+    return _assemble_metrics(
+        session_start_ts=session_start_ts,
+        session_end_ts=session_end_ts,
+        still_minutes=still_minutes,
+        moving_minutes=moving_minutes,
+        awake_minutes=awake_minutes,
+        out_of_bed_minutes=out_of_bed_minutes,
+        awakenings_count=awakenings_count,
+        sleep_onset_offset=sleep_onset_offset,
+        stages=stages
+    )
+
+
+def _empty_metrics() -> SleepMetrics:
+    return SleepMetrics(
+        total_minutes=0, still_minutes=0, moving_minutes=0,
+        awake_minutes=0, out_of_bed_minutes=0, awakenings_count=0,
+        sleep_onset_offset_minutes=0, quality_score=0, points_earned=0,
+        deep_estimate_minutes=0, rem_estimate_minutes=0, core_estimate_minutes=0
+    )
+
+
+def _assemble_metrics(
+    session_start_ts: float,
+    session_end_ts: float,
+    still_minutes: float,
+    moving_minutes: float,
+    awake_minutes: float,
+    out_of_bed_minutes: float,
+    awakenings_count: int,
+    sleep_onset_offset: float,
+    stages: Tuple[float, float, float]
+) -> SleepMetrics:
+    """
+    Score and round per-state totals into SleepMetrics.
+    Shared by the batch and incremental computation paths.
+    """
+    total_minutes = (session_end_ts - session_start_ts) / 60.0
+    in_bed_minutes = total_minutes - out_of_bed_minutes
+    
     # Calculate quality score
     quality_score = _calculate_quality_score(
         total_minutes=in_bed_minutes,
@@ -94,8 +274,7 @@ def compute_sleep_metrics(
         quality_score=quality_score
     )
     
-    # Estimate sleep stages (movement-based heuristic only)
-    deep_est, rem_est, core_est = _estimate_sleep_stages(windows, still_minutes)
+    deep_est, rem_est, core_est = stages
     
     return SleepMetrics(
         total_minutes=round(total_minutes, 1),
@@ -132,13 +311,13 @@ def _count_awakenings(windows: List[dict]) -> int:
             else:
                 awakening_duration += duration
         else:
-            if in_awakening and awakening_duration >= 1.0:
+            if in_awakening and awakening_duration >= AWAKENING_MIN_MINUTES:
                 awakenings += 1
             in_awakening = False
             awakening_duration = 0.0
     
     # Count final awakening if session ended while awake
-    if in_awakening and awakening_duration >= 1.0:
+    if in_awakening and awakening_duration >= AWAKENING_MIN_MINUTES:
         awakenings += 1
     
     return awakenings
@@ -149,8 +328,6 @@ def _calculate_sleep_onset(windows: List[dict], session_start_ts: float) -> floa
     Find sleep onset: first point where there's 10 consecutive minutes of stillness.
     Returns offset in minutes from session start.
     """
-    ONSET_THRESHOLD_MINUTES = 10.0
-    
     consecutive_still = 0.0
     onset_start_ts = None
     
@@ -0,0 +1,165 @@
+"""
+Session Interval Timelines
+
+The merged display intervals of a session (see
+sleep_computation.generate_intervals), stored per session in a compact
+encoding. Summaries decode one small row instead of reloading, sorting
+and re-merging every window; the timeline is extended as windows are
+ingested, alongside the session's accumulator (see live_metrics).
+
+Timestamps are kept as integer microseconds, which is exactly what
+datetime.fromtimestamp resolves, so decoded intervals are identical to
+generate_intervals' output. Closed intervals are run-length packed, one
+run per interval:
+
+    u8 display state | zigzag varint start - previous end (µs)
+                     | zigzag varint end - start (µs)
+
+The first start is relative to 0. The last, still open interval is kept
+in columns, since new windows in the same state only move its end. A
+night with 100 state changes packs into roughly 900 bytes.
+"""
+import math
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy.orm import Session
+
+from .models import SleepSessionTimeline
+
+
+DISPLAY_STATES = ["sleeping", "moving", "awake"]
+
+# Window state -> index into DISPLAY_STATES, matching generate_intervals;
+# unrecognised states display as sleeping
+_DISPLAY_CODES: Dict[str, int] = {
+    "still": 0,
+    "moving": 1,
+    "awake": 2,
+    "out_of_bed": 2
+}
+
+
+def to_micros(ts: float) -> int:
+    """Unix timestamp to integer microseconds, rounded like datetime.fromtimestamp."""
+    frac, whole = math.modf(ts)
+    return int(whole) * 1_000_000 + round(frac * 1e6)
+
+
+def from_micros(us: int) -> datetime:
+    seconds, micros = divmod(us, 1_000_000)
+    return datetime.fromtimestamp(seconds).replace(microsecond=micros)
+
+
+def _write_varint(out: bytearray, value: int):
+    # Zigzag, so the rare negative delta (overlapping windows) stays small
+    value = value << 1 if value >= 0 else (-value << 1) - 1
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            break
+        shift += 7
+    if value & 1:
+        return -((value + 1) >> 1), pos
+    return value >> 1, pos
+
+
+def extend_timeline(row: SleepSessionTimeline, windows: Iterable[dict]):
+    """
+    Fold windows, in ts_start order and after every window already in
+    the timeline, into it.
+    """
+    packed = bytearray(row.packed or b"")
+    count = row.interval_count or 0
+    closed_end = row.closed_end_us or 0
+    state, start, end = row.open_state, row.open_start_us, row.open_end_us
+
+    for w in windows:
+        display = _DISPLAY_CODES.get(w.get("state", "still"), 0)
+        if display == state:
+            end = to_micros(w["ts_end"])
+            continue
+
+        if state is not None:
+            packed.append(state)
+            _write_varint(packed, start - closed_end)
+            _write_varint(packed, end - start)
+            count += 1
+            closed_end = end
+
+        state = display
+        start = to_micros(w["ts_start"])
+        end = to_micros(w["ts_end"])
+
+    row.packed = bytes(packed)
+    row.interval_count = count
+    row.closed_end_us = closed_end
+    row.open_state, row.open_start_us, row.open_end_us = state, start, end
+
+
+def rebuild_timeline(
+    db: Session,
+    session_id: int,
+    windows: Sequence[dict],
+    row: Optional[SleepSessionTimeline] = None
+) -> SleepSessionTimeline:
+    """Replace a session's timeline with one built from all of its windows (ts_start order)."""
+    if row is None:
+        row = SleepSessionTimeline(session_id=session_id)
+        db.add(row)
+
+    row.packed = b""
+    row.interval_count = 0
+    row.closed_end_us = 0
+    row.open_state = row.open_start_us = row.open_end_us = None
+    extend_timeline(row, windows)
+    return row
+
+
+def decode_timeline(row: SleepSessionTimeline) -> List[dict]:
+    """Intervals as generate_intervals returns them: {start, end, state}."""
+    intervals = []
+    data = row.packed or b""
+    pos = 0
+    end = 0
+    for _ in range(row.interval_count or 0):
+        state = data[pos]
+        delta, pos = _read_varint(data, pos + 1)
+        length, pos = _read_varint(data, pos)
+        start = end + delta
+        end = start + length
+        intervals.append({
+            "start": from_micros(start),
+            "end": from_micros(end),
+            "state": DISPLAY_STATES[state]
+        })
+
+    if row.open_state is not None:
+        intervals.append({
+            "start": from_micros(row.open_start_us),
+            "end": from_micros(row.open_end_us),
+            "state": DISPLAY_STATES[row.open_state]
+        })
+    return intervals
+
+
+def load_timelines(db: Session, session_ids: Sequence[int]) -> Dict[int, List[dict]]:
+    """Decoded timelines for the given sessions that have one, in one query."""
+    if not session_ids:
+        return {}
+
+    rows = db.query(SleepSessionTimeline).filter(
+        SleepSessionTimeline.session_id.in_(session_ids)
+    ).all()
+    return {row.session_id: decode_timeline(row) for row in rows}
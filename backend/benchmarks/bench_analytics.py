@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the aggregate analytics endpoints.
+
+Checks that GET /api/analytics/overview and /quality, which aggregate in
+one SQL query each, return the same JSON as the previous implementation
+(load every completed session and aggregate in Python) on random users,
+including empty and edge-case ones. Then times both for a user with
+10k completed sessions in a throwaway SQLite database.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_analytics [--sessions 10000] [--repeat 20]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+_db_dir = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_db_dir}/bench.db")
+os.environ.setdefault("DB_PROFILE", "basic")
+
+from app.database import SessionLocal, init_db  # noqa: E402
+from app.models import AnalyticsOverview, User, SleepSession  # noqa: E402
+from app.routers.analytics import get_analytics_overview, get_quality_metrics  # noqa: E402
+
+
+# ============= Previous implementation (reference) =============
+
+def orm_overview(current_user, db):
+    sessions = db.query(SleepSession).filter(
+        SleepSession.user_id == current_user.id,
+        SleepSession.end_time.isnot(None)
+    ).all()
+
+    if not sessions:
+        return AnalyticsOverview(
+            total_sleep_hours=0.0, average_sleep_duration=0.0, total_sessions=0,
+            average_quality_score=None, best_sleep_duration=None, worst_sleep_duration=None
+        )
+
+    total_minutes = sum(s.duration_minutes for s in sessions if s.duration_minutes)
+    average_duration = total_minutes / len(sessions)
+    quality_scores = [s.quality_score for s in sessions if s.quality_score is not None]
+    avg_quality = sum(quality_scores) / len(quality_scores) if quality_scores else None
+    durations = [s.duration_minutes for s in sessions if s.duration_minutes]
+    best_duration = max(durations) if durations else None
+    worst_duration = min(durations) if durations else None
+
+    return AnalyticsOverview(
+        total_sleep_hours=round(total_minutes / 60, 2),
+        average_sleep_duration=round(average_duration, 2),
+        total_sessions=len(sessions),
+        average_quality_score=round(avg_quality, 2) if avg_quality else None,
+        best_sleep_duration=round(best_duration, 2) if best_duration else None,
+        worst_sleep_duration=round(worst_duration, 2) if worst_duration else None
+    )
+
+
+def orm_quality(current_user, db):
+    sessions = db.query(SleepSession).filter(
+        SleepSession.user_id == current_user.id,
+        SleepSession.end_time.isnot(None),
+        SleepSession.quality_score.isnot(None)
+    ).all()
+
+    if not sessions:
+        return {"average_quality": None, "quality_distribution": {}, "recent_quality_trend": []}
+
+    quality_scores = [s.quality_score for s in sessions]
+    distribution = {
+        "poor (0-20)": 0, "fair (21-40)": 0, "average (41-60)": 0, "good (61-80)": 0, "excellent (81-100)": 0
+    }
+    for score in quality_scores:
+        if score <= 20:
+            distribution["poor (0-20)"] += 1
+        elif score <= 40:
+            distribution["fair (21-40)"] += 1
+        elif score <= 60:
+            distribution["average (41-60)"] += 1
+        elif score <= 80:
+            distribution["good (61-80)"] += 1
+        else:
+            distribution["excellent (81-100)"] += 1
+
+    recent_sessions = sorted(sessions, key=lambda s: s.start_time, reverse=True)[:7]
+    return {
+        "average_quality": round(sum(quality_scores) / len(quality_scores), 2),
+        "quality_distribution": distribution,
+        "recent_quality_trend": [
+            {"date": s.start_time.strftime("%Y-%m-%d"), "quality_score": s.quality_score}
+            for s in reversed(recent_sessions)
+        ]
+    }
+
+
+# ============= Data =============
+
+def add_user(db, name: str) -> User:
+    user = User(username=name, email=f"{name}@example.com", hashed_password="x")
+    db.add(user)
+    db.commit()
+    return user
+
+
+def add_sessions(db, user: User, count: int, rng: random.Random, edge_cases: bool = False):
+    start = datetime(2020, 1, 1, 22, 0)
+    for n in range(count):
+        start_time = start + timedelta(days=n, minutes=rng.randint(-90, 90))
+        if edge_cases and rng.random() < 0.1:
+            # Same start as the previous night: exercises the recent-trend tie order
+            start_time = start + timedelta(days=n - 1)
+        duration = rng.choice([None, 0.0, rng.uniform(30, 600), rng.uniform(30, 600)]) if edge_cases \
+            else rng.uniform(240, 600)
+        quality = rng.choice([None, 0.0, 20.0, 20.5, 40.0, 60.0, 80.0, 80.01, 100.0, rng.uniform(0, 100)]) \
+            if edge_cases else rng.uniform(0, 100)
+        active = edge_cases and rng.random() < 0.05
+        db.add(SleepSession(
+            session_uuid=str(uuid.uuid4()), user_id=user.id, start_time=start_time,
+            end_time=None if active else start_time + timedelta(minutes=duration or 0),
+            duration_minutes=duration, quality_score=quality
+        ))
+    db.commit()
+
+
+def check_equivalence(db, runs: int = 200):
+    rng = random.Random(0)
+    for n in range(runs):
+        user = add_user(db, f"check{n}")
+        add_sessions(db, user, rng.choice([0, 1, 2, 7, 8, rng.randint(0, 60)]), rng, edge_cases=True)
+        assert get_analytics_overview(user, db).model_dump() == orm_overview(user, db).model_dump(), n
+        assert get_quality_metrics(user, db) == orm_quality(user, db), n
+    print(f"Equivalence: {runs} random users identical")
+
+
+def time_ms(fn, user, db, repeat: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn(user, db)
+        db.expunge_all()
+    return (time.perf_counter() - t0) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aggregate analytics endpoint benchmark.")
+    parser.add_argument("--sessions", type=int, default=10_000, help="Completed sessions for the timed user")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    init_db()
+    db = SessionLocal()
+    check_equivalence(db)
+
+    user = add_user(db, "bench")
+    add_sessions(db, user, args.sessions, random.Random(1))
+    # Other users' history, as in a shared database
+    for n in range(3):
+        add_sessions(db, add_user(db, f"other{n}"), args.sessions, random.Random(n + 2))
+
+    print(f"\n{args.sessions} sessions per user")
+    print(f"{'endpoint':>10} {'python (ms)':>12} {'sql (ms)':>10} {'speedup':>9}")
+    for label, previous, current in [
+        ("overview", orm_overview, get_analytics_overview),
+        ("quality", orm_quality, get_quality_metrics),
+    ]:
+        python_ms = time_ms(previous, user, db, args.repeat)
+        sql_ms = time_ms(current, user, db, args.repeat)
+        print(f"{label:>10} {python_ms:>12.2f} {sql_ms:>10.2f} {python_ms / sql_ms:>8.1f}x")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
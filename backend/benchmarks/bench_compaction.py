@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Benchmark for window compaction (app.compaction).
+
+Fills a throwaway SQLite database with finished sessions of 30-second
+windows, then compacts them and reports:
+
+- database file size (after VACUUM) and sleep_windows / blob bytes,
+  before and after compaction
+- compaction throughput
+- time to load one session's windows from rows vs from its blob
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_compaction [--sessions 200] [--windows 1200]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+_db_dir = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_db_dir}/bench.db")
+os.environ.setdefault("DB_PROFILE", "basic")
+
+from sqlalchemy import text  # noqa: E402
+
+from app.compaction import compact, load_window_rows, storage_stats  # noqa: E402
+from app.database import SessionLocal, engine, init_db  # noqa: E402
+from app.ingest import ingest_window_rows  # noqa: E402
+from app.models import User, SleepSession  # noqa: E402
+
+STATES = ["still", "still", "still", "moving", "awake", "out_of_bed"]
+
+
+def make_rows(count: int, start_ts: float) -> list:
+    rows = []
+    state = "still"
+    for i in range(count):
+        if random.random() < 0.05:
+            state = random.choice(STATES)
+        # Device clock jitter, as in real uploads
+        ts = start_ts + i * 30 + random.random() * 0.01
+        rows.append({
+            "ts_start": ts,
+            "ts_end": ts + 30,
+            "avg_distance": round(random.uniform(0.08, 0.2), 4),
+            "movement_energy": round(random.random() / 500, 6),
+            "active_ratio": round(random.random(), 3),
+            "state": state,
+            "sample_count": 300
+        })
+    return rows
+
+
+def file_mb() -> float:
+    with engine.connect() as conn:
+        conn.execute(text("VACUUM"))
+    return os.path.getsize(engine.url.database) / 1e6
+
+
+def load_ms(session_id: int, repeat: int = 20) -> float:
+    db = SessionLocal()
+    try:
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            load_window_rows(db, session_id)
+        return (time.perf_counter() - t0) / repeat * 1000
+    finally:
+        db.close()
+
+
+def report(label: str, stats: dict, size_mb: float):
+    disk = stats.get("disk_bytes", {})
+    print(
+        f"{label:>8} {size_mb:>8.2f} {stats['window_rows']:>10} {disk.get('sleep_windows', 0) / 1e6:>11.2f} "
+        f"{stats['compacted_windows']:>10} {disk.get('sleep_window_blobs', 0) / 1e6:>11.2f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Window compaction storage benchmark.")
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--windows", type=int, default=1200, help="Windows per session (1200 = 10 hours)")
+    args = parser.parse_args()
+
+    random.seed(0)
+    init_db()
+    db = SessionLocal()
+    user = User(username="bench", email="bench@example.com", hashed_password="x")
+    db.add(user)
+    db.commit()
+
+    start_ts = time.time() - 86400 * (args.sessions + 2)
+    for n in range(args.sessions):
+        session_ts = start_ts + n * 86400
+        session_uuid = str(uuid.uuid4())
+        db.add(SleepSession(
+            session_uuid=session_uuid, user_id=user.id,
+            start_time=datetime.fromtimestamp(session_ts),
+            end_time=datetime.fromtimestamp(session_ts + args.windows * 30)
+        ))
+        db.flush()
+        ingest_window_rows(db, [(session_uuid, make_rows(args.windows, session_ts))])
+        db.commit()
+
+    print(f"{'':>8} {'file MB':>8} {'rows':>10} {'rows MB':>11} {'compacted':>10} {'blobs MB':>11}")
+    report("before", storage_stats(db), file_mb())
+    rows_ms = load_ms(1)
+
+    t0 = time.perf_counter()
+    summary = compact(db, older_than_hours=0)
+    elapsed = time.perf_counter() - t0
+
+    report("after", storage_stats(db), file_mb())
+    blob_ms = load_ms(1)
+    db.close()
+
+    print(f"\ncompacted {summary['windows']} windows in {elapsed:.2f}s "
+          f"({summary['windows'] / elapsed:.0f} windows/s), {summary['blob_bytes'] / summary['windows']:.1f} bytes/window")
+    print(f"load one session's windows: {rows_ms:.2f} ms from rows, {blob_ms:.2f} ms from blob")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the bulk window ingest path (POST /api/rpi/sessions/windows).
+
+Measures rows/sec of app.ingest.ingest_windows against a throwaway SQLite
+database at several batch sizes. Run from the backend directory:
+
+    python -m benchmarks.bench_ingest
+"""
+import os
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+_db_dir = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_db_dir}/bench.db")
+
+from app.database import SessionLocal, init_db  # noqa: E402
+from app.ingest import ingest_windows  # noqa: E402
+from app.models import User, SleepSession, RpiWindowData  # noqa: E402
+
+BATCH_SIZES = [10, 100, 1_000, 10_000]
+STATES = ["still", "still", "still", "moving", "awake", "out_of_bed"]
+
+
+def make_windows(session_uuid: str, count: int, start_ts: float):
+    return [
+        RpiWindowData(
+            session_id=session_uuid,
+            ts_start=start_ts + i * 5,
+            ts_end=start_ts + (i + 1) * 5,
+            avg_distance=0.12,
+            movement_energy=(i % 17) / 1000.0,
+            active_ratio=(i % 11) / 10.0,
+            state=STATES[i % len(STATES)],
+            sample_count=50
+        )
+        for i in range(count)
+    ]
+
+
+def main():
+    init_db()
+    db = SessionLocal()
+
+    user = User(username=f"bench_{uuid.uuid4().hex[:8]}", email=f"{uuid.uuid4().hex[:8]}@bench.local",
+                hashed_password="x")
+    db.add(user)
+    db.commit()
+
+    print(f"{'batch':>8} {'seconds':>10} {'rows/sec':>12} {'dup rows/sec':>14}")
+    for size in BATCH_SIZES:
+        session_uuid = str(uuid.uuid4())
+        start_ts = time.time()
+        db.add(SleepSession(session_uuid=session_uuid, user_id=user.id,
+                            start_time=datetime.fromtimestamp(start_ts)))
+        db.commit()
+
+        windows = make_windows(session_uuid, size, start_ts)
+
+        t0 = time.perf_counter()
+        result = ingest_windows(db, windows)
+        db.commit()
+        elapsed = time.perf_counter() - t0
+        assert result.total_inserted == size
+
+        # Re-send the same batch: everything should be rejected as duplicates
+        t0 = time.perf_counter()
+        result = ingest_windows(db, windows)
+        db.commit()
+        dup_elapsed = time.perf_counter() - t0
+        assert result.sessions[session_uuid].duplicates == size
+
+        print(f"{size:>8} {elapsed:>10.4f} {size / elapsed:>12.0f} {size / dup_elapsed:>14.0f}")
+
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Mixed ingest/read load benchmark for the SQLite database profiles.
+
+Runs writer processes (devices uploading window batches, as in
+POST /api/rpi/sessions/windows) alongside reader processes (dashboard
+queries: live metrics for an active session, as GET /api/sleep/current,
+plus the sessions list) against a throwaway database, once per
+DB_PROFILE, and reports throughput and errors for each. Separate
+processes stand in for uvicorn workers.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_load [--seconds 10] [--writers 4] [--readers 4]
+"""
+import argparse
+import multiprocessing as mp
+import os
+import random
+import tempfile
+import time
+import uuid
+
+PROFILES = ["basic", "production"]
+BATCH_SIZE = 60  # Five minutes of 5-second windows
+STATES = ["still", "still", "still", "moving", "awake", "out_of_bed"]
+
+
+def _setup(session_count: int) -> list:
+    """Create a user and one active session per writer; returns their uuids."""
+    from datetime import datetime
+
+    from app.database import SessionLocal, init_db
+    from app.models import User, SleepSession
+
+    init_db()
+    db = SessionLocal()
+    user = User(username="bench", email="bench@bench.local", hashed_password="x")
+    db.add(user)
+    db.commit()
+
+    uuids = [str(uuid.uuid4()) for _ in range(session_count)]
+    for session_uuid in uuids:
+        db.add(SleepSession(session_uuid=session_uuid, user_id=user.id, start_time=datetime.now()))
+    db.commit()
+    db.close()
+    return uuids
+
+
+def _writer(session_uuid: str, seconds: float, results):
+    from app.database import SessionLocal
+    from app.ingest import ingest_windows
+    from app.live_metrics import apply_windows
+    from app.models import RpiWindowData
+
+    db = SessionLocal()
+    ts = time.time()
+    ops = errors = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        windows = []
+        for _ in range(BATCH_SIZE):
+            windows.append(RpiWindowData(
+                session_id=session_uuid, ts_start=ts, ts_end=ts + 5, avg_distance=0.12,
+                movement_energy=random.random() / 50, active_ratio=random.random(),
+                state=random.choice(STATES), sample_count=50
+            ))
+            ts += 5
+        try:
+            result = ingest_windows(db, windows)
+            apply_windows(db, result.inserted_rows)
+            db.commit()
+            ops += 1
+        except Exception:
+            db.rollback()
+            errors += 1
+    db.close()
+    results.put(("write", ops, errors))
+
+
+def _reader(session_uuids: list, seconds: float, results):
+    from app.database import SessionLocal
+    from app.live_metrics import partial_metrics
+    from app.models import SleepSession
+
+    db = SessionLocal()
+    ops = errors = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        try:
+            session = db.query(SleepSession).filter(
+                SleepSession.session_uuid == random.choice(session_uuids)
+            ).one()
+            partial_metrics(session)
+            db.query(SleepSession).order_by(SleepSession.start_time.desc()).limit(50).all()
+            db.rollback()  # End the read transaction, as the request would
+            ops += 1
+        except Exception:
+            db.rollback()
+            errors += 1
+    db.close()
+    results.put(("read", ops, errors))
+
+
+def _run_profile(profile: str, seconds: float, writers: int, readers: int) -> dict:
+    db_path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    # Spawned children inherit the environment at start time
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ["DB_PROFILE"] = profile
+
+    ctx = mp.get_context("spawn")
+    setup = ctx.Pool(1)
+    session_uuids = setup.apply(_setup, (writers,))
+    setup.close()
+    setup.join()
+
+    results = ctx.Queue()
+    processes = [ctx.Process(target=_writer, args=(u, seconds, results)) for u in session_uuids]
+    processes += [ctx.Process(target=_reader, args=(session_uuids, seconds, results)) for _ in range(readers)]
+    for p in processes:
+        p.start()
+
+    totals = {"write": [0, 0], "read": [0, 0]}
+    for _ in processes:
+        kind, ops, errors = results.get()
+        totals[kind][0] += ops
+        totals[kind][1] += errors
+    for p in processes:
+        p.join()
+
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mixed ingest/read load benchmark per database profile.")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"{args.writers} writers x {BATCH_SIZE}-window batches, {args.readers} readers, {args.seconds:.0f}s each")
+    print(f"{'profile':>12} {'batches/s':>10} {'rows/s':>10} {'reads/s':>10} {'errors':>8}")
+    for profile in PROFILES:
+        totals = _run_profile(profile, args.seconds, args.writers, args.readers)
+        writes, write_errors = totals["write"]
+        reads, read_errors = totals["read"]
+        print(
+            f"{profile:>12} {writes / args.seconds:>10.1f} {writes * BATCH_SIZE / args.seconds:>10.0f} "
+            f"{reads / args.seconds:>10.1f} {write_errors + read_errors:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the columnar (NumPy) sleep metrics engine.
+
+Checks that compute_sleep_metrics_columnar and merged_intervals match
+the pure-Python compute_sleep_metrics / generate_intervals on random
+sessions, then times both at 1k, 10k and 100k windows. Run from the
+backend directory:
+
+    python -m benchmarks.bench_metrics
+"""
+import random
+import time
+
+from app.columnar_metrics import (
+    WindowColumns, compute_sleep_metrics_columnar, merged_intervals
+)
+from app.sleep_computation import compute_sleep_metrics, generate_intervals
+
+WINDOW_COUNTS = [1_000, 10_000, 100_000]
+STATES = ["still", "moving", "awake", "out_of_bed"]
+
+
+def make_windows(count: int, seed: int, start_ts: float = 1_700_000_000.0):
+    """Random session with long still runs and bursts of awake windows."""
+    rng = random.Random(seed)
+    windows = []
+    ts = start_ts
+    state = "still"
+    for _ in range(count):
+        if rng.random() < 0.08:
+            state = rng.choices(STATES, weights=[6, 2, 2, 1])[0]
+        duration = rng.choice([5.0, 5.0, 5.0, 4.9, 30.0])
+        windows.append({
+            "ts_start": ts,
+            "ts_end": ts + duration,
+            "movement_energy": rng.random() ** 2,
+            "state": state
+        })
+        ts += duration
+    return windows
+
+
+def check_equivalence(runs: int = 200):
+    for seed in range(runs):
+        windows = make_windows(random.Random(seed).randint(0, 3000), seed)
+        start_ts = 1_700_000_000.0
+        end_ts = windows[-1]["ts_end"] + 60 if windows else start_ts
+
+        expected = compute_sleep_metrics(windows, start_ts, end_ts)
+        columns = WindowColumns.from_dicts(windows)
+        actual = compute_sleep_metrics_columnar(columns, start_ts, end_ts)
+        assert actual == expected, (seed, expected, actual)
+        assert merged_intervals(columns) == generate_intervals(windows), seed
+    print(f"Equivalence: {runs} random sessions identical")
+
+
+def main():
+    check_equivalence()
+
+    print(f"{'windows':>8} {'python (s)':>12} {'numpy (s)':>12} {'speedup':>9}")
+    for count in WINDOW_COUNTS:
+        windows = make_windows(count, seed=count)
+        start_ts = windows[0]["ts_start"]
+        end_ts = windows[-1]["ts_end"]
+        columns = WindowColumns.from_dicts(windows)
+
+        t0 = time.perf_counter()
+        compute_sleep_metrics(windows, start_ts, end_ts)
+        python_elapsed = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        compute_sleep_metrics_columnar(columns, start_ts, end_ts)
+        numpy_elapsed = time.perf_counter() - t0
+
+        print(f"{count:>8} {python_elapsed:>12.4f} {numpy_elapsed:>12.4f} "
+              f"{python_elapsed / numpy_elapsed:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
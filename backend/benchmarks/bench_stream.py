@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Benchmark for streaming NDJSON ingest (POST /api/rpi/sessions/windows/stream).
+
+For each backfill size, starts a fresh uvicorn server on a throwaway
+database, uploads the windows, and reports throughput and the server's
+peak resident memory (VmHWM). The streaming endpoint is compared with the
+single JSON batch endpoint, whose memory grows with the batch. Linux
+only (reads /proc).
+
+With the production DB profile the peak also includes SQLite's page
+cache (64 MB) and memory-mapped database pages (file-backed, up to
+256 MB); run with DB_PROFILE=basic to see the endpoint's own footprint.
+Run from the backend directory:
+
+    python -m benchmarks.bench_stream [--sizes 1000 100000 1000000] [--batch-max 100000]
+"""
+import argparse
+import json
+import time
+import uuid
+
+import requests
+
+from benchmarks.bench_upload import STATES, _free_port, _start_server
+
+
+def peak_rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def window_lines(session_uuid: str, count: int, chunk: int = 1000):
+    """NDJSON body, generated lazily so the client stays flat too."""
+    ts = 1_700_000_000.0
+    for start in range(0, count, chunk):
+        lines = []
+        for i in range(start, min(start + chunk, count)):
+            lines.append(json.dumps({
+                "session_id": session_uuid, "ts_start": ts + i * 30, "ts_end": ts + i * 30 + 30,
+                "avg_distance": 0.12, "movement_energy": (i % 17) / 1000.0,
+                "active_ratio": (i % 11) / 10.0, "state": STATES[i % len(STATES)], "sample_count": 300
+            }))
+        yield ("\n".join(lines) + "\n").encode()
+
+
+def run(mode: str, count: int) -> dict:
+    port = _free_port()
+    server = _start_server(port)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        requests.post(f"{base_url}/api/users/register", json={
+            "username": "bench", "email": "bench@example.com", "password": "bench"
+        }).raise_for_status()
+        session_uuid = str(uuid.uuid4())
+        requests.post(f"{base_url}/api/rpi/sessions/start", json={
+            "session_id": session_uuid, "user_id": 1, "start_ts": 1_700_000_000.0, "baseline_distance": 0.1
+        }).raise_for_status()
+        baseline = peak_rss_mb(server.pid)
+
+        t0 = time.perf_counter()
+        if mode == "stream":
+            response = requests.post(
+                f"{base_url}/api/rpi/sessions/windows/stream",
+                data=window_lines(session_uuid, count),
+                headers={"Content-Type": "application/x-ndjson"}
+            )
+        else:
+            body = b'{"windows":[' + b",".join(
+                line for chunk in window_lines(session_uuid, count) for line in chunk.splitlines()
+            ) + b"]}"
+            response = requests.post(
+                f"{base_url}/api/rpi/sessions/windows",
+                data=body,
+                headers={"Content-Type": "application/json"}
+            )
+        elapsed = time.perf_counter() - t0
+        response.raise_for_status()
+        assert response.json()["windows_added"] == count
+
+        return {
+            "windows_per_sec": count / elapsed,
+            "baseline_mb": baseline,
+            "peak_mb": peak_rss_mb(server.pid)
+        }
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming ingest memory benchmark.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--batch-max", type=int, default=100_000,
+                        help="Largest size also sent as one JSON batch, for comparison")
+    args = parser.parse_args()
+
+    print(f"{'windows':>9} {'endpoint':>9} {'windows/s':>10} {'idle MB':>8} {'peak MB':>8}")
+    for count in args.sizes:
+        for mode in ("stream", "batch"):
+            if mode == "batch" and count > args.batch_max:
+                continue
+            r = run(mode, count)
+            print(f"{count:>9} {mode:>9} {r['windows_per_sec']:>10.0f} {r['baseline_mb']:>8.1f} {r['peak_mb']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Benchmark for RPi window uploads over HTTP (POST /api/rpi/sessions/windows).
+
+Starts the API under uvicorn against a throwaway database and uploads the
+same window batches three ways:
+
+- per-request connections, plain JSON (the old client: requests.post)
+- pooled keep-alive connection (requests.Session), plain JSON
+- pooled keep-alive connection, gzip-compressed JSON
+- persistent WebSocket (/api/rpi/ws), packed binary frames (the current
+  client's default)
+
+and reports mean/p95 latency per batch and request bytes on the wire.
+Requires `requests` and `websocket-client` (the RPi client's libraries).
+Run from the backend directory:
+
+    python -m benchmarks.bench_upload [--batches 200] [--batch-size 10]
+"""
+import argparse
+import gzip
+import json
+import os
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import requests
+import websocket
+
+from app import wire
+
+STATES = ["still", "still", "still", "moving", "awake", "out_of_bed"]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_server(port: int) -> subprocess.Popen:
+    env = dict(os.environ)
+    env["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/health", timeout=1)
+            return server
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("uvicorn did not start")
+
+
+def _batches(session_uuid: str, count: int, size: int):
+    ts = time.time()
+    for _ in range(count):
+        windows = []
+        for i in range(size):
+            windows.append({
+                "session_id": session_uuid, "ts_start": ts, "ts_end": ts + 5,
+                "avg_distance": 0.12 + i / 1000, "movement_energy": (i % 17) / 1000.0,
+                "active_ratio": (i % 11) / 10.0, "state": STATES[i % len(STATES)], "sample_count": 50
+            })
+            ts += 5
+        yield {"windows": windows}
+
+
+def _run_mode(base_url: str, mode: str, batches: int, batch_size: int) -> dict:
+    session_uuid = str(uuid.uuid4())
+    requests.post(f"{base_url}/api/rpi/sessions/start", json={
+        "session_id": session_uuid, "user_id": 1, "start_ts": time.time(), "baseline_distance": 0.1
+    }).raise_for_status()
+
+    http = requests.Session() if mode != "per-request" else None
+    ws = websocket.create_connection(f"ws{base_url[len('http'):]}/api/rpi/ws") if mode == "websocket" else None
+    latencies = []
+    wire_bytes = 0
+    for seq, payload in enumerate(_batches(session_uuid, batches, batch_size), start=1):
+        if ws is not None:
+            frame = struct.pack("<Q", seq) + wire.encode_windows(payload["windows"])
+            wire_bytes += len(frame)
+            t0 = time.perf_counter()
+            ws.send_binary(frame)
+            reply = json.loads(ws.recv())
+            latencies.append(time.perf_counter() - t0)
+            assert reply["seq"] == seq and reply["windows_added"] == batch_size
+            continue
+
+        body = json.dumps(payload, separators=(",", ":")).encode()
+        headers = {"Content-Type": "application/json"}
+        if mode == "pooled+gzip":
+            body = gzip.compress(body, compresslevel=6)
+            headers["Content-Encoding"] = "gzip"
+        wire_bytes += len(body)
+
+        t0 = time.perf_counter()
+        if http is None:
+            response = requests.post(f"{base_url}/api/rpi/sessions/windows", data=body, headers=headers)
+        else:
+            response = http.post(f"{base_url}/api/rpi/sessions/windows", data=body, headers=headers)
+        latencies.append(time.perf_counter() - t0)
+        response.raise_for_status()
+        assert response.json()["windows_added"] == batch_size
+
+    if ws is not None:
+        ws.close()
+
+    latencies.sort()
+    return {
+        "mean_ms": sum(latencies) / len(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "bytes_per_batch": wire_bytes / batches
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RPi window upload benchmark.")
+    parser.add_argument("--batches", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=10)
+    args = parser.parse_args()
+
+    port = _free_port()
+    server = _start_server(port)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        requests.post(f"{base_url}/api/users/register", json={
+            "username": "bench", "email": "bench@example.com", "password": "bench"
+        }).raise_for_status()
+
+        print(f"{args.batches} batches of {args.batch_size} windows")
+        print(f"{'mode':>12} {'mean ms':>9} {'p95 ms':>9} {'bytes/batch':>12}")
+        for mode in ("per-request", "pooled", "pooled+gzip", "websocket"):
+            result = _run_mode(base_url, mode, args.batches, args.batch_size)
+            print(f"{mode:>12} {result['mean_ms']:>9.2f} {result['p95_ms']:>9.2f} {result['bytes_per_batch']:>12.0f}")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the window batch wire formats.
+
+Compares JSON (POST /api/rpi/sessions/windows) with the packed columnar
+format (POST /api/rpi/sessions/windows/packed, see app/wire.py) at
+several batch sizes:
+
+- payload bytes, raw and gzipped (as the RPi client sends them)
+- server-side decode time, from request body to insert rows: Pydantic
+  validation plus row building for JSON, wire.decode_windows for packed
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_wire
+"""
+import gzip
+import json
+import time
+import uuid
+
+from app import wire
+from app.models import RpiWindowBatch
+
+BATCH_SIZES = [10, 100, 1_000, 10_000]
+STATES = ["still", "still", "still", "moving", "awake", "out_of_bed"]
+
+
+def make_windows(count: int) -> list:
+    session_uuid = str(uuid.uuid4())
+    start_ts = time.time()
+    return [
+        {
+            "session_id": session_uuid,
+            "ts_start": start_ts + i * 30,
+            "ts_end": start_ts + (i + 1) * 30,
+            "avg_distance": 0.12 + (i % 7) / 1000.0,
+            "movement_energy": (i % 17) / 1000.0,
+            "active_ratio": (i % 11) / 10.0,
+            "state": STATES[i % len(STATES)],
+            "sample_count": 300
+        }
+        for i in range(count)
+    ]
+
+
+def decode_json(body: bytes) -> list:
+    """What the JSON route does before the insert: validate, then build rows."""
+    batch = RpiWindowBatch.model_validate_json(body)
+    groups = {}
+    for w in batch.windows:
+        groups.setdefault(w.session_id, []).append({
+            "ts_start": w.ts_start,
+            "ts_end": w.ts_end,
+            "avg_distance": w.avg_distance,
+            "movement_energy": w.movement_energy,
+            "active_ratio": w.active_ratio,
+            "state": w.state,
+            "sample_count": w.sample_count
+        })
+    return list(groups.items())
+
+
+def time_per_call(fn, arg, min_seconds: float = 0.3) -> float:
+    calls = 0
+    t0 = time.perf_counter()
+    while True:
+        fn(arg)
+        calls += 1
+        elapsed = time.perf_counter() - t0
+        if elapsed >= min_seconds:
+            return elapsed / calls
+
+
+def main():
+    print(f"{'batch':>7} {'format':>7} {'bytes':>9} {'gzipped':>9} {'decode ms':>10} {'us/window':>10}")
+    for size in BATCH_SIZES:
+        windows = make_windows(size)
+        bodies = {
+            "json": json.dumps({"windows": windows}, separators=(",", ":")).encode(),
+            "packed": wire.encode_windows(windows)
+        }
+        decoders = {"json": decode_json, "packed": wire.decode_windows}
+
+        # Both paths must produce the same insert rows
+        assert decode_json(bodies["json"]) == wire.decode_windows(bodies["packed"])
+
+        for name, body in bodies.items():
+            seconds = time_per_call(decoders[name], body)
+            print(
+                f"{size:>7} {name:>7} {len(body):>9} {len(gzip.compress(body, compresslevel=6)):>9} "
+                f"{seconds * 1000:>10.3f} {seconds / size * 1e6:>10.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Query count check for the sleep summary endpoints.
+
+Seeds a throwaway SQLite database with users that have N days of sleep
+history (recorded through the RPi endpoints, as in production), then
+counts the statements each endpoint below sends for each user. Fails
+(exit status 1) if an endpoint's count changes with N, i.e. it has
+started issuing a query per day or per session.
+
+Run from the backend directory:
+
+    python -m benchmarks.query_counts [--days 1 7 31] [--verbose]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import date, timedelta
+
+_db_dir = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_db_dir}/counts.db")
+os.environ.setdefault("DB_PROFILE", "basic")
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from app.database import async_engine, engine, init_db  # noqa: E402
+from app.main import app  # noqa: E402
+
+WINDOWS_PER_SESSION = 60
+
+
+class StatementLog:
+    """Statements the app sends on either engine while enabled."""
+
+    def __init__(self):
+        self.statements = []
+        self.enabled = False
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        if self.enabled:
+            self.statements.append(statement)
+
+    def take(self) -> list:
+        statements, self.statements = self.statements, []
+        return statements
+
+
+def record_night(client: TestClient, user_id: int, start_ts: float) -> str:
+    session_uuid = str(uuid.uuid4())
+    client.post("/api/rpi/sessions/start", json={
+        "session_id": session_uuid, "user_id": user_id, "start_ts": start_ts, "baseline_distance": 0.12
+    }).raise_for_status()
+    client.post("/api/rpi/sessions/windows", json={"windows": [
+        {
+            "session_id": session_uuid, "ts_start": start_ts + i * 30, "ts_end": start_ts + i * 30 + 30,
+            "avg_distance": 0.12, "movement_energy": 0.001 if i % 10 else 0.05, "active_ratio": 0.1,
+            "state": "still" if i % 10 else "moving", "sample_count": 300
+        }
+        for i in range(WINDOWS_PER_SESSION)
+    ]}).raise_for_status()
+    client.post("/api/rpi/sessions/end", json={
+        "session_id": session_uuid, "end_ts": start_ts + WINDOWS_PER_SESSION * 30
+    }).raise_for_status()
+    return session_uuid
+
+
+def seed_user(client: TestClient, name: str, days: int) -> dict:
+    """A user with one night per day for the `days` days up to today."""
+    client.post("/api/users/register", json={
+        "username": name, "email": f"{name}@example.com", "password": "password"
+    }).raise_for_status()
+    token = client.post(
+        "/api/users/login", data={"username": name, "password": "password"}
+    ).json()["access_token"]
+    auth = {"Authorization": f"Bearer {token}"}
+    user_id = client.get("/api/users/me", headers=auth).json()["id"]
+
+    today = date.today()
+    first_ts = time.mktime((today - timedelta(days=days - 1)).timetuple()) + 3600
+    session_uuids = [record_night(client, user_id, first_ts + n * 86400) for n in range(days)]
+    return {
+        "auth": auth,
+        "start": today - timedelta(days=days - 1),
+        "end": today,
+        "first_session": session_uuids[0]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that summary endpoints use a fixed number of queries.")
+    parser.add_argument("--days", type=int, nargs="+", default=[1, 7, 31],
+                        help="Days of history per user (at most 31, the /days range limit)")
+    parser.add_argument("--verbose", action="store_true", help="Print every statement")
+    args = parser.parse_args()
+
+    log = StatementLog()
+    event.listen(engine, "before_cursor_execute", log)
+    event.listen(async_engine.sync_engine, "before_cursor_execute", log)
+
+    init_db()
+    with TestClient(app) as client:
+        users = {days: seed_user(client, f"user{days}", days) for days in args.days}
+
+        endpoints = [
+            ("GET /api/sleep/days", lambda user: client.get("/api/sleep/days", headers=user["auth"], params={
+                "start_date": str(user["start"]), "end_date": str(user["end"])
+            })),
+            ("GET /api/sleep/latest/summary", lambda user: client.get(
+                "/api/sleep/latest/summary", headers=user["auth"]
+            )),
+            ("GET /api/sleep/sessions/{uuid}/summary", lambda user: client.get(
+                f"/api/sleep/sessions/{user['first_session']}/summary", headers=user["auth"]
+            )),
+        ]
+
+        failures = 0
+        for label, request in endpoints:
+            counts = {}
+            for days, user in users.items():
+                # Warm per-process caches (token user, rank index) first
+                request(user).raise_for_status()
+                log.enabled = True
+                response = request(user)
+                log.enabled = False
+                statements = log.take()
+                response.raise_for_status()
+                counts[days] = len(statements)
+                if args.verbose:
+                    print(f"{label} ({days} days):")
+                    for statement in statements:
+                        print("    " + " ".join(statement.split())[:160])
+
+            stable = len(set(counts.values())) == 1
+            failures += not stable
+            summary = ", ".join(f"{days} days: {count}" for days, count in counts.items())
+            print(f"{'ok  ' if stable else 'FAIL'} {label}: {summary}")
+
+    if failures:
+        print(f"\n{failures} endpoints issue more statements as history grows")
+        sys.exit(1)
+    print("\nstatement counts do not depend on history length")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Query plan check for the hot endpoints.
+
+Seeds a throwaway SQLite database, calls each endpoint below through the
+app, and runs EXPLAIN QUERY PLAN on every statement it sends that reads
+sleep_sessions or sleep_windows. Fails (exit status 1) if any of them
+scans one of those tables instead of searching an index, e.g. after an
+index is dropped or a filter stops matching one.
+
+Run from the backend directory:
+
+    python -m benchmarks.query_plans [--users 20] [--sessions 100] [--verbose]
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+_db_dir = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_db_dir}/plans.db")
+os.environ.setdefault("DB_PROFILE", "basic")
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from app.database import SessionLocal, async_engine, engine, init_db  # noqa: E402
+from app.ingest import ingest_window_rows  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models import User, SleepSession  # noqa: E402
+from app.passwords import pwd_context  # noqa: E402
+
+HOT_TABLES = ("sleep_sessions", "sleep_windows")
+_HOT_TABLE_RE = re.compile(r"\b(?:FROM|JOIN|UPDATE)\s+(" + "|".join(HOT_TABLES) + r")\b", re.IGNORECASE)
+_SCAN_RE = re.compile(r"^SCAN (" + "|".join(HOT_TABLES) + r")\b")
+
+WINDOWS_PER_SESSION = 120
+
+
+class StatementLog:
+    """Statements the app sends on either engine while enabled."""
+
+    def __init__(self):
+        self.statements = []
+        self.enabled = False
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        if self.enabled and not executemany and _HOT_TABLE_RE.search(statement):
+            self.statements.append((statement, parameters))
+
+    def take(self) -> list:
+        statements, self.statements = self.statements, []
+        return statements
+
+
+def explain(statement: str, parameters) -> list:
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        return [row[3] for row in cursor.fetchall()]
+    finally:
+        raw.close()
+
+
+def seed(user_count: int, session_count: int) -> tuple:
+    """Users with session_count finished nights each; returns the first one's (id, username)."""
+    db = SessionLocal()
+    users = [
+        User(username=f"user{n}", email=f"user{n}@example.com", hashed_password=pwd_context.hash("password"))
+        for n in range(user_count)
+    ]
+    db.add_all(users)
+    db.commit()
+
+    start_ts = time.time() - 86400 * (session_count + 1)
+    for user in users:
+        for n in range(session_count):
+            session_ts = start_ts + n * 86400
+            session_uuid = str(uuid.uuid4())
+            db.add(SleepSession(
+                session_uuid=session_uuid, user_id=user.id,
+                start_time=datetime.fromtimestamp(session_ts),
+                end_time=datetime.fromtimestamp(session_ts + WINDOWS_PER_SESSION * 30),
+                duration_minutes=WINDOWS_PER_SESSION / 2, quality_score=70.0, points_earned=80,
+                awakenings_count=1
+            ))
+            db.flush()
+            ingest_window_rows(db, [(session_uuid, [
+                {
+                    "ts_start": session_ts + i * 30, "ts_end": session_ts + i * 30 + 30,
+                    "avg_distance": 0.12, "movement_energy": 0.001, "active_ratio": 0.1,
+                    "state": "still", "sample_count": 300
+                }
+                for i in range(WINDOWS_PER_SESSION)
+            ])])
+        db.commit()
+
+    first = (users[0].id, users[0].username)
+    db.close()
+    return first
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that hot endpoints search indexes instead of scanning.")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--sessions", type=int, default=100, help="Finished sessions per user")
+    parser.add_argument("--verbose", action="store_true", help="Print every plan, not just scans")
+    args = parser.parse_args()
+
+    if engine.dialect.name != "sqlite":
+        sys.exit("query_plans reads SQLite's EXPLAIN QUERY PLAN output; run it against a SQLite DATABASE_URL")
+
+    log = StatementLog()
+    event.listen(engine, "before_cursor_execute", log)
+    event.listen(async_engine.sync_engine, "before_cursor_execute", log)
+
+    init_db()
+    user_id, username = seed(args.users, args.sessions)
+
+    with TestClient(app) as client:
+        token = client.post(
+            "/api/users/login", data={"username": username, "password": "password"}
+        ).json()["access_token"]
+        auth = {"Authorization": f"Bearer {token}"}
+
+        session_uuid = str(uuid.uuid4())
+        now = time.time()
+        today = date.today()
+        requests = [
+            ("POST /api/rpi/sessions/start", lambda: client.post("/api/rpi/sessions/start", json={
+                "session_id": session_uuid, "user_id": user_id, "start_ts": now, "baseline_distance": 0.12
+            })),
+            ("POST /api/rpi/sessions/windows", lambda: client.post("/api/rpi/sessions/windows", json={"windows": [{
+                "session_id": session_uuid, "ts_start": now + i * 30, "ts_end": now + i * 30 + 30,
+                "avg_distance": 0.12, "movement_energy": 0.001, "active_ratio": 0.1,
+                "state": "still", "sample_count": 300
+            } for i in range(10)]})),
+            ("GET /api/sleep/current", lambda: client.get("/api/sleep/current", headers=auth)),
+            ("POST /api/rpi/sessions/end", lambda: client.post("/api/rpi/sessions/end", json={
+                "session_id": session_uuid, "end_ts": now + 300
+            })),
+            ("GET /api/sleep/sessions", lambda: client.get("/api/sleep/sessions", headers=auth)),
+            ("GET /api/sleep/latest/summary", lambda: client.get("/api/sleep/latest/summary", headers=auth)),
+            ("GET /api/sleep/day/{date}", lambda: client.get(f"/api/sleep/day/{today - timedelta(days=3)}", headers=auth)),
+            ("GET /api/sleep/days", lambda: client.get("/api/sleep/days", headers=auth, params={
+                "start_date": str(today - timedelta(days=7)), "end_date": str(today)
+            })),
+            ("GET /api/analytics/overview", lambda: client.get("/api/analytics/overview", headers=auth)),
+            ("GET /api/analytics/trends", lambda: client.get("/api/analytics/trends", headers=auth)),
+            ("GET /api/analytics/quality", lambda: client.get("/api/analytics/quality", headers=auth)),
+            ("GET /api/analytics/streak", lambda: client.get("/api/analytics/streak", headers=auth)),
+        ]
+
+        scans = 0
+        for label, request in requests:
+            log.enabled = True
+            response = request()
+            log.enabled = False
+            statements = log.take()
+            if response.status_code >= 400:
+                print(f"{label}: HTTP {response.status_code} {response.text}")
+                scans += 1
+                continue
+
+            print(f"{label}: {len(statements)} statements")
+            for statement, parameters in statements:
+                plan = explain(statement, parameters)
+                scanned = [step for step in plan if _SCAN_RE.match(step)]
+                scans += len(scanned)
+                if scanned or args.verbose:
+                    print("    " + " ".join(statement.split()))
+                    for step in plan:
+                        marker = "!!" if step in scanned else "  "
+                        print(f"    {marker} {step}")
+
+    if scans:
+        print(f"\n{scans} table scans on {', '.join(HOT_TABLES)}")
+        sys.exit(1)
+    print("\nall hot queries use an index")
+
+
+if __name__ == "__main__":
+    main()
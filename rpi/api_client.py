@@ -4,20 +4,34 @@ HTTP Client for Backend API Communication
 Handles:
 - Session start/end notifications
 - Window data batching and upload
-- Offline buffering and retry logic
+- Offline buffering (durable, see outbox.py) and retry logic
 - Heartbeat pings
+- Transport: one persistent WebSocket (see ws_transport.py), or plain
+  HTTP requests
+
+All network I/O happens on a background sender thread. The public
+methods only put items on an in-memory queue, so the sampling loop never
+blocks on the network or on disk; the sender persists queued items to the
+outbox, delivers them, and retries failures with exponential backoff and
+jitter.
 """
+import gzip
 import logging
+import queue
+import random
 import time
 import json
-from typing import Optional, List
+from typing import Optional, List, Tuple, Union
 from dataclasses import asdict
-from collections import deque
-from threading import Lock
+from threading import Event, Thread
 
 import requests
+from requests.adapters import HTTPAdapter
 
 import config
+import wire
+from outbox import Outbox, OutboxItem, KIND_WINDOW, KIND_SESSION_START, KIND_SESSION_END
+from ws_transport import WebSocketTransport, WebSocketUnavailable, window_frame
 from state_machine import SleepWindow, SessionData
 
 logger = logging.getLogger("api_client")
@@ -34,17 +48,246 @@ class BackendClient:
         self.device_token = config.DEVICE_TOKEN
         self.user_id = config.USER_ID
         
-        # Pending windows to send
-        self._window_buffer: deque = deque(maxlen=config.MAX_BUFFERED_WINDOWS)
-        self._buffer_lock = Lock()
+        # Pending windows and session events, persisted until delivered
+        self._outbox = Outbox(
+            config.OUTBOX_PATH,
+            max_windows=config.MAX_BUFFERED_WINDOWS,
+            sync_interval=config.OUTBOX_SYNC_INTERVAL_SECONDS
+        )
+        
+        # Hand-off from the sampling loop to the sender thread: (kind, payload)
+        self._queue: "queue.Queue[Tuple[str, dict]]" = queue.Queue()
+        self._flush_requested = Event()
+        self._stopping = Event()
+        self._thread: Optional[Thread] = None
+        
+        # Sender thread state
+        self._windows_since_flush = 0
+        self._events_pending = False
+        self._next_attempt: float = 0
+        self._peak_queue_depth = 0
         
         # Session state
         self._current_session_id: Optional[str] = None
         self._last_heartbeat: float = 0
         
+        # Keep-alive connection pool, used only by the sender thread
+        self._http = requests.Session()
+        self._http.headers.update(self._get_headers())
+        self._http.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self._http.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self._bytes_sent = 0
+        # Cleared for the rest of the run if the backend rejects packed batches
+        self._packed_windows = config.WIRE_FORMAT == "packed"
+        
+        # Persistent WebSocket channel; None means plain HTTP
+        self._ws: Optional[WebSocketTransport] = None
+        if config.TRANSPORT == "websocket":
+            try:
+                self._ws = WebSocketTransport(
+                    "ws" + self.base_url[len("http"):] + "/api/rpi/ws",
+                    self._get_headers(),
+                    config.REQUEST_TIMEOUT_SECONDS
+                )
+            except WebSocketUnavailable as e:
+                logger.warning(f"{e}; using HTTP")
+        
         # Connection state
         self._is_online = True
-        self._retry_count = 0
+        self._retry_count = 0  # Consecutive failed deliveries
+        # Set when the last request failed with a 4xx (retrying won't help)
+        self._last_rejected = False
+        
+        if len(self._outbox):
+            # Replay whatever a previous run left behind as soon as we start
+            self._flush_requested.set()
+    
+    # ============= Sampling-loop API (non-blocking) =============
+    
+    def start(self):
+        """Start the background sender thread."""
+        if self._thread is None:
+            self._thread = Thread(target=self._run, name="backend-sender", daemon=True)
+            self._thread.start()
+    
+    def stop(self, timeout: float = config.REQUEST_TIMEOUT_SECONDS * 2):
+        """
+        Stop the sender after one last delivery attempt; anything still
+        undelivered stays in the outbox for the next start.
+        """
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                logger.warning("Sender thread did not stop in time")
+            self._thread = None
+    
+    def start_session(self, session: SessionData):
+        """Queue notification that a new sleep session has started."""
+        self._current_session_id = session.session_id
+        
+        self._enqueue(KIND_SESSION_START, {
+            "session_id": session.session_id,
+            "user_id": session.user_id,
+            "start_ts": session.start_ts,
+            "baseline_distance": session.baseline_distance
+        })
+    
+    def end_session(self, session: SessionData, end_ts: float):
+        """
+        Queue notification that the sleep session has ended.
+        Delivered after the session's remaining windows.
+        """
+        self._enqueue(KIND_SESSION_END, {
+            "session_id": session.session_id,
+            "end_ts": end_ts
+        })
+        self._current_session_id = None
+    
+    def add_window(self, window: SleepWindow):
+        """Queue a window; the sender uploads once a batch has accumulated."""
+        self._enqueue(KIND_WINDOW, asdict(window))
+    
+    def flush_windows(self):
+        """Ask the sender to deliver everything pending now."""
+        self._flush_requested.set()
+    
+    def _enqueue(self, kind: str, payload: dict):
+        self._queue.put_nowait((kind, payload))
+        self._peak_queue_depth = max(self._peak_queue_depth, self._queue.qsize())
+    
+    # ============= Sender thread =============
+    
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                if self._ws is not None:
+                    self._ws.poll()
+                self._persist_queued(timeout=0.5)
+                self._send_heartbeat_if_due()
+                if self._should_drain():
+                    self._try_drain()
+            except Exception as e:
+                logger.exception(f"Error in sender thread: {e}")
+                time.sleep(1)
+        
+        # Shutdown: persist everything queued and make a final attempt
+        try:
+            self._persist_queued(timeout=0)
+            if len(self._outbox):
+                self._drain()
+        finally:
+            self._outbox.close()
+            self._http.close()
+            if self._ws is not None:
+                self._ws.close()
+    
+    def _persist_queued(self, timeout: float):
+        """Move queued items into the outbox, waiting up to timeout for the first."""
+        try:
+            item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+        except queue.Empty:
+            return
+        
+        while True:
+            kind, payload = item
+            if kind == KIND_WINDOW:
+                self._outbox.append_window(payload)
+                self._windows_since_flush += 1
+            else:
+                self._outbox.append_event(kind, payload)
+                self._events_pending = True
+            
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+    
+    def _should_drain(self) -> bool:
+        if not len(self._outbox) or time.monotonic() < self._next_attempt:
+            return False
+        return (
+            self._retry_count > 0
+            or self._events_pending
+            or self._flush_requested.is_set()
+            or self._windows_since_flush >= config.WINDOW_BATCH_SIZE
+        )
+    
+    def _try_drain(self):
+        """One delivery pass; schedules a backoff retry if it fails."""
+        self._flush_requested.clear()
+        self._windows_since_flush = 0
+        
+        if self._drain():
+            self._events_pending = False
+            self._retry_count = 0
+            self._next_attempt = 0
+            return
+        
+        self._retry_count += 1
+        # Exponential backoff with "equal jitter": half fixed, half random,
+        # so retries from many devices spread out but never hit zero delay
+        delay = min(
+            config.RETRY_MAX_DELAY_SECONDS,
+            config.RETRY_BASE_DELAY_SECONDS * 2 ** (self._retry_count - 1)
+        )
+        delay = delay / 2 + random.uniform(0, delay / 2)
+        self._next_attempt = time.monotonic() + delay
+        logger.warning(
+            f"Delivery failed ({self._retry_count} in a row), "
+            f"{len(self._outbox)} items pending, retrying in {delay:.1f}s"
+        )
+    
+    def _drain(self) -> bool:
+        """
+        Deliver outbox items in order, as fast as the backend accepts them,
+        until the outbox is empty (True) or the backend is unreachable
+        (False). Items the backend rejects outright are dropped so they
+        cannot block the queue.
+        """
+        while True:
+            items = self._outbox.peek(config.DRAIN_BATCH_SIZE)
+            if not items:
+                return True
+            
+            _, kind, payload = items[0]
+            if self._ws is not None:
+                result = self._send_ws(kind, items)
+                if self._ws is None:
+                    # Fell back to HTTP: resend the same items there
+                    continue
+            elif kind == KIND_WINDOW and self._packed_windows:
+                result = self._make_request(
+                    "POST", "/api/rpi/sessions/windows/packed",
+                    wire.encode_windows([p for _, _, p in items]),
+                    content_type=wire.CONTENT_TYPE
+                )
+                if result is None and self._last_rejected:
+                    # Older backend without the packed endpoint (or a batch it
+                    # cannot take): resend as JSON, which is always supported
+                    logger.warning("Backend rejected packed windows, switching to JSON")
+                    self._packed_windows = False
+                    continue
+            elif kind == KIND_WINDOW:
+                result = self._make_request(
+                    "POST", "/api/rpi/sessions/windows", {"windows": [p for _, _, p in items]}
+                )
+            elif kind == KIND_SESSION_START:
+                result = self._make_request("POST", "/api/rpi/sessions/start", payload)
+            else:
+                result = self._make_request("POST", "/api/rpi/sessions/end", payload)
+            
+            if result is None and not self._last_rejected:
+                return False
+            
+            if result is None:
+                logger.error(f"Backend rejected {kind}, dropping {len(items)} item(s)")
+            elif kind == KIND_WINDOW:
+                logger.info(f"Flushed {len(items)} windows to backend")
+            else:
+                logger.info(f"Reported {kind}: {payload['session_id']}")
+            
+            self._outbox.ack(items)
     
     def _get_headers(self) -> dict:
         """Get request headers with auth token."""
@@ -56,176 +299,137 @@ class BackendClient:
             headers["Authorization"] = f"Bearer {self.device_token}"
         return headers
     
+    def _encode_body(self, data, content_type: str) -> Tuple[bytes, dict]:
+        """
+        Encode a request body (dicts as JSON, bytes as-is), gzipped when
+        it is worth it.
+        """
+        headers = {"Content-Type": content_type}
+        body = data if isinstance(data, bytes) else json.dumps(data, separators=(",", ":")).encode()
+        if config.GZIP_UPLOADS and len(body) >= config.GZIP_MIN_BYTES:
+            headers["Content-Encoding"] = "gzip"
+            return gzip.compress(body, compresslevel=6), headers
+        return body, headers
+    
     def _make_request(
         self,
         method: str,
         endpoint: str,
-        data: Optional[dict] = None,
-        retry: bool = True
+        data: Optional[Union[dict, bytes]] = None,
+        content_type: str = "application/json"
     ) -> Optional[dict]:
-        """Make HTTP request with retry logic."""
+        """Make a single HTTP request; retries are scheduled by the sender."""
         url = f"{self.base_url}{endpoint}"
+        self._last_rejected = False
         
-        for attempt in range(config.MAX_RETRY_ATTEMPTS if retry else 1):
-            try:
-                if method == "POST":
-                    response = requests.post(
-                        url,
-                        json=data,
-                        headers=self._get_headers(),
-                        timeout=config.REQUEST_TIMEOUT_SECONDS
-                    )
-                elif method == "GET":
-                    response = requests.get(
-                        url,
-                        headers=self._get_headers(),
-                        timeout=config.REQUEST_TIMEOUT_SECONDS
-                    )
-                else:
-                    raise ValueError(f"Unsupported method: {method}")
-                
-                response.raise_for_status()
-                self._is_online = True
-                self._retry_count = 0
-                
-                return response.json() if response.text else {}
-                
-            except requests.exceptions.ConnectionError as e:
-                logger.warning(f"Connection error (attempt {attempt + 1}): {e}")
-                self._is_online = False
-                self._retry_count += 1
-                
-            except requests.exceptions.Timeout as e:
-                logger.warning(f"Request timeout (attempt {attempt + 1}): {e}")
-                
-            except requests.exceptions.HTTPError as e:
-                logger.error(f"HTTP error: {e}")
-                if response.status_code >= 500:
-                    # Server error, retry
-                    pass
-                else:
-                    # Client error, don't retry
-                    return None
+        try:
+            if method == "POST":
+                body, headers = self._encode_body(data, content_type)
+                self._bytes_sent += len(body)
+                response = self._http.post(
+                    url,
+                    data=body,
+                    headers=headers,
+                    timeout=config.REQUEST_TIMEOUT_SECONDS
+                )
+            elif method == "GET":
+                response = self._http.get(
+                    url,
+                    timeout=config.REQUEST_TIMEOUT_SECONDS
+                )
+            else:
+                raise ValueError(f"Unsupported method: {method}")
             
-            except Exception as e:
-                logger.error(f"Unexpected error: {e}")
+            response.raise_for_status()
+            self._is_online = True
             
-            if attempt < config.MAX_RETRY_ATTEMPTS - 1:
-                time.sleep(config.RETRY_DELAY_SECONDS)
+            return response.json() if response.text else {}
         
-        return None
-    
-    def start_session(self, session: SessionData) -> bool:
-        """
-        Notify backend that a new sleep session has started.
-        """
-        self._current_session_id = session.session_id
+        except requests.exceptions.ConnectionError as e:
+            logger.warning(f"Connection error: {e}")
+            self._is_online = False
         
-        payload = {
-            "session_id": session.session_id,
-            "user_id": session.user_id,
-            "start_ts": session.start_ts,
-            "baseline_distance": session.baseline_distance
-        }
+        except requests.exceptions.Timeout as e:
+            logger.warning(f"Request timeout: {e}")
         
-        result = self._make_request("POST", "/api/rpi/sessions/start", payload)
+        except requests.exceptions.HTTPError as e:
+            logger.error(f"HTTP error: {e}")
+            if response.status_code < 500:
+                # Client error, don't retry
+                self._last_rejected = True
         
-        if result is not None:
-            logger.info(f"Session start reported: {session.session_id}")
-            return True
-        else:
-            logger.warning("Failed to report session start, will retry on next window batch")
-            return False
-    
-    def end_session(self, session: SessionData, end_ts: float) -> bool:
-        """
-        Notify backend that the sleep session has ended.
-        """
-        # First, flush any remaining windows
-        self.flush_windows()
+        except Exception as e:
+            logger.error(f"Unexpected error: {e}")
         
-        payload = {
-            "session_id": session.session_id,
-            "end_ts": end_ts
-        }
-        
-        result = self._make_request("POST", "/api/rpi/sessions/end", payload)
+        return None
+    
+    def _ws_request(self, frame) -> Optional[dict]:
+        """One request/reply over the WebSocket; None if it failed."""
+        try:
+            reply = self._ws.request(frame)
+        except WebSocketUnavailable as e:
+            logger.warning(f"{e}; switching to HTTP")
+            self._ws.close()
+            self._ws = None
+            return None
+        except Exception as e:
+            logger.warning(f"WebSocket error: {e}")
+            self._is_online = False
+            return None
         
-        if result is not None:
-            logger.info(f"Session end reported: {session.session_id}")
-            self._current_session_id = None
-            return True
-        else:
-            logger.warning("Failed to report session end")
-            return False
+        self._bytes_sent += len(frame)
+        self._is_online = True
+        return reply
     
-    def add_window(self, window: SleepWindow):
+    def _send_ws(self, kind: str, items: List[OutboxItem]) -> Optional[dict]:
         """
-        Add a window to the buffer. Automatically flushes when batch is full.
+        Deliver items over the WebSocket channel, with the same contract
+        as _make_request. The server's cumulative ack for the last item's
+        seq confirms the whole run.
         """
-        with self._buffer_lock:
-            self._window_buffer.append(window)
-            
-            if len(self._window_buffer) >= config.WINDOW_BATCH_SIZE:
-                self._flush_windows_internal()
-    
-    def flush_windows(self):
-        """Force flush all buffered windows."""
-        with self._buffer_lock:
-            self._flush_windows_internal()
-    
-    def _flush_windows_internal(self):
-        """Internal flush without lock (must hold lock when calling)."""
-        if not self._window_buffer:
-            return
-        
-        # Prepare batch payload
-        windows_data = []
-        for window in self._window_buffer:
-            windows_data.append({
-                "session_id": window.session_id,
-                "ts_start": window.ts_start,
-                "ts_end": window.ts_end,
-                "avg_distance": window.avg_distance,
-                "movement_energy": window.movement_energy,
-                "active_ratio": window.active_ratio,
-                "state": window.state,
-                "sample_count": window.sample_count
-            })
-        
-        payload = {"windows": windows_data}
-        
-        result = self._make_request("POST", "/api/rpi/sessions/windows", payload)
-        
-        if result is not None:
-            logger.info(f"Flushed {len(windows_data)} windows to backend")
-            self._window_buffer.clear()
+        self._last_rejected = False
+        seq = items[-1][0]
+        if kind == KIND_WINDOW:
+            frame = window_frame(seq, wire.encode_windows([p for _, _, p in items]))
         else:
-            logger.warning(f"Failed to flush windows, keeping {len(windows_data)} in buffer")
+            frame = json.dumps({"type": kind, "seq": seq, **items[0][2]}, separators=(",", ":"))
+        
+        reply = self._ws_request(frame)
+        if reply is None:
+            return None
+        if reply.get("type") != "ack" or reply.get("seq", -1) < seq:
+            logger.error(f"Unexpected WebSocket reply, reconnecting: {reply}")
+            self._ws.close()
+            return None
+        if reply.get("rejected"):
+            logger.error(f"Backend rejected {kind}: {reply.get('error')}")
+            self._last_rejected = True
+            return None
+        return reply
     
-    def send_heartbeat(self) -> bool:
-        """
-        Send heartbeat to backend. Called periodically.
-        """
+    def _send_heartbeat_if_due(self) -> bool:
+        """Send heartbeat to backend every HEARTBEAT_INTERVAL_SECONDS."""
         now = time.time()
         if now - self._last_heartbeat < config.HEARTBEAT_INTERVAL_SECONDS:
             return True
+        # Failed heartbeats are not retried until the next interval
+        self._last_heartbeat = now
         
         payload = {
             "user_id": self.user_id,
+            "device_id": config.DEVICE_ID,
             "session_id": self._current_session_id,
             "timestamp": now,
             "is_online": self._is_online,
-            "buffer_size": len(self._window_buffer)
+            "buffer_size": len(self._outbox)
         }
         
-        result = self._make_request("POST", "/api/rpi/heartbeat", payload, retry=False)
-        
-        if result is not None:
-            self._last_heartbeat = now
-            return True
-        
-        return False
+        if self._ws is not None:
+            frame = json.dumps({"type": "heartbeat", **payload}, separators=(",", ":"))
+            return self._ws_request(frame) is not None
+        return self._make_request("POST", "/api/rpi/heartbeat", payload) is not None
+    
+    # ============= Status =============
     
     @property
     def is_online(self) -> bool:
@@ -233,7 +437,26 @@ class BackendClient:
     
     @property
     def buffer_size(self) -> int:
-        return len(self._window_buffer)
+        return len(self._outbox)
+    
+    @property
+    def queue_depth(self) -> int:
+        """Items handed off by the sampling loop but not yet persisted."""
+        return self._queue.qsize()
+    
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue_depth,
+            "peak_queue_depth": self._peak_queue_depth,
+            "outbox_pending": len(self._outbox),
+            "outbox_dropped_windows": self._outbox.dropped_windows,
+            "consecutive_failures": self._retry_count,
+            "bytes_sent": self._bytes_sent,
+            "wire_format": "packed" if self._packed_windows else "json",
+            "transport": "websocket" if self._ws is not None else "http",
+            "ws_connects": self._ws.connects if self._ws is not None else 0,
+            "is_online": self._is_online
+        }
 
 
 # Singleton instance
@@ -2,6 +2,7 @@
 Configuration for RPi Sleep Tracker Client
 """
 import os
+import socket
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -41,13 +42,28 @@ MOVING_THRESHOLD = 0.25     # 5-25% = moving, >= 25% = awake-ish
 BACKEND_URL = os.getenv("BACKEND_URL", "http://thinkpad.local:8000")
 DEVICE_TOKEN = os.getenv("DEVICE_TOKEN", "")  # Device auth token
 USER_ID = int(os.getenv("USER_ID", "1"))
+DEVICE_ID = os.getenv("DEVICE_ID", socket.gethostname())  # Shown in the backend fleet status
 
 # ============= Network Configuration =============
 WINDOW_BATCH_SIZE = 10  # Send N windows at once
 HEARTBEAT_INTERVAL_SECONDS = 300  # 5 minutes
 REQUEST_TIMEOUT_SECONDS = 10
-MAX_RETRY_ATTEMPTS = 3
-RETRY_DELAY_SECONDS = 5
+GZIP_UPLOADS = os.getenv("GZIP_UPLOADS", "1") == "1"  # Backend must be recent enough to accept it
+GZIP_MIN_BYTES = 1024  # Smaller bodies are sent uncompressed
+# "packed" sends window batches in the compact binary format (see wire.py),
+# falling back to JSON if the backend does not support it
+WIRE_FORMAT = os.getenv("WIRE_FORMAT", "packed")
+# "websocket" keeps one persistent connection for all uploads (needs the
+# websocket-client package), falling back to HTTP if unavailable
+TRANSPORT = os.getenv("TRANSPORT", "websocket")
+# Failed uploads are retried with exponential backoff plus jitter
+RETRY_BASE_DELAY_SECONDS = 2
+RETRY_MAX_DELAY_SECONDS = 300
+STATS_LOG_INTERVAL_SECONDS = 300  # Sampling jitter / upload queue stats
 
 # ============= Offline Buffer =============
-MAX_BUFFERED_WINDOWS = 1000  # Store up to this many windows if offline
+# Pending uploads are kept in a local SQLite outbox and survive restarts
+OUTBOX_PATH = os.getenv("OUTBOX_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "outbox.db"))
+MAX_BUFFERED_WINDOWS = int(os.getenv("MAX_BUFFERED_WINDOWS", "50000"))  # ~3 days of 5s windows, a few MB
+OUTBOX_SYNC_INTERVAL_SECONDS = 30  # Max data lost to a power cut
+DRAIN_BATCH_SIZE = 500  # Windows per request when catching up after an outage
@@ -13,6 +13,7 @@ import signal
 import sys
 import os
 import subprocess
+from collections import deque
 from datetime import datetime
 
 import config
@@ -44,6 +45,35 @@ def signal_handler(signum, frame):
     running = False
 
 
+class SamplingStats:
+    """
+    How far actual sample intervals deviate from SAMPLE_INTERVAL, over
+    the most recent samples.
+    """
+    
+    def __init__(self, size: int = 3000):
+        self._jitter = deque(maxlen=size)
+        self.samples = 0
+        self.max_jitter = 0.0
+    
+    def record(self, interval: float):
+        jitter = abs(interval - config.SAMPLE_INTERVAL)
+        self._jitter.append(jitter)
+        self.samples += 1
+        self.max_jitter = max(self.max_jitter, jitter)
+    
+    def summary(self) -> dict:
+        if not self._jitter:
+            return {"samples": 0}
+        ordered = sorted(self._jitter)
+        return {
+            "samples": self.samples,
+            "jitter_mean_ms": round(sum(ordered) / len(ordered) * 1000, 2),
+            "jitter_p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 2),
+            "jitter_max_ms": round(self.max_jitter * 1000, 2)
+        }
+
+
 def main():
     global running
     
@@ -82,6 +112,11 @@ def main():
     last_sample_time = time.time()
     last_state = SessionState.IDLE
     session_reported = False
+    sampling_stats = SamplingStats()
+    last_stats_log = time.time()
+    
+    # Uploads happen on the client's sender thread, never in this loop
+    api_client.start()
     
     logger.info("Starting main loop... Press Ctrl+C to stop.")
     
@@ -95,6 +130,7 @@ def main():
                 time.sleep(config.SAMPLE_INTERVAL - elapsed)
                 continue
             
+            sampling_stats.record(elapsed)
             last_sample_time = now
             
             # Process sensor sample
@@ -135,8 +171,10 @@ def main():
                 state_machine.reset()
                 session_reported = False
             
-            # Periodic heartbeat
-            api_client.send_heartbeat()
+            # Periodic sampling / upload stats
+            if now - last_stats_log >= config.STATS_LOG_INTERVAL_SECONDS:
+                logger.info(f"Stats: sampling={sampling_stats.summary()}, uploads={api_client.stats()}")
+                last_stats_log = now
             
             # Periodic status (every 60 seconds in IDLE, every 5 min otherwise)
             if current_state == SessionState.IDLE:
@@ -167,8 +205,8 @@ def main():
             logger.info("Ending active session due to shutdown...")
             api_client.end_session(session, time.time())
     
-    # Flush remaining data
-    api_client.flush_windows()
+    # Final delivery attempt; anything undelivered stays in the outbox
+    api_client.stop()
     
     logger.info("Goodbye!")
 
@@ -0,0 +1,163 @@
+"""
+Durable Outbox for Backend Uploads
+
+Pending windows and session start/end events are appended to a local
+SQLite database (WAL mode) and only deleted once the backend has
+accepted them, so a backend outage, power cut or reboot loses nothing.
+Whatever is left over is replayed on the next start.
+
+- Order: items are delivered strictly in append order, so a session's
+  start always reaches the backend before its windows and its end.
+- Batching: consecutive windows are sent together, up to a batch size.
+- Bounded: at most MAX_BUFFERED_WINDOWS windows are kept; beyond that
+  the oldest windows are dropped. Session events are never dropped.
+- Batched fsync: with synchronous=NORMAL commits only append to the WAL;
+  it is fsynced when checkpointed, at most every
+  OUTBOX_SYNC_INTERVAL_SECONDS, bounding what a power cut can lose.
+"""
+import json
+import logging
+import os
+import sqlite3
+import time
+from threading import Lock
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger("outbox")
+
+KIND_WINDOW = "window"
+KIND_SESSION_START = "session_start"
+KIND_SESSION_END = "session_end"
+
+# (seq, kind, payload)
+OutboxItem = Tuple[int, str, dict]
+
+
+class Outbox:
+    """Append-only, crash-safe queue of pending uploads."""
+    
+    def __init__(self, path: str, max_windows: int, sync_interval: float):
+        self.path = path
+        self.max_windows = max_windows
+        self.sync_interval = sync_interval
+        self.dropped_windows = 0
+        
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        
+        self._lock = Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " kind TEXT NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " created_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_outbox_kind_seq ON outbox (kind, seq)")
+        
+        self._window_count = self._count(KIND_WINDOW)
+        self._event_count = self._count() - self._window_count
+        self._last_sync = time.monotonic()
+        
+        if self._window_count or self._event_count:
+            logger.info(
+                f"Replaying outbox: {self._window_count} windows, "
+                f"{self._event_count} session events pending"
+            )
+    
+    def _count(self, kind: Optional[str] = None) -> int:
+        if kind is None:
+            return self._conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+        return self._conn.execute("SELECT COUNT(*) FROM outbox WHERE kind = ?", (kind,)).fetchone()[0]
+    
+    def _append(self, kind: str, payload: dict):
+        self._conn.execute(
+            "INSERT INTO outbox (kind, payload, created_at) VALUES (?, ?, ?)",
+            (kind, json.dumps(payload), time.time())
+        )
+    
+    def _maybe_sync(self, force: bool = False):
+        """Checkpoint the WAL into the database, fsyncing both."""
+        now = time.monotonic()
+        if force or now - self._last_sync >= self.sync_interval:
+            self._conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+            self._last_sync = now
+    
+    def append_window(self, payload: dict):
+        with self._lock:
+            self._append(KIND_WINDOW, payload)
+            self._window_count += 1
+            
+            overflow = self._window_count - self.max_windows
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM outbox WHERE seq IN ("
+                    " SELECT seq FROM outbox WHERE kind = ? ORDER BY seq LIMIT ?)",
+                    (KIND_WINDOW, overflow)
+                )
+                self._window_count -= overflow
+                self.dropped_windows += overflow
+                logger.warning(f"Outbox full, dropped {overflow} oldest windows")
+            
+            self._maybe_sync()
+    
+    def append_event(self, kind: str, payload: dict):
+        """Session start/end: rare and important, so synced immediately."""
+        with self._lock:
+            self._append(kind, payload)
+            self._event_count += 1
+            self._maybe_sync(force=True)
+    
+    def peek(self, max_windows: int) -> List[OutboxItem]:
+        """
+        The next item(s) to deliver: either a single session event, or a
+        run of up to max_windows consecutive windows.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, kind, payload FROM outbox ORDER BY seq LIMIT ?",
+                (max_windows,)
+            ).fetchall()
+        
+        items = []
+        for seq, kind, payload in rows:
+            if kind != KIND_WINDOW:
+                if not items:
+                    items.append((seq, kind, json.loads(payload)))
+                break
+            items.append((seq, kind, json.loads(payload)))
+        return items
+    
+    def ack(self, items: List[OutboxItem]):
+        """Remove delivered (or permanently rejected) items."""
+        if not items:
+            return
+        window_seqs = [(seq,) for seq, kind, _ in items if kind == KIND_WINDOW]
+        event_seqs = [(seq,) for seq, kind, _ in items if kind != KIND_WINDOW]
+        
+        with self._lock:
+            # rowcount rather than len(): windows may have been trimmed meanwhile
+            with self._conn:
+                self._conn.execute("BEGIN")
+                self._window_count -= self._conn.executemany(
+                    "DELETE FROM outbox WHERE seq = ?", window_seqs
+                ).rowcount
+                self._event_count -= self._conn.executemany(
+                    "DELETE FROM outbox WHERE seq = ?", event_seqs
+                ).rowcount
+            self._maybe_sync()
+    
+    @property
+    def window_count(self) -> int:
+        return self._window_count
+    
+    def __len__(self) -> int:
+        return self._window_count + self._event_count
+    
+    def close(self):
+        with self._lock:
+            self._maybe_sync(force=True)
+            self._conn.close()
@@ -0,0 +1,146 @@
+"""
+Packed Columnar Window Format
+
+Compact binary alternative to the JSON body of
+POST /api/rpi/sessions/windows, sent as `Content-Type: application/x-sleep-windows`.
+
+JSON repeats every key name and the 36-character session UUID in each
+window, and each window is then validated as its own Pydantic object.
+The packed format carries each session UUID once and the window fields
+as parallel little-endian arrays, which decode with one struct call per
+column straight into insert rows.
+
+Layout (all integers unsigned, little-endian):
+
+    header   magic "SWPK" | u8 version | u16 group count
+    group    u8 uuid length | uuid (utf-8) | u32 window count n
+             u8 state count | per state: u8 length | name (utf-8)
+             f64[n] ts_start | f64[n] ts_end | f64[n] avg_distance
+             f64[n] movement_energy | f64[n] active_ratio
+             u8[n] state (index into the group's state names)
+             u32[n] sample_count
+
+Floats stay float64, so packed and JSON uploads store identical values.
+Keep in sync with backend/app/wire.py.
+"""
+import struct
+from typing import Dict, List, Sequence, Tuple
+
+CONTENT_TYPE = "application/x-sleep-windows"
+
+MAGIC = b"SWPK"
+VERSION = 1
+
+FLOAT_COLUMNS = ("ts_start", "ts_end", "avg_distance", "movement_energy", "active_ratio")
+
+_HEADER = struct.Struct("<4sBH")
+_U8 = struct.Struct("<B")
+_U32 = struct.Struct("<I")
+
+# (session UUID, insert rows without session_id)
+WindowGroup = Tuple[str, List[dict]]
+
+
+class WireFormatError(ValueError):
+    """Malformed packed window batch."""
+
+
+def _pack_str(value: str) -> bytes:
+    raw = value.encode("utf-8")
+    if len(raw) > 255:
+        raise ValueError(f"String too long for packed format: {value[:40]}...")
+    return _U8.pack(len(raw)) + raw
+
+
+def encode_windows(windows: Sequence[dict]) -> bytes:
+    """Pack window dicts (RpiWindowData fields) into one binary batch."""
+    groups: Dict[str, List[dict]] = {}
+    for w in windows:
+        groups.setdefault(w["session_id"], []).append(w)
+    
+    parts = [_HEADER.pack(MAGIC, VERSION, len(groups))]
+    for session_id, group in groups.items():
+        n = len(group)
+        states = list(dict.fromkeys(w["state"] for w in group))
+        state_codes = {s: i for i, s in enumerate(states)}
+        
+        parts.append(_pack_str(session_id))
+        parts.append(_U32.pack(n))
+        parts.append(_U8.pack(len(states)))
+        parts.extend(_pack_str(s) for s in states)
+        for column in FLOAT_COLUMNS:
+            parts.append(struct.pack(f"<{n}d", *(w[column] for w in group)))
+        parts.append(bytes(state_codes[w["state"]] for w in group))
+        parts.append(struct.pack(f"<{n}I", *(w["sample_count"] for w in group)))
+    
+    return b"".join(parts)
+
+
+class _Reader:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.offset = 0
+    
+    def unpack(self, fmt) -> tuple:
+        if isinstance(fmt, str):
+            fmt = struct.Struct(fmt)
+        try:
+            values = fmt.unpack_from(self.data, self.offset)
+        except struct.error as e:
+            raise WireFormatError(f"Truncated batch at byte {self.offset}") from e
+        self.offset += fmt.size
+        return values
+    
+    def string(self) -> str:
+        (length,) = self.unpack(_U8)
+        raw = self.data[self.offset:self.offset + length]
+        if len(raw) != length:
+            raise WireFormatError(f"Truncated batch at byte {self.offset}")
+        self.offset += length
+        try:
+            return raw.decode("utf-8")
+        except UnicodeDecodeError as e:
+            raise WireFormatError("Invalid UTF-8 string") from e
+
+
+def decode_windows(data: bytes) -> List[WindowGroup]:
+    """Unpack a binary batch into per-session insert rows."""
+    reader = _Reader(data)
+    magic, version, group_count = reader.unpack(_HEADER)
+    if magic != MAGIC:
+        raise WireFormatError("Not a packed window batch")
+    if version != VERSION:
+        raise WireFormatError(f"Unsupported packed format version {version}")
+    
+    groups = []
+    for _ in range(group_count):
+        session_id = reader.string()
+        (n,) = reader.unpack(_U32)
+        (state_count,) = reader.unpack(_U8)
+        states = [reader.string() for _ in range(state_count)]
+        
+        columns = {column: reader.unpack(f"<{n}d") for column in FLOAT_COLUMNS}
+        codes = reader.unpack(f"<{n}B")
+        if codes and max(codes) >= state_count:
+            raise WireFormatError(f"State index out of range in session {session_id}")
+        sample_counts = reader.unpack(f"<{n}I")
+        
+        rows = [
+            {
+                "ts_start": ts_start,
+                "ts_end": ts_end,
+                "avg_distance": avg_distance,
+                "movement_energy": movement_energy,
+                "active_ratio": active_ratio,
+                "state": states[code],
+                "sample_count": sample_count
+            }
+            for ts_start, ts_end, avg_distance, movement_energy, active_ratio, code, sample_count in zip(
+                *(columns[c] for c in FLOAT_COLUMNS), codes, sample_counts
+            )
+        ]
+        groups.append((session_id, rows))
+    
+    if reader.offset != len(data):
+        raise WireFormatError(f"{len(data) - reader.offset} trailing bytes after batch")
+    return groups
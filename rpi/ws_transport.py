@@ -0,0 +1,119 @@
+"""
+WebSocket Transport for Backend Uploads
+
+Keeps one persistent connection to the backend's /api/rpi/ws channel and
+sends outbox items over it as framed messages, instead of paying for a
+full HTTP request each time.
+
+- Request/reply: each frame is answered by the server before the next
+  is sent (an ack for session events and window batches, an echo for
+  heartbeats). Acks are cumulative, so an ack for seq n confirms every
+  outbox item up to n.
+- Reconnect: the connection is (re)opened lazily. A send on a
+  connection the network silently dropped is retried once on a fresh
+  connection; after that the caller's backoff takes over.
+- Resume: nothing acked is ever resent, and everything unacked is still
+  in the outbox, so after a reconnect the sender simply continues from
+  the oldest outbox item. Server handlers are idempotent.
+- Keepalive: the server pings idle connections; poll() answers those
+  pings between sends so quiet nights do not drop the connection.
+
+Requires the websocket-client package; without it (or against a backend
+without the channel) the client stays on plain HTTP.
+"""
+import json
+import logging
+import select
+import struct
+from typing import Union
+
+logger = logging.getLogger("ws_transport")
+
+# Binary frames: u64 seq, then a packed window batch (see wire.py)
+WS_SEQ = struct.Struct("<Q")
+
+
+class WebSocketUnavailable(Exception):
+    """The backend (or this install) does not support the WebSocket channel."""
+
+
+class WebSocketTransport:
+    """One persistent connection, used only by the sender thread."""
+    
+    def __init__(self, url: str, headers: dict, timeout: float):
+        try:
+            import websocket
+        except ImportError as e:
+            raise WebSocketUnavailable("websocket-client is not installed") from e
+        
+        self._websocket = websocket
+        self.url = url
+        self.headers = [f"{k}: {v}" for k, v in headers.items() if k == "Authorization"]
+        self.timeout = timeout
+        self._conn = None
+        self.connects = 0
+    
+    @property
+    def connected(self) -> bool:
+        return self._conn is not None and self._conn.connected
+    
+    def _connect(self):
+        try:
+            self._conn = self._websocket.create_connection(
+                self.url, timeout=self.timeout, header=self.headers
+            )
+        except self._websocket.WebSocketBadStatusException as e:
+            # The server answered the upgrade with a plain HTTP status:
+            # an older backend without the channel
+            raise WebSocketUnavailable(f"Backend refused WebSocket upgrade (HTTP {e.status_code})") from e
+        self.connects += 1
+        logger.info(f"Connected to {self.url}")
+    
+    def request(self, message: Union[str, bytes]) -> dict:
+        """
+        Send one frame (str as text, bytes as binary) and wait for the
+        JSON reply. Raises on network errors after one reconnect attempt.
+        """
+        for attempt in (1, 2):
+            fresh = not self.connected
+            if fresh:
+                self._connect()
+            try:
+                if isinstance(message, bytes):
+                    self._conn.send_binary(message)
+                else:
+                    self._conn.send(message)
+                return json.loads(self._conn.recv())
+            except (self._websocket.WebSocketException, OSError) as e:
+                self.close()
+                # Only a connection that went stale while idle gets a second try
+                if fresh or attempt == 2:
+                    raise
+                logger.info(f"WebSocket dropped ({e}), reconnecting")
+    
+    def poll(self):
+        """Answer pending server pings without blocking."""
+        if not self.connected:
+            return
+        try:
+            while select.select([self._conn.sock], [], [], 0)[0]:
+                # Answers pings; data frames are never sent unprompted,
+                # so anything other than a close is ignored
+                opcode, _ = self._conn.recv_data_frame(control_frame=True)
+                if opcode == self._websocket.ABNF.OPCODE_CLOSE:
+                    self.close()
+                    return
+        except (self._websocket.WebSocketException, OSError):
+            self.close()
+    
+    def close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close(timeout=1)
+            except Exception:
+                pass
+            self._conn = None
+
+
+def window_frame(seq: int, packed_batch: bytes) -> bytes:
+    return WS_SEQ.pack(seq) + packed_batch